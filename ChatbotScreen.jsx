@@ -15,6 +15,8 @@ export default function ChatbotScreen() {
     { sender: 'bot', text: "Welcome to AstroGo! 🌠 How can I assist you with your Kundali today?"},
   ]);
   const [inputText, setInputText] = useState('');
+  // The server keeps the conversation; later messages only send the session id
+  const [sessionId, setSessionId] = useState(null);
 
   const sendMessage = async () => {
     const userMessage = inputText.trim();
@@ -23,24 +25,65 @@ export default function ChatbotScreen() {
     setMessages([...messages, { sender: 'user', text: userMessage }]);
     setInputText('');
 
-    try {
-      const response = await fetch('http://192.168.210.8:5000/chatbot', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          message: userMessage,
-          kundaliData: parsedKundaliData,
-        }),
+    // Placeholder bot message that fills in as tokens arrive
+    setMessages((prevMessages) => [...prevMessages, { sender: 'bot', text: '' }]);
+    const updateBotMessage = (update) => {
+      setMessages((prevMessages) => {
+        const nextMessages = [...prevMessages];
+        const last = nextMessages[nextMessages.length - 1];
+        nextMessages[nextMessages.length - 1] = { ...last, text: update(last.text) };
+        return nextMessages;
       });
-      const data = await response.json();
-      const botMessage = data.response;
-      setMessages((prevMessages) => [
-        ...prevMessages,
-        { sender: 'bot', text: botMessage },
-      ]);
-    } catch (error) {
+    };
+
+    // fetch() in React Native does not expose the body as a stream, so read the
+    // Server-Sent Events from XMLHttpRequest progress events instead.
+    const xhr = new XMLHttpRequest();
+    let seen = 0;
+    let buffer = '';
+
+    const handleEvent = (rawEvent) => {
+      let eventName = 'message';
+      let data = '';
+      rawEvent.split('\n').forEach((line) => {
+        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      });
+      if (!data) return;
+      const payload = JSON.parse(data);
+      if (eventName === 'session') {
+        setSessionId(payload.session_id);
+      } else if (eventName === 'token') {
+        updateBotMessage((text) => text + payload.delta);
+      } else if (eventName === 'error') {
+        updateBotMessage((text) => text || 'Sorry, something went wrong. Please try again.');
+      }
+    };
+
+    const readEvents = () => {
+      buffer += xhr.responseText.slice(seen);
+      seen = xhr.responseText.length;
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        handleEvent(buffer.slice(0, boundary));
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+      }
+    };
+
+    xhr.onprogress = readEvents;
+    xhr.onload = readEvents;
+    xhr.onerror = (error) => {
       console.error('Error sending message:', error);
-    }
+      updateBotMessage((text) => text || 'Sorry, something went wrong. Please try again.');
+    };
+    xhr.open('POST', 'http://192.168.210.8:5000/chatbot/stream');
+    xhr.setRequestHeader('Content-Type', 'application/json');
+    xhr.send(JSON.stringify({
+      message: userMessage,
+      kundaliData: parsedKundaliData,
+      session_id: sessionId,
+    }));
   };
 
   const renderItem = ({ item }) => (
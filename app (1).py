@@ -1,74 +1,261 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-from kundali_calculations import calculate_kundali
-from kundali_presentation import (
-    display_ascendant_and_planetary_positions,
-    display_planets_in_houses,
-    display_current_dasha,
-    display_current_antardasha,
+from kundali_calculations import calculate_kundali, calculate_kundali_batch
+from gazetteer import get_gazetteer
+from interpretation_index import get_interpretation_index
+from transits import find_transits, MAX_EVENTS as MAX_TRANSIT_EVENTS
+from compatibility import match_batch
+from vargas import normalize_vargas
+from response_encoding import encode_response, kundali_etag, not_modified, parse_limit
+from calc_executor import get_calculation_executor, ExecutorBusyError, CalculationTimeoutError
+from kundali_presentation import build_kundali_response
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, TRACE_REQUEST_HEADER, TRACE_RESPONSE_HEADER,
+    begin_request, end_request, render_metrics, stage,
 )
-import openai
+from warmup import liveness, readiness, warm_up
+from llm_client import configure_api_key
 
-# Set the OpenAI API key
-openai.api_key = 'opeanai.api_key'
+# Set the OpenAI API key (from KUNDALI_LLM_API_KEY or OPENAI_API_KEY)
+configure_api_key()
 
 app = Flask(__name__)
 CORS(app)
 
-@app.route('/kundali', methods=['POST'])
+@app.before_request
+def start_request_metrics():
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    g.metrics = begin_request(route, request.headers.get(TRACE_REQUEST_HEADER))
+
+@app.after_request
+def finish_request_metrics(response):
+    timing = end_request(g.pop('metrics', None), response.status_code)
+    if timing:
+        response.headers[TRACE_RESPONSE_HEADER] = timing
+    return response
+
+@app.teardown_request
+def finish_failed_request_metrics(error):
+    # after_request is skipped when a view's exception propagates (as in debug mode),
+    # so those requests are recorded here as 500s
+    state = g.pop('metrics', None)
+    if state is not None:
+        end_request(state, 500)
+
+@app.route('/kundali', methods=['GET', 'POST'])
 def kundali():
-    data = request.json
+    # GET takes the same fields as query parameters, so clients can revalidate cached charts
+    data = request.args.to_dict() if request.method in ('GET', 'HEAD') else request.json
     date_of_birth = data['date_of_birth']
     time_of_birth = data['time_of_birth']
     place_of_birth = data['place_of_birth']
+    include_interpretations = str(data.get('include_interpretations', '')).lower() in ('1', 'true', 'yes')
+    try:
+        vargas = normalize_vargas(data['vargas']) if data.get('vargas') else None
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The ETag depends only on the input, so a revalidation skips the calculation
+    etag = kundali_etag(date_of_birth, time_of_birth, place_of_birth,
+                        {'vargas': vargas, 'interpretations': include_interpretations})
+    headers = not_modified(etag, request.headers.get('Accept'), request.headers.get('Accept-Encoding'),
+                           request.headers.get('If-None-Match'), request.method)
+    if headers:
+        return Response(status=304, headers=headers)
+
+    executor = get_calculation_executor()
+    if executor is not None:
+        report = executor.calculate_kundali(date_of_birth, time_of_birth, place_of_birth, vargas=vargas)
+    else:
+        report = calculate_kundali(date_of_birth, time_of_birth, place_of_birth, vargas=vargas)
+
+    # The report's views are derived lazily, so this is where summaries are formatted
+    with stage('report'):
+        response = build_kundali_response(report)
+    if include_interpretations:
+        # Offline interpretations matched from the compiled index, no LLM call needed
+        with stage('interpretations'):
+            response['interpretations'] = get_interpretation_index().match(report)
+
+    with stage('encode'):
+        body, headers = encode_response(response, request.headers.get('Accept'),
+                                        request.headers.get('Accept-Encoding'), etag)
+    return Response(body, headers=headers)
+
+@app.route('/kundali/batch', methods=['POST'])
+def kundali_batch():
+    data = request.json
+    records = data.get('records', [])
+    try:
+        vargas = normalize_vargas(data['vargas']) if data.get('vargas') else None
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    executor = get_calculation_executor()
+    if executor is not None:
+        reports = executor.calculate_kundali_batch(records, vargas=vargas)
+    else:
+        reports = calculate_kundali_batch(records, vargas=vargas)
+
+    results = []
+    for report in reports:
+        if 'error' in report:
+            results.append({'error': report['error']})
+        else:
+            results.append(build_kundali_response(report))
+
+    body, headers = encode_response({'results': results}, request.headers.get('Accept'),
+                                    request.headers.get('Accept-Encoding'))
+    return Response(body, headers=headers)
+
+@app.route('/transits', methods=['POST'])
+def transit_events():
+    data = request.json
+    try:
+        limit = parse_limit(data.get('limit'), MAX_TRANSIT_EVENTS, MAX_TRANSIT_EVENTS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Transits over natal positions need the birth chart
+    natal_positions = None
+    if data.get('date_of_birth'):
+        executor = get_calculation_executor()
+        if executor is not None:
+            report = executor.calculate_kundali(data['date_of_birth'], data['time_of_birth'], data['place_of_birth'])
+        else:
+            report = calculate_kundali(data['date_of_birth'], data['time_of_birth'], data['place_of_birth'])
+        natal_positions = report['planetary_positions']
+
+    try:
+        result = find_transits(data['start_date'], data['end_date'], data.get('planets'), data.get('types'),
+                               natal_positions, limit)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(result)
+
+@app.route('/match/batch', methods=['POST'])
+def match_candidates():
+    data = request.json
+
+    executor = get_calculation_executor()
+    calculate_batch = executor.calculate_kundali_batch if executor is not None else calculate_kundali_batch
+
+    try:
+        result = match_batch(data['chart'], data.get('candidates', []), data.get('k', 10), data.get('role', 'groom'),
+                             data.get('min_score', 0.0), calculate_batch)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    report = calculate_kundali(date_of_birth, time_of_birth, place_of_birth)
+    return jsonify(result)
 
-    ascendant_info = display_ascendant_and_planetary_positions(report)['ascendant_info']
-    planetary_info = display_ascendant_and_planetary_positions(report)['planetary_info']
-    planets_info = display_planets_in_houses(report)
-    current_dasha = display_current_dasha(report)
-    current_antardasha = display_current_antardasha(report)
+@app.errorhandler(ExecutorBusyError)
+def calculation_busy(error):
+    response = jsonify({'error': str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
 
-    response = {
-        'ascendant_info': ascendant_info,
-        'planetary_info': planetary_info,
-        'planets_info': planets_info,
-        'current_dasha': current_dasha,
-        'current_antardasha': current_antardasha,
-        'kundali_summary': report.get('kundali_summary', ''),
-    }
+@app.errorhandler(CalculationTimeoutError)
+def calculation_timeout(error):
+    response = jsonify({'error': str(error)})
+    response.status_code = 504
+    return response
 
-    return jsonify(response)
+@app.route('/places/autocomplete', methods=['GET'])
+def places_autocomplete():
+    query = request.args.get('q', '')
+    try:
+        limit = parse_limit(request.args.get('limit'), 10, 50)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    suggestions = get_gazetteer().autocomplete(query, limit=limit)
+
+    return jsonify({'suggestions': suggestions})
 
 @app.route('/chatbot', methods=['POST'])
 def chatbot():
     data = request.json
     message = data['message']
-    kundali_summary = data['kundaliData'].get('kundali_summary', '')
-
-    from kundali_chatbot import get_chatbot_response
-
-    conversation_history = [
-        {
-            "role": "system",
-            "content": (
-                "You are an astrological chatbot. Utilize the following Kundali report to provide accurate and personalized predictions based on the user's queries. "
-                "Provide detailed life predictions categorized into sections such as Personality, Career, Relationships, Health, and Spirituality. "
-                "Use bullet points for clarity and ensure each section is comprehensive, regardless of how the user phrases their question.\n\n"
-                f"{kundali_summary}"
-            )
-        },
-        {
-            "role": "user",
-            "content": message
-        }
-    ]
-
-    response_text = get_chatbot_response(conversation_history)
-
-    return jsonify({'response': response_text})
+    use_cache = data.get('use_cache', True)
+
+    from kundali_chatbot import get_chatbot_response, open_chat_session, start_session_turn, finish_session_turn
+
+    # The chart summary is held by the session; later turns only need the session id
+    try:
+        session = open_chat_session(data.get('session_id'), data.get('kundaliData'), data.get('summary_format'))
+    except KeyError as e:
+        return jsonify({'error': str(e)}), 404
+
+    conversation_history = start_session_turn(session, message, use_retrieval=data.get('use_retrieval', True))
+
+    response_text = get_chatbot_response(conversation_history, use_cache=use_cache)
+    finish_session_turn(session, response_text)
+
+    return jsonify({'response': response_text, 'session_id': session['session_id']})
+
+@app.route('/chatbot/stream', methods=['POST'])
+def chatbot_stream():
+    data = request.json
+    message = data['message']
+    use_cache = data.get('use_cache', True)
+
+    from kundali_chatbot import (
+        stream_chatbot_response, sse_event, open_chat_session, start_session_turn, finish_session_turn
+    )
+
+    try:
+        session = open_chat_session(data.get('session_id'), data.get('kundaliData'), data.get('summary_format'))
+    except KeyError as e:
+        return jsonify({'error': str(e)}), 404
+
+    conversation_history = start_session_turn(session, message, use_retrieval=data.get('use_retrieval', True))
+    route = request.url_rule.rule
+
+    def events():
+        yield sse_event('session', {'session_id': session['session_id']})
+        yield from stream_chatbot_response(
+            conversation_history, use_cache=use_cache, on_complete=lambda answer: finish_session_turn(session, answer),
+            route=route
+        )
+
+    # Tokens are forwarded as Server-Sent Events; if the client goes away the generator
+    # is closed, which closes the upstream request
+    return Response(
+        events(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+@app.route('/chatbot/stream/stats', methods=['GET'])
+def chatbot_stream_stats():
+    from kundali_chatbot import streaming_stats
+
+    return jsonify(streaming_stats.snapshot())
+
+@app.route('/chatbot/cache/stats', methods=['GET'])
+def chatbot_cache_stats():
+    from kundali_chatbot import response_cache_stats
+
+    return jsonify(response_cache_stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text format; under serve.py the counts cover every worker (see metrics.py)
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify(liveness())
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    ready, body = readiness()
+    return jsonify(body), 200 if ready else 503
 
 if __name__ == '__main__':
+    # Development server; in production use serve.py (pre-forked, warmed-up workers)
+    warm_up()
     app.run(debug=True, host='0.0.0.0')
 
@@ -0,0 +1,368 @@
+# asgi_app.py
+#
+# Async serving mode with the same routes and JSON contracts as app (1).py.
+# Run with:  uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+# or, pre-forked over warmed-up workers:  python serve.py --app asgi
+#
+# Outbound calls to the LLM and the geocoder use a pooled httpx.AsyncClient, so a slow
+# chat completion only holds a coroutine, not a worker. Chart math runs in the
+# calculation process pool (or a thread when KUNDALI_CALC_WORKERS=0), never on the
+# event loop. Each route has its own concurrency limit so that open chats cannot
+# starve /kundali.
+
+import asyncio
+import os
+
+import httpx
+from quart import Quart, Response, g, request, jsonify, make_response
+from quart_cors import cors
+
+from kundali_calculations import (
+    calculate_kundali_at,
+    calculate_kundali_batch,
+    get_coordinates_from_place_async,
+)
+from kundali_presentation import build_kundali_response
+from kundali_chatbot import (
+    get_chatbot_response_async,
+    stream_chatbot_response_async,
+    open_chat_session,
+    start_session_turn,
+    finish_session_turn,
+    sse_event,
+    streaming_stats,
+    response_cache_stats,
+)
+from gazetteer import get_gazetteer
+from interpretation_index import get_interpretation_index
+from transits import find_transits, MAX_EVENTS as MAX_TRANSIT_EVENTS
+from compatibility import match_batch
+from vargas import normalize_vargas
+from response_encoding import encode_response, kundali_etag, not_modified, parse_limit
+from calc_executor import get_calculation_executor, ExecutorBusyError, CalculationTimeoutError, CALC_TIMEOUT
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, TRACE_REQUEST_HEADER, TRACE_RESPONSE_HEADER,
+    begin_request, end_request, render_metrics, stage,
+)
+from warmup import liveness, mark_draining, readiness, warm_up
+from llm_client import configure_api_key
+
+# Per-route concurrency limits; with the process pool, the chart routes are also capped
+# at the executor's slots (see start_up), so admitted requests rarely wait for one
+KUNDALI_CONCURRENCY = int(os.environ.get('KUNDALI_ASYNC_KUNDALI_LIMIT', '64'))
+BATCH_CONCURRENCY = int(os.environ.get('KUNDALI_ASYNC_BATCH_LIMIT', '2'))
+CHATBOT_CONCURRENCY = int(os.environ.get('KUNDALI_ASYNC_CHATBOT_LIMIT', '4096'))
+
+# Outbound connection pool
+HTTP_MAX_CONNECTIONS = int(os.environ.get('KUNDALI_HTTP_MAX_CONNECTIONS', '512'))
+HTTP_MAX_KEEPALIVE = int(os.environ.get('KUNDALI_HTTP_MAX_KEEPALIVE', '128'))
+HTTP_TIMEOUT = float(os.environ.get('KUNDALI_HTTP_TIMEOUT', '120'))
+
+# Set the OpenAI API key (from KUNDALI_LLM_API_KEY or OPENAI_API_KEY), as app (1).py does
+configure_api_key()
+
+app = Quart(__name__)
+app = cors(app)
+
+limits = {}
+http_client = None
+
+
+@app.before_serving
+async def start_up():
+    global http_client
+    # Start the worker processes now rather than on the first request
+    executor = get_calculation_executor()
+    kundali_limit, batch_limit = KUNDALI_CONCURRENCY, BATCH_CONCURRENCY
+    if executor is not None:
+        kundali_limit = min(kundali_limit, executor.max_pending)
+        batch_limit = min(batch_limit, executor.max_batch_pending)
+    limits['kundali'] = asyncio.Semaphore(kundali_limit)
+    limits['batch'] = asyncio.Semaphore(batch_limit)
+    limits['chatbot'] = asyncio.Semaphore(CHATBOT_CONCURRENCY)
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+        timeout=HTTP_TIMEOUT,
+    )
+    # Already done when serve.py forked this worker from a warmed-up master
+    await asyncio.to_thread(warm_up)
+
+
+@app.after_serving
+async def shut_down():
+    mark_draining()
+    await http_client.aclose()
+    executor = get_calculation_executor()
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+
+@app.before_request
+async def start_request_metrics():
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    g.metrics = begin_request(route, request.headers.get(TRACE_REQUEST_HEADER))
+
+
+@app.after_request
+async def finish_request_metrics(response):
+    timing = end_request(g.pop('metrics', None), response.status_code)
+    if timing:
+        response.headers[TRACE_RESPONSE_HEADER] = timing
+    return response
+
+
+async def run_calculation(date_of_birth, time_of_birth, latitude, longitude, vargas=None):
+    """
+    Computes a report off the event loop, in the process pool when it is enabled.
+    """
+    executor = get_calculation_executor()
+    if executor is None:
+        return await asyncio.to_thread(calculate_kundali_at, date_of_birth, time_of_birth, latitude, longitude,
+                                       vargas=vargas)
+
+    # Take a free slot without leaving the loop; otherwise wait for one (up to the
+    # executor's queue_timeout) in a thread, so the loop is never blocked
+    try:
+        future = executor.submit_kundali_at(date_of_birth, time_of_birth, latitude, longitude, queue_timeout=0,
+                                            vargas=vargas)
+    except ExecutorBusyError:
+        future = await asyncio.to_thread(executor.submit_kundali_at, date_of_birth, time_of_birth, latitude,
+                                         longitude, vargas=vargas)
+    try:
+        return executor.unwrap(await asyncio.wait_for(asyncio.wrap_future(future), timeout=CALC_TIMEOUT))
+    except asyncio.TimeoutError:
+        future.cancel()
+        raise CalculationTimeoutError("Kundali calculation timed out.")
+
+
+@app.errorhandler(ExecutorBusyError)
+async def calculation_busy(error):
+    response = jsonify({'error': str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+
+@app.errorhandler(CalculationTimeoutError)
+async def calculation_timeout(error):
+    response = jsonify({'error': str(error)})
+    response.status_code = 504
+    return response
+
+
+@app.route('/kundali', methods=['GET', 'POST'])
+async def kundali():
+    # GET takes the same fields as query parameters, so clients can revalidate cached charts
+    data = request.args.to_dict() if request.method in ('GET', 'HEAD') else await request.get_json()
+    date_of_birth = data['date_of_birth']
+    time_of_birth = data['time_of_birth']
+    place_of_birth = data['place_of_birth']
+    include_interpretations = str(data.get('include_interpretations', '')).lower() in ('1', 'true', 'yes')
+    try:
+        vargas = normalize_vargas(data['vargas']) if data.get('vargas') else None
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    # The ETag depends only on the input, so a revalidation skips the calculation
+    etag = kundali_etag(date_of_birth, time_of_birth, place_of_birth,
+                        {'vargas': vargas, 'interpretations': include_interpretations})
+    headers = not_modified(etag, request.headers.get('Accept'), request.headers.get('Accept-Encoding'),
+                           request.headers.get('If-None-Match'), request.method)
+    if headers:
+        return Response('', status=304, headers=headers)
+
+    async with limits['kundali']:
+        with stage('geocode'):
+            latitude, longitude = await get_coordinates_from_place_async(place_of_birth, http_client)
+        report = await run_calculation(date_of_birth, time_of_birth, latitude, longitude, vargas)
+
+    # The report's views are derived lazily, so this is where summaries are formatted
+    with stage('report'):
+        response = build_kundali_response(report)
+    if include_interpretations:
+        # Offline interpretations matched from the compiled index, no LLM call needed
+        with stage('interpretations'):
+            response['interpretations'] = get_interpretation_index().match(report)
+
+    with stage('encode'):
+        body, headers = encode_response(response, request.headers.get('Accept'),
+                                        request.headers.get('Accept-Encoding'), etag)
+    return Response(body, headers=headers)
+
+
+@app.route('/kundali/batch', methods=['POST'])
+async def kundali_batch():
+    data = await request.get_json()
+    records = data.get('records', [])
+    try:
+        vargas = normalize_vargas(data['vargas']) if data.get('vargas') else None
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    async with limits['batch']:
+        executor = get_calculation_executor()
+        if executor is not None:
+            reports = await asyncio.to_thread(executor.calculate_kundali_batch, records, vargas=vargas)
+        else:
+            reports = await asyncio.to_thread(calculate_kundali_batch, records, vargas=vargas)
+
+    results = []
+    for report in reports:
+        if 'error' in report:
+            results.append({'error': report['error']})
+        else:
+            results.append(build_kundali_response(report))
+
+    body, headers = encode_response({'results': results}, request.headers.get('Accept'),
+                                    request.headers.get('Accept-Encoding'))
+    return Response(body, headers=headers)
+
+
+@app.route('/transits', methods=['POST'])
+async def transit_events():
+    data = await request.get_json()
+    try:
+        limit = parse_limit(data.get('limit'), MAX_TRANSIT_EVENTS, MAX_TRANSIT_EVENTS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    async with limits['kundali']:
+        # Transits over natal positions need the birth chart
+        natal_positions = None
+        if data.get('date_of_birth'):
+            latitude, longitude = await get_coordinates_from_place_async(data['place_of_birth'], http_client)
+            report = await run_calculation(data['date_of_birth'], data['time_of_birth'], latitude, longitude)
+            natal_positions = report['planetary_positions']
+
+        try:
+            result = await asyncio.to_thread(
+                find_transits, data['start_date'], data['end_date'], data.get('planets'), data.get('types'),
+                natal_positions, limit
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    return jsonify(result)
+
+
+@app.route('/match/batch', methods=['POST'])
+async def match_candidates():
+    data = await request.get_json()
+
+    async with limits['batch']:
+        executor = get_calculation_executor()
+        calculate_batch = executor.calculate_kundali_batch if executor is not None else calculate_kundali_batch
+        try:
+            result = await asyncio.to_thread(
+                match_batch, data['chart'], data.get('candidates', []), data.get('k', 10), data.get('role', 'groom'),
+                data.get('min_score', 0.0), calculate_batch
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    return jsonify(result)
+
+
+@app.route('/places/autocomplete', methods=['GET'])
+async def places_autocomplete():
+    query = request.args.get('q', '')
+    try:
+        limit = parse_limit(request.args.get('limit'), 10, 50)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    suggestions = get_gazetteer().autocomplete(query, limit=limit)
+
+    return jsonify({'suggestions': suggestions})
+
+
+@app.route('/chatbot', methods=['POST'])
+async def chatbot():
+    data = await request.get_json()
+    message = data['message']
+    use_cache = data.get('use_cache', True)
+
+    try:
+        session = await asyncio.to_thread(
+            open_chat_session, data.get('session_id'), data.get('kundaliData'), data.get('summary_format')
+        )
+    except KeyError as e:
+        return jsonify({'error': str(e)}), 404
+
+    # Session storage, retrieval and token counting block, so they run in a thread
+    conversation_history = await asyncio.to_thread(
+        start_session_turn, session, message, use_retrieval=data.get('use_retrieval', True)
+    )
+
+    async with limits['chatbot']:
+        response_text = await get_chatbot_response_async(conversation_history, http_client, use_cache=use_cache)
+    await asyncio.to_thread(finish_session_turn, session, response_text)
+
+    return jsonify({'response': response_text, 'session_id': session['session_id']})
+
+
+@app.route('/chatbot/stream', methods=['POST'])
+async def chatbot_stream():
+    data = await request.get_json()
+    message = data['message']
+    use_cache = data.get('use_cache', True)
+
+    try:
+        session = await asyncio.to_thread(
+            open_chat_session, data.get('session_id'), data.get('kundaliData'), data.get('summary_format')
+        )
+    except KeyError as e:
+        return jsonify({'error': str(e)}), 404
+
+    conversation_history = await asyncio.to_thread(
+        start_session_turn, session, message, use_retrieval=data.get('use_retrieval', True)
+    )
+    route = request.url_rule.rule
+
+    async def events():
+        yield sse_event('session', {'session_id': session['session_id']})
+        # Quart cancels this generator when the client disconnects, which closes the upstream stream
+        async with limits['chatbot']:
+            async for event in stream_chatbot_response_async(
+                conversation_history, http_client, use_cache=use_cache,
+                on_complete=lambda answer: finish_session_turn(session, answer), route=route
+            ):
+                yield event
+
+    response = await make_response(
+        events(), 200, {'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    response.timeout = None
+    return response
+
+
+@app.route('/chatbot/stream/stats', methods=['GET'])
+async def chatbot_stream_stats():
+    return jsonify(streaming_stats.snapshot())
+
+
+@app.route('/chatbot/cache/stats', methods=['GET'])
+async def chatbot_cache_stats():
+    return jsonify(response_cache_stats())
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    # Prometheus text format; under serve.py the counts cover every worker (see metrics.py)
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route('/healthz', methods=['GET'])
+async def healthz():
+    return jsonify(liveness())
+
+
+@app.route('/readyz', methods=['GET'])
+async def readyz():
+    ready, body = readiness()
+    return jsonify(body), 200 if ready else 503
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5000)
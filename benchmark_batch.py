@@ -0,0 +1,92 @@
+# benchmark_batch.py
+
+import argparse
+import random
+import time
+
+import kundali_calculations
+from kundali_calculations import calculate_kundali, calculate_kundali_batch
+
+# Fixed coordinates so the benchmark never touches the network
+BENCHMARK_PLACES = {
+    'Mumbai': (19.0760, 72.8777),
+    'Delhi': (28.6139, 77.2090),
+    'Chennai': (13.0827, 80.2707),
+    'Kolkata': (22.5726, 88.3639),
+    'Bengaluru': (12.9716, 77.5946),
+    'Hyderabad': (17.3850, 78.4867),
+    'Pune': (18.5204, 73.8567),
+    'Jaipur': (26.9124, 75.7873),
+}
+
+
+class OfflineGeocoder:
+    """
+    Stand-in for OpenCageGeocode that answers from BENCHMARK_PLACES.
+    """
+    def geocode(self, place_name):
+        latitude, longitude = BENCHMARK_PLACES[place_name]
+        return [{'geometry': {'lat': latitude, 'lng': longitude}}]
+
+
+def generate_births(count, seed=42):
+    """
+    Generates a reproducible list of birth records.
+    """
+    rng = random.Random(seed)
+    places = sorted(BENCHMARK_PLACES)
+    births = []
+    for _ in range(count):
+        births.append({
+            'date_of_birth': f"{rng.randint(1940, 2010)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'time_of_birth': f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+            'place_of_birth': rng.choice(places),
+        })
+    return births
+
+
+def run_benchmark(count, seed=42, backend='swisseph'):
+    """
+    Times the single-chart loop against `calculate_kundali_batch` on the same births.
+    The chart cache is bypassed so both paths do the full calculation.
+
+    Returns:
+        dict: Elapsed seconds and charts per second for both paths.
+    """
+    kundali_calculations.geocoder = OfflineGeocoder()
+    kundali_calculations.EPHEMERIS_BACKEND = backend
+    kundali_calculations.get_chart_cache().memory.max_entries = 0
+    births = generate_births(count, seed)
+
+    start = time.perf_counter()
+    for birth in births:
+        calculate_kundali(birth['date_of_birth'], birth['time_of_birth'], birth['place_of_birth'])
+    loop_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    calculate_kundali_batch(births)
+    batch_seconds = time.perf_counter() - start
+
+    return {
+        'charts': count,
+        'loop_seconds': loop_seconds,
+        'loop_charts_per_second': count / loop_seconds,
+        'batch_seconds': batch_seconds,
+        'batch_charts_per_second': count / batch_seconds,
+        'speedup': loop_seconds / batch_seconds,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark calculate_kundali_batch against the single-chart loop.")
+    parser.add_argument('--count', type=int, default=2000, help="Number of charts to compute.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for the generated births.")
+    parser.add_argument('--backend', choices=['swisseph', 'tables'], default='swisseph',
+                        help="Ephemeris backend used for planetary longitudes.")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.count, args.seed, args.backend)
+    print(f"Charts:        {results['charts']}")
+    print(f"Single loop:   {results['loop_seconds']:.3f}s ({results['loop_charts_per_second']:.0f} charts/s)")
+    print(f"Batch:         {results['batch_seconds']:.3f}s ({results['batch_charts_per_second']:.0f} charts/s)")
+    print(f"Speedup:       {results['speedup']:.2f}x")
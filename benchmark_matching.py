@@ -0,0 +1,68 @@
+# benchmark_matching.py
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from compatibility import CandidatePool, koota_breakdown, score_candidates, top_matches
+
+
+def run_benchmark(count, queries=50, k=10, seed=42, baseline_sample=20000):
+    """
+    Times Ashtakoota matching of random query charts against a pool of count candidates,
+    and a per-pair baseline (one `koota_breakdown` per candidate) on a sample.
+
+    Returns:
+        dict: Pool build time, per-query latencies and the extrapolated baseline.
+    """
+    rng = np.random.default_rng(seed)
+    longitudes = rng.random(count) * 360.0
+    query_longitudes = rng.random(queries) * 360.0
+
+    started = time.perf_counter()
+    pool = CandidatePool(list(range(count)), longitudes)
+    build_seconds = time.perf_counter() - started
+
+    score_ms = []
+    top_ms = []
+    for longitude in query_longitudes:
+        started = time.perf_counter()
+        score_candidates(longitude, pool.units)
+        score_ms.append((time.perf_counter() - started) * 1000.0)
+        started = time.perf_counter()
+        top_matches(longitude, pool.units, k)
+        top_ms.append((time.perf_counter() - started) * 1000.0)
+
+    sample = longitudes[:baseline_sample]
+    started = time.perf_counter()
+    for longitude in sample:
+        koota_breakdown(query_longitudes[0], longitude)
+    baseline_seconds = (time.perf_counter() - started) * count / len(sample)
+
+    return {
+        'candidates': count,
+        'pool_mb': pool.units.nbytes / 1e6,
+        'build_seconds': build_seconds,
+        'score_ms': statistics.median(score_ms),
+        'top_k_ms': statistics.median(top_ms),
+        'top_k_p95_ms': sorted(top_ms)[int(0.95 * (len(top_ms) - 1))],
+        'baseline_seconds': baseline_seconds,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark vectorized Ashtakoota matching.")
+    parser.add_argument('--count', type=int, default=1000000, help="Candidates in the pool.")
+    parser.add_argument('--queries', type=int, default=50, help="Query charts to time.")
+    parser.add_argument('--k', type=int, default=10, help="Matches returned per query.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for the random Moon positions.")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.count, args.queries, args.k, args.seed)
+    print(f"Candidates: {results['candidates']} ({results['pool_mb']:.1f} MB of units, "
+          f"built in {results['build_seconds']:.2f}s)")
+    print(f"Score all:  {results['score_ms']:.2f} ms (median)")
+    print(f"Top {args.k}:     {results['top_k_ms']:.2f} ms (median), {results['top_k_p95_ms']:.2f} ms (p95)")
+    print(f"Per-pair baseline (extrapolated): {results['baseline_seconds']:.1f} s per query")
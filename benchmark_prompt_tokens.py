@@ -0,0 +1,51 @@
+# benchmark_prompt_tokens.py
+
+import argparse
+import statistics
+
+from benchmark_batch import generate_births
+from chat_sessions import count_tokens, token_counter_name
+from kundali_calculations import calculate_kundali_batch
+from kundali_chatbot import SUMMARY_KEYS, build_system_prompt
+
+
+def run_benchmark(count, seed=42, model_id="gpt-4"):
+    """
+    Counts the system prompt tokens of each summary format over reproducible charts.
+
+    Returns:
+        dict: Token statistics per format and the saving of each format over 'verbose'.
+    """
+    reports = [report for report in calculate_kundali_batch(generate_births(count, seed)) if 'error' not in report]
+    results = {'charts': len(reports), 'counter': token_counter_name(model_id), 'formats': {}}
+
+    for summary_format, key in SUMMARY_KEYS.items():
+        tokens = sorted(count_tokens(build_system_prompt(report[key]), model_id) for report in reports)
+        summary_tokens = [count_tokens(report[key], model_id) for report in reports]
+        results['formats'][summary_format] = {
+            'prompt_mean': statistics.mean(tokens),
+            'prompt_median': statistics.median(tokens),
+            'prompt_max': tokens[-1],
+            'summary_mean': statistics.mean(summary_tokens),
+        }
+
+    verbose = results['formats']['verbose']
+    for stats in results['formats'].values():
+        stats['summary_saving'] = 1.0 - stats['summary_mean'] / verbose['summary_mean']
+        stats['prompt_saving'] = 1.0 - stats['prompt_mean'] / verbose['prompt_mean']
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare prompt token counts of the chart summary formats.")
+    parser.add_argument('--count', type=int, default=500, help="Number of charts to summarize.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for the generated births.")
+    parser.add_argument('--model', default="gpt-4", help="Model whose tokenizer is used.")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.count, args.seed, args.model)
+    print(f"Charts: {results['charts']} (token counter: {results['counter']})")
+    print(f"{'format':10s} {'summary':>8s} {'prompt':>8s} {'median':>8s} {'max':>6s} {'saved':>7s}")
+    for summary_format, stats in results['formats'].items():
+        print(f"{summary_format:10s} {stats['summary_mean']:8.1f} {stats['prompt_mean']:8.1f} "
+              f"{stats['prompt_median']:8.1f} {stats['prompt_max']:6d} {stats['summary_saving']:7.1%}")
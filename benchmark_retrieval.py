@@ -0,0 +1,93 @@
+# benchmark_retrieval.py
+
+import argparse
+import random
+import re
+import statistics
+import tempfile
+import time
+
+from kundali_calculations import calculate_kundali_at
+from retrieval_index import RetrievalIndex, build_retrieval_index, chart_terms, load_corpus
+
+BENCHMARK_QUESTIONS = [
+    "How will my career develop?",
+    "What does my chart say about marriage?",
+    "Is this a good period for money and investments?",
+    "What does Jupiter in my chart mean?",
+    "Tell me about my health.",
+    "How does my current dasha affect relationships?",
+    "Which house is strongest in my chart?",
+    "Will I travel abroad?",
+]
+
+
+def synthetic_corpus(count, seed=42):
+    """
+    Grows the interpretation corpus to count documents by recombining the sentences of
+    real interpretations under real prompt keys, keeping a realistic vocabulary.
+    """
+    rng = random.Random(seed)
+    corpus = load_corpus()
+    sentences = [sentence for _, completion in corpus for sentence in re.split(r'(?<=[.!?])\s+', completion)]
+    documents = list(corpus[:count])
+    while len(documents) < count:
+        prompt, _ = rng.choice(corpus)
+        documents.append((prompt, ' '.join(rng.sample(sentences, 3))))
+    return documents
+
+
+def run_benchmark(sizes, queries=500, seed=42):
+    """
+    Builds an index per corpus size and times queries with chart terms.
+
+    Returns:
+        list: Build time, index size and query latency percentiles per corpus size.
+    """
+    rng = random.Random(seed)
+    charts = [
+        chart_terms(calculate_kundali_at(f"{rng.randint(1940, 2010)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                                         f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}", 19.0760, 72.8777))
+        for _ in range(16)
+    ]
+    results = []
+    for size in sizes:
+        documents = synthetic_corpus(size, seed)
+        with tempfile.TemporaryDirectory() as index_dir:
+            started = time.perf_counter()
+            meta = build_retrieval_index(documents, index_dir, incremental=False)
+            build_seconds = time.perf_counter() - started
+
+            index = RetrievalIndex(index_dir)
+            index.retrieve(BENCHMARK_QUESTIONS[0], charts[0])
+            latencies = []
+            for i in range(queries):
+                started = time.perf_counter()
+                index.retrieve(BENCHMARK_QUESTIONS[i % len(BENCHMARK_QUESTIONS)], charts[i % len(charts)])
+                latencies.append((time.perf_counter() - started) * 1000.0)
+            latencies.sort()
+            del index
+
+        results.append({
+            'documents': size,
+            'terms': meta['terms'],
+            'build_seconds': build_seconds,
+            'index_mb': meta['bytes'] / 1e6,
+            'p50_ms': statistics.median(latencies),
+            'p95_ms': latencies[int(0.95 * (len(latencies) - 1))],
+        })
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the retrieval index as the corpus grows.")
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000', help="Comma-separated corpus sizes.")
+    parser.add_argument('--queries', type=int, default=500, help="Queries timed per corpus size.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for the synthetic corpus.")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    print(f"{'documents':>10s} {'terms':>7s} {'build s':>8s} {'index MB':>9s} {'p50 ms':>7s} {'p95 ms':>7s}")
+    for row in run_benchmark(sizes, args.queries, args.seed):
+        print(f"{row['documents']:10d} {row['terms']:7d} {row['build_seconds']:8.2f} {row['index_mb']:9.1f} "
+              f"{row['p50_ms']:7.3f} {row['p95_ms']:7.3f}")
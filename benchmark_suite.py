@@ -0,0 +1,298 @@
+# benchmark_suite.py
+"""
+Microbenchmarks for each stage of `calculate_kundali`, for catching regressions.
+
+Every stage is timed call by call over the same seeded corpus of births (see
+`benchmark_batch.generate_births`), and the results are written as JSON so runs from
+different commits can be compared:
+
+    python benchmark_suite.py --output before.json
+    python benchmark_suite.py --baseline before.json --threshold 0.15 --stage-threshold julian_day=0.3
+
+The comparison exits with status 1 when a stage's median got slower than its threshold
+allows. The suite runs offline: OpenCage is replaced by a stub, the geocode cache lives
+in a temporary directory and the chart cache is bypassed.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import swisseph as swe
+
+import kundali_calculations
+import kundali_presentation
+from benchmark_batch import BENCHMARK_PLACES, generate_births
+from cache_utils import SQLiteCache
+from kundali_calculations import (
+    AYANAMSA,
+    HOUSE_SYSTEM,
+    calculate_chart,
+    calculate_julian_day,
+    calculate_kundali,
+    calculate_vimshottari_dasha,
+    get_coordinates_from_place,
+    get_current_periods,
+    make_report_from_chart,
+)
+from response_encoding import encode_response
+from timezone_index import timezone_at
+
+PLANET_CODES = [swe.SUN, swe.MOON, swe.MARS, swe.MERCURY, swe.JUPITER, swe.VENUS, swe.SATURN, swe.TRUE_NODE]
+
+PRESENTATION_FUNCTIONS = [
+    'display_ascendant_and_planetary_positions',
+    'display_house_rulers',
+    'display_planets_in_houses',
+    'display_dasha_periods',
+    'display_current_dasha',
+    'display_current_antardasha',
+    'display_overall_summary',
+    'build_kundali_response',
+]
+
+
+class StubGeocoder:
+    """
+    Stand-in for OpenCageGeocode: answers every place with coordinates derived from
+    its name, so misses never touch the network.
+    """
+    def geocode(self, place_name):
+        digest = hashlib.blake2b(place_name.encode('utf-8'), digest_size=8).digest()
+        latitude = int.from_bytes(digest[:4], 'little') / 2 ** 32 * 120.0 - 60.0
+        longitude = int.from_bytes(digest[4:], 'little') / 2 ** 32 * 360.0 - 180.0
+        return [{'geometry': {'lat': latitude, 'lng': longitude}}]
+
+
+def _time_calls(fn, inputs, rounds):
+    """
+    Calls fn on every input for a warm-up round and then `rounds` rounds.
+    Returns the per-call latencies in microseconds.
+    """
+    for item in inputs:
+        fn(item)
+    latencies = []
+    for _ in range(rounds):
+        for item in inputs:
+            started = time.perf_counter_ns()
+            fn(item)
+            latencies.append((time.perf_counter_ns() - started) / 1000.0)
+    return latencies
+
+
+def _summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        'calls': len(latencies),
+        'median_us': statistics.median(latencies),
+        'p95_us': latencies[int(0.95 * (len(latencies) - 1))],
+        'mean_us': statistics.fmean(latencies),
+        'min_us': latencies[0],
+    }
+
+
+def _fresh_reports(charts, count):
+    """
+    Reports whose lazy views are not built yet, so every timed call pays for them.
+    """
+    return [make_report_from_chart(charts[i % len(charts)]) for i in range(count)]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_suite(count=200, rounds=5, seed=42, backend='swisseph', stages=None):
+    """
+    Times every stage over count seeded births.
+
+    Parameters:
+        count (int): Births in the corpus.
+        rounds (int): Timed passes over the corpus per stage (after one warm-up pass).
+        seed (int): Seed of the corpus.
+        backend (str): Ephemeris backend, 'swisseph' or 'tables'.
+        stages (list): Names of the stages to run (all by default).
+
+    Returns:
+        dict: 'meta' (environment and settings) and 'stages' ({name: latency statistics}).
+    """
+    births = generate_births(count, seed)
+    kundali_calculations.EPHEMERIS_BACKEND = backend
+    kundali_calculations.get_chart_cache().memory.max_entries = 0
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # OpenCage fallback answered by the stub, cached in a throwaway SQLite file
+        kundali_calculations.geocoder = StubGeocoder()
+        kundali_calculations.use_opencage_fallback = True
+        kundali_calculations._geocode_cache = SQLiteCache(os.path.join(cache_dir, 'geocode.sqlite3'))
+
+        coordinates = [BENCHMARK_PLACES[birth['place_of_birth']] for birth in births]
+        timezones = [timezone_at(lat, lon) for lat, lon in coordinates]
+        jds = [calculate_julian_day(birth['date_of_birth'], birth['time_of_birth'], tz)
+               for birth, tz in zip(births, timezones)]
+        charts = [calculate_chart(jd, lat, lon) for jd, (lat, lon) in zip(jds, coordinates)]
+        moons = [chart.longitudes[1] for chart in charts]
+        timelines = [chart.dasha_timeline for chart in charts]
+        indices = list(range(count))
+        unknown_places = iter(f"Benchmark Place {i}" for i in range(10 ** 9))
+
+        def geocode_miss(_):
+            get_coordinates_from_place(next(unknown_places))
+
+        def report_and_summaries(i):
+            report = make_report_from_chart(charts[i])
+            return report.kundali_summary, report.kundali_summary_compact
+
+        def calc_ut(i):
+            swe.set_sid_mode(AYANAMSA)
+            for code in PLANET_CODES:
+                swe.calc_ut(jds[i], code, swe.FLG_SIDEREAL)
+
+        suite = {
+            'geocode_gazetteer': (lambda i: get_coordinates_from_place(births[i]['place_of_birth']), indices),
+            'geocode_opencage_stub': (geocode_miss, indices),
+            # The warm-up pass misses and fills the cache, the timed passes hit it
+            'geocode_cache_hit': (lambda i: get_coordinates_from_place(f"Cached Place {i}"), indices),
+            'timezone_at': (lambda i: timezone_at(*coordinates[i]), indices),
+            'julian_day': (lambda i: calculate_julian_day(births[i]['date_of_birth'], births[i]['time_of_birth'],
+                                                          timezones[i]), indices),
+            'swe_calc_ut': (calc_ut, indices),
+            'swe_houses_ex': (lambda i: swe.houses_ex(jds[i], coordinates[i][0], coordinates[i][1],
+                                                      HOUSE_SYSTEM.encode(), swe.FLG_SIDEREAL), indices),
+            'calculate_chart': (lambda i: calculate_chart(jds[i], *coordinates[i]), indices),
+            # calculate_antardasha was folded into the timeline lookup of get_current_periods
+            'vimshottari_dasha': (lambda i: calculate_vimshottari_dasha(jds[i], moons[i]), indices),
+            'current_periods': (lambda i: get_current_periods(timelines[i]), indices),
+            # make_personalized_report and prepare_kundali_summary became the Chart's lazy views
+            'report_and_summaries': (report_and_summaries, indices),
+            'encode_response': (lambda report: encode_response(kundali_presentation.build_kundali_response(report),
+                                                               'application/json', 'gzip'), None),
+            'calculate_kundali': (lambda i: calculate_kundali(births[i]['date_of_birth'], births[i]['time_of_birth'],
+                                                              births[i]['place_of_birth']), indices),
+        }
+        for name in PRESENTATION_FUNCTIONS:
+            suite[name] = (getattr(kundali_presentation, name), None)
+
+        results = {}
+        for name, (fn, inputs) in suite.items():
+            if stages and name not in stages:
+                continue
+            if inputs is None:
+                # Presentation stages get reports with no views built, one per timed call
+                reports = iter(_fresh_reports(charts, count * (rounds + 1)))
+                results[name] = _summarize(_time_calls(lambda _: fn(next(reports)), indices, rounds))
+            else:
+                results[name] = _summarize(_time_calls(fn, inputs, rounds))
+        kundali_calculations._geocode_cache = None
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'created': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'swisseph': getattr(swe, 'version', None),
+            'platform': platform.platform(),
+            'births': count,
+            'rounds': rounds,
+            'seed': seed,
+            'backend': backend,
+        },
+        'stages': results,
+    }
+
+
+def compare_results(current, baseline, threshold=0.10, stage_thresholds=None):
+    """
+    Compares the stage medians of two runs.
+
+    Parameters:
+        current (dict): Results of `run_suite`.
+        baseline (dict): Results of an earlier run.
+        threshold (float): Allowed relative slowdown of a median (0.10 is 10%).
+        stage_thresholds (dict): Per-stage overrides of threshold.
+
+    Returns:
+        list: One row per stage present in both runs with the baseline and current
+            medians, the relative change and whether it is a regression.
+    """
+    stage_thresholds = stage_thresholds or {}
+    rows = []
+    for name, stats in current['stages'].items():
+        before = baseline['stages'].get(name)
+        if before is None:
+            continue
+        change = stats['median_us'] / before['median_us'] - 1.0
+        allowed = stage_thresholds.get(name, threshold)
+        rows.append({
+            'stage': name,
+            'baseline_us': before['median_us'],
+            'current_us': stats['median_us'],
+            'change': change,
+            'threshold': allowed,
+            'regression': change > allowed,
+        })
+    return rows
+
+
+def _parse_stage_thresholds(values):
+    thresholds = {}
+    for value in values:
+        name, _, limit = value.partition('=')
+        if not limit:
+            raise argparse.ArgumentTypeError(f"Expected STAGE=FRACTION, got {value!r}")
+        thresholds[name] = float(limit)
+    return thresholds
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time each stage of calculate_kundali and check for regressions.")
+    parser.add_argument('--count', type=int, default=200, help="Births in the seeded corpus.")
+    parser.add_argument('--rounds', type=int, default=5, help="Timed passes over the corpus per stage.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for the corpus.")
+    parser.add_argument('--backend', choices=['swisseph', 'tables'], default='swisseph',
+                        help="Ephemeris backend used for planetary longitudes.")
+    parser.add_argument('--stages', help="Comma-separated stages to run (all by default).")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    parser.add_argument('--baseline', help="Compare against the results in this JSON file.")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Allowed relative slowdown of a stage's median (default 0.10).")
+    parser.add_argument('--stage-threshold', action='append', default=[], metavar='STAGE=FRACTION',
+                        help="Per-stage threshold; may be repeated.")
+    args = parser.parse_args()
+
+    stage_thresholds = _parse_stage_thresholds(args.stage_threshold)
+    results = run_suite(args.count, args.rounds, args.seed, args.backend,
+                        args.stages.split(',') if args.stages else None)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    print(f"{'stage':44s} {'median us':>10s} {'p95 us':>10s} {'mean us':>10s}")
+    for name, stats in results['stages'].items():
+        print(f"{name:44s} {stats['median_us']:10.2f} {stats['p95_us']:10.2f} {stats['mean_us']:10.2f}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare_results(results, baseline, args.threshold, stage_thresholds)
+        print(f"\nAgainst {args.baseline} (commit {baseline['meta'].get('commit')}):")
+        for row in rows:
+            flag = 'REGRESSION' if row['regression'] else ''
+            print(f"{row['stage']:44s} {row['baseline_us']:10.2f} -> {row['current_us']:10.2f} "
+                  f"{row['change']:+7.1%} (limit {row['threshold']:+.0%}) {flag}")
+        if any(row['regression'] for row in rows):
+            sys.exit(1)
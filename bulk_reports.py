@@ -0,0 +1,362 @@
+# bulk_reports.py
+"""
+Computes Kundali reports for large exports of birth records, without going through the
+HTTP API.
+
+    python bulk_reports.py births.csv reports.jsonl --workers 8
+    python bulk_reports.py births.jsonl reports.csv --vargas D9,D10
+    python bulk_reports.py births.csv reports.jsonl --resume
+
+Records are streamed from a CSV file (with a header row) or a JSONL file. Each record
+has 'date_of_birth', 'time_of_birth' and 'place_of_birth', or 'latitude' and
+'longitude' in place of (or in addition to) the place, plus an optional 'id' that is
+copied to the output. They are read in chunks that run through
+`calculate_kundali_batch` on a pool of worker processes. Only a few chunks per worker
+are in flight at any time, so memory stays flat however large the input is.
+
+Output is written in input order as the chunks finish:
+- JSONL: one line per record, holding the record's index and id plus the /kundali
+  response body (or the error).
+- CSV: a flat table with one column per field. Divisional charts are included as one
+  sign column per planet.
+
+After every chunk, the output is flushed and a checkpoint (`<output>.checkpoint`)
+records how many records and output bytes are complete. An interrupted run continues
+from there with --resume: output past the checkpoint is truncated and the records
+already done are skipped. Throughput and error counts are reported on stderr while the
+run progresses.
+"""
+
+import argparse
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from calc_executor import CALC_START_METHOD, EPHEMERIS_PATH, _initialize_worker
+from chart_model import PLANETS
+from kundali_calculations import AYANAMSA, calculate_kundali_batch
+from kundali_presentation import build_kundali_response
+from response_encoding import encode_json
+from vargas import normalize_vargas
+
+BULK_WORKERS = int(os.environ.get('KUNDALI_BULK_WORKERS', str(os.cpu_count() or 1)))
+BULK_CHUNK_SIZE = int(os.environ.get('KUNDALI_BULK_CHUNK_SIZE', '500'))
+# Chunks queued or running per worker; bounds memory and out-of-order buffering
+BULK_CHUNKS_PER_WORKER = 2
+PROGRESS_INTERVAL = 5.0
+
+INPUT_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.json': 'jsonl'}
+OUTPUT_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+REQUIRED_FIELDS = ('date_of_birth', 'time_of_birth')
+
+
+def _detect_format(path, formats, default):
+    return formats.get(os.path.splitext(path)[1].lower(), default)
+
+
+def normalize_record(raw):
+    """
+    Turns one input row into a record for `calculate_kundali_batch`, or a record with
+    an 'error' key when it cannot be calculated.
+    """
+    if not isinstance(raw, dict):
+        return {'error': "Record is not an object"}
+    record = {key: value.strip() if isinstance(value, str) else value for key, value in raw.items()}
+    for field in ('latitude', 'longitude', 'place_of_birth', 'id'):
+        if record.get(field) == '':
+            record[field] = None
+    missing = [field for field in REQUIRED_FIELDS if not record.get(field)]
+    if record.get('place_of_birth') is None and (record.get('latitude') is None or record.get('longitude') is None):
+        missing.append('place_of_birth')
+    if missing:
+        return {'id': record.get('id'), 'error': f"Missing {', '.join(missing)}"}
+    return record
+
+
+def read_records(path, input_format='jsonl'):
+    """
+    Yields normalized records from a CSV or JSONL file, one at a time. Lines that are
+    not valid JSON are yielded as error records, so record indexes always match the
+    input.
+    """
+    if input_format == 'csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                yield normalize_record(row)
+        return
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                raw = json.loads(line)
+            except ValueError as e:
+                yield {'error': f"Invalid JSON: {e}"}
+                continue
+            yield normalize_record(raw)
+
+
+def csv_columns(varga_names=None):
+    """
+    Returns the header of the CSV output.
+    """
+    columns = ['index', 'id', 'ascendant', 'ascendant_sign']
+    for planet in PLANETS:
+        columns += [f'{planet}_longitude', f'{planet}_sign', f'{planet}_house']
+    for period in ('mahadasha', 'antardasha'):
+        columns += [period, f'{period}_start', f'{period}_end']
+    for varga in varga_names or ():
+        columns += [f'{varga}_Ascendant_sign'] + [f'{varga}_{planet}_sign' for planet in PLANETS]
+    return columns + ['error']
+
+
+def _csv_row(index, record_id, chart, varga_names):
+    if isinstance(chart, dict):
+        return [index, record_id] + [''] * (len(csv_columns(varga_names)) - 3) + [chart['error']]
+    row = [index, record_id, round(chart.ascendant, 6), chart.asc_sign_name]
+    planets = chart.planets
+    for planet in PLANETS:
+        details = planets[planet]
+        row += [round(details['position'], 6), details['planetary_sign'], details['house']]
+    for period in (chart.current_dasha, chart.current_antardasha):
+        if period:
+            row += [period['planet'], period['start_date'].strftime('%Y-%m-%d'), period['end_date'].strftime('%Y-%m-%d')]
+        else:
+            row += ['', '', '']
+    if varga_names:
+        vargas = chart.vargas
+        for varga in varga_names:
+            row += [vargas[varga]['Ascendant']['sign']] + [vargas[varga][planet]['sign'] for planet in PLANETS]
+    return row + ['']
+
+
+def _report_chunk_job(start, records, output_format, varga_names):
+    """
+    Calculates one chunk in a worker process and returns (encoded output, records,
+    errors), so serialization runs in the workers too.
+    """
+    results = [record if 'error' in record else None for record in records]
+    valid = [index for index, result in enumerate(results) if result is None]
+    if valid:
+        try:
+            charts = calculate_kundali_batch([records[index] for index in valid], vargas=varga_names)
+        except Exception as e:
+            charts = [{'error': str(e)}] * len(valid)
+        for index, chart in zip(valid, charts):
+            results[index] = chart
+
+    errors = 0
+    if output_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        for offset, (record, chart) in enumerate(zip(records, results)):
+            errors += isinstance(chart, dict)
+            writer.writerow(_csv_row(start + offset, record.get('id'), chart, varga_names))
+        return buffer.getvalue().encode('utf-8'), len(records), errors
+
+    lines = []
+    for offset, (record, chart) in enumerate(zip(records, results)):
+        line = {'index': start + offset, 'id': record.get('id')}
+        if isinstance(chart, dict):
+            errors += 1
+            line['error'] = chart['error']
+        else:
+            line['report'] = build_kundali_response(chart)
+        lines.append(encode_json(line))
+    return b'\n'.join(lines) + b'\n', len(records), errors
+
+
+class Progress:
+    """
+    Prints throughput and error counts to stderr every `interval` seconds.
+    """
+    def __init__(self, done=0, errors=0, interval=PROGRESS_INTERVAL, stream=sys.stderr):
+        self.done = done
+        self.errors = errors
+        self.interval = interval
+        self.stream = stream
+        self.started = self.last_report = time.perf_counter()
+        self.resumed_at = self.last_done = done
+
+    def update(self, records, errors):
+        self.done += records
+        self.errors += errors
+        if time.perf_counter() - self.last_report >= self.interval:
+            self.report()
+
+    def report(self, final=False):
+        now = time.perf_counter()
+        elapsed = now - self.started
+        rate = (self.done - self.resumed_at) / elapsed if elapsed else 0.0
+        recent = (self.done - self.last_done) / (now - self.last_report) if now > self.last_report else 0.0
+        label = 'done' if final else 'progress'
+        print(f"{label}: {self.done:,} records, {self.errors:,} errors, {elapsed:.1f} s, "
+              f"{rate:,.0f} records/s" + ('' if final else f" ({recent:,.0f} records/s recently)"),
+              file=self.stream, flush=True)
+        self.last_report = now
+        self.last_done = self.done
+
+
+def _input_signature(path):
+    stat = os.stat(path)
+    return {'input': os.path.abspath(path), 'input_size': stat.st_size, 'input_mtime_ns': stat.st_mtime_ns}
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path, state):
+    """
+    Replaces the checkpoint atomically, so a crash never leaves a partial one.
+    """
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def _chunks(records, size, start):
+    while True:
+        chunk = list(itertools.islice(records, size))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+def _submit(pool, fn, *args):
+    if pool is not None:
+        return pool.submit(fn, *args)
+    # No pool: run in this process (useful for debugging)
+    future = Future()
+    future.set_result(fn(*args))
+    return future
+
+
+def run_bulk(input_path, output_path, input_format=None, output_format=None, vargas=None, workers=BULK_WORKERS,
+             chunk_size=BULK_CHUNK_SIZE, resume=False, progress_interval=PROGRESS_INTERVAL):
+    """
+    Computes a report for every record of input_path into output_path, checkpointing
+    after each chunk.
+
+    Parameters:
+        input_path (str): CSV or JSONL birth records.
+        output_path (str): JSONL or CSV output file.
+        input_format (str): 'csv' or 'jsonl' (default: from the file extension).
+        output_format (str): 'jsonl' or 'csv' (default: from the file extension).
+        vargas: Divisional charts to include, as in `calculate_kundali`.
+        workers (int): Worker processes (0 computes in this process).
+        chunk_size (int): Records per `calculate_kundali_batch` call.
+        resume (bool): Continue from the checkpoint of an interrupted run.
+        progress_interval (float): Seconds between progress lines.
+
+    Returns:
+        dict: The final checkpoint state ('records_done', 'errors', ...).
+    """
+    input_format = input_format or _detect_format(input_path, INPUT_FORMATS, 'jsonl')
+    output_format = output_format or _detect_format(output_path, OUTPUT_FORMATS, 'jsonl')
+    varga_names = normalize_vargas(vargas) if vargas else None
+    checkpoint_path = output_path + '.checkpoint'
+
+    settings = dict(_input_signature(input_path), input_format=input_format, output_format=output_format,
+                    vargas=varga_names)
+    checkpoint = load_checkpoint(checkpoint_path)
+    if resume and checkpoint is not None:
+        changed = [key for key, value in settings.items() if checkpoint.get(key) != value]
+        if changed:
+            raise ValueError(f"Cannot resume: {', '.join(changed)} changed since {checkpoint_path} was written")
+        state = checkpoint
+    elif checkpoint is not None and not resume and not checkpoint.get('complete'):
+        raise ValueError(f"{checkpoint_path} exists; pass --resume to continue that run or delete it")
+    else:
+        state = dict(settings, records_done=0, errors=0, output_bytes=0, complete=False)
+    if state.get('complete'):
+        print(f"{output_path} is already complete ({state['records_done']:,} records)", file=sys.stderr)
+        return state
+
+    records = read_records(input_path, input_format)
+    # Records already written are read and dropped, so the indexes stay aligned
+    records = itertools.islice(records, state['records_done'], None)
+    progress = Progress(state['records_done'], state['errors'], progress_interval)
+    pool = None
+    if workers > 0:
+        start_method = CALC_START_METHOD
+        if start_method not in multiprocessing.get_all_start_methods():
+            start_method = 'spawn'
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method),
+                                   initializer=_initialize_worker, initargs=(EPHEMERIS_PATH, AYANAMSA))
+    max_pending = max(1, workers) * BULK_CHUNKS_PER_WORKER
+
+    with open(output_path, 'r+b' if state['output_bytes'] else 'wb') as output:
+        # Drop anything written after the last checkpoint
+        output.truncate(state['output_bytes'])
+        output.seek(state['output_bytes'])
+        if output_format == 'csv' and state['output_bytes'] == 0:
+            output.write((','.join(csv_columns(varga_names)) + '\n').encode('utf-8'))
+
+        def write_next():
+            payload, done, errors = pending.popleft().result()
+            output.write(payload)
+            output.flush()
+            os.fsync(output.fileno())
+            state['records_done'] += done
+            state['errors'] += errors
+            state['output_bytes'] = output.tell()
+            save_checkpoint(checkpoint_path, state)
+            progress.update(done, errors)
+
+        pending = deque()
+        try:
+            for start, chunk in _chunks(records, chunk_size, state['records_done']):
+                pending.append(_submit(pool, _report_chunk_job, start, chunk, output_format, varga_names))
+                if len(pending) >= max_pending:
+                    write_next()
+            while pending:
+                write_next()
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    state['complete'] = True
+    save_checkpoint(checkpoint_path, state)
+    progress.report(final=True)
+    return state
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compute Kundali reports for a CSV or JSONL file of births.")
+    parser.add_argument('input', help="CSV (with a header row) or JSONL birth records.")
+    parser.add_argument('output', help="Output file: .jsonl for /kundali responses, .csv for a flat table.")
+    parser.add_argument('--input-format', choices=['csv', 'jsonl'], help="Default: from the file extension.")
+    parser.add_argument('--output-format', choices=['jsonl', 'csv'], help="Default: from the file extension.")
+    parser.add_argument('--vargas', help="Comma-separated divisional charts to include, e.g. D9,D10.")
+    parser.add_argument('--workers', type=int, default=BULK_WORKERS, help="Worker processes (0 for none).")
+    parser.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE, help="Records per batch.")
+    parser.add_argument('--resume', action='store_true', help="Continue an interrupted run from its checkpoint.")
+    parser.add_argument('--progress-interval', type=float, default=PROGRESS_INTERVAL,
+                        help="Seconds between progress lines.")
+    args = parser.parse_args()
+
+    try:
+        run_bulk(args.input, args.output, args.input_format, args.output_format,
+                 args.vargas.split(',') if args.vargas else None, args.workers, args.chunk_size, args.resume,
+                 args.progress_interval)
+    except ValueError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        print(f"Interrupted; rerun with --resume to continue from {args.output}.checkpoint", file=sys.stderr)
+        sys.exit(130)
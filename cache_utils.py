@@ -0,0 +1,452 @@
+# cache_utils.py
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key within a process: the first caller
+    runs the function, the others wait for its result (or its exception).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = {'event': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
+
+
+class SQLiteCache:
+    """
+    Disk-backed key/value cache shared by every process that opens the same file.
+
+    The database runs in WAL mode so readers in other worker processes are not blocked
+    by writers. Entries expire after `ttl_seconds` and the least recently used entries
+    are evicted once the cache holds more than `max_entries`.
+
+    Parameters:
+        path (str): SQLite database file.
+        max_entries (int): Upper bound on stored entries (None for unbounded).
+        ttl_seconds (float): Time-to-live for entries (None for no expiry).
+        max_bytes (int): Upper bound on the total size of stored values (None for unbounded).
+    """
+    EVICTION_CHECK_INTERVAL = 100
+
+    def __init__(self, path, max_entries=100000, ttl_seconds=None, max_bytes=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._single_flight = SingleFlight()
+        self._counter_lock = threading.Lock()
+        self._writes_since_eviction = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+        connection.execute("CREATE TABLE IF NOT EXISTS inflight (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+
+    def _connection(self):
+        # sqlite3 connections must not be shared between threads (or forked processes)
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _count(self, hit):
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _lookup(self, key):
+        """
+        Returns (found, value) for key without touching the hit/miss counters.
+        """
+        connection = self._connection()
+        now = time.time()
+        row = connection.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return False, None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= now:
+            connection.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (key, now))
+            return False, None
+        connection.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return True, pickle.loads(value)
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for key, or default if it is missing or expired.
+        """
+        found, value = self._lookup(key)
+        self._count(found)
+        return value if found else default
+
+    def set(self, key, value, ttl_seconds=None):
+        """
+        Stores value under key. ttl_seconds overrides the cache-wide TTL for this entry.
+        """
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        now = time.time()
+        expires_at = now + ttl_seconds if ttl_seconds is not None else None
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, blob, len(blob), expires_at, now)
+        )
+        self._after_write()
+
+    def _after_write(self):
+        with self._counter_lock:
+            self._writes_since_eviction += 1
+            check_eviction = self._writes_since_eviction >= self.EVICTION_CHECK_INTERVAL
+            if check_eviction:
+                self._writes_since_eviction = 0
+        if check_eviction:
+            self.evict()
+
+    def update(self, key, fn, ttl_seconds=None):
+        """
+        Replaces the value under key with fn(current value, or None when it is missing or
+        expired) and returns the new value. The read and the write share one IMMEDIATE
+        transaction, so concurrent updates from any process are applied one at a time.
+        """
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = connection.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            current = None
+            if row is not None and (row[1] is None or row[1] > now):
+                current = pickle.loads(row[0])
+            value = fn(current)
+            blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now + ttl_seconds if ttl_seconds is not None else None, now)
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        self._after_write()
+        return value
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        connection = self._connection()
+        connection.execute("DELETE FROM cache")
+        connection.execute("DELETE FROM inflight")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def total_bytes(self):
+        return self._connection().execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def evict(self):
+        """
+        Removes expired entries, then the least recently used ones above max_entries
+        and max_bytes.
+        """
+        connection = self._connection()
+        connection.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        if self.max_entries is not None:
+            excess = len(self) - self.max_entries
+            if excess > 0:
+                connection.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                    (excess,)
+                )
+        if self.max_bytes is not None:
+            excess_bytes = self.total_bytes() - self.max_bytes
+            if excess_bytes > 0:
+                # Drop the oldest entries whose cumulative size covers the excess
+                connection.execute(
+                    "DELETE FROM cache WHERE key IN ("
+                    "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed_at, key) - size AS before FROM cache) "
+                    "WHERE before < ?)",
+                    (excess_bytes,)
+                )
+
+    def _claim(self, key, lease_seconds):
+        """
+        Tries to become the one process computing key. Returns True on success.
+        """
+        connection = self._connection()
+        now = time.time()
+        connection.execute("DELETE FROM inflight WHERE key = ? AND expires_at <= ?", (key, now))
+        cursor = connection.execute(
+            "INSERT OR IGNORE INTO inflight (key, expires_at) VALUES (?, ?)", (key, now + lease_seconds)
+        )
+        return cursor.rowcount == 1
+
+    def _release(self, key):
+        self._connection().execute("DELETE FROM inflight WHERE key = ?", (key,))
+
+    def get_or_set(self, key, compute, lease_seconds=30.0, poll_interval=0.05):
+        """
+        Returns the cached value for key, computing and storing it on a miss.
+
+        Concurrent misses for the same key are coalesced: threads in this process wait on
+        a single call, and other processes wait for the lease holder to store the result
+        (taking over if the lease expires).
+        """
+        found, value = self._lookup(key)
+        self._count(found)
+        if found:
+            return value
+
+        def compute_once():
+            while True:
+                if self._claim(key, lease_seconds):
+                    try:
+                        # Another process may have finished between our miss and the claim
+                        found, value = self._lookup(key)
+                        if not found:
+                            value = compute()
+                            self.set(key, value)
+                        return value
+                    finally:
+                        self._release(key)
+
+                deadline = time.time() + lease_seconds
+                while time.time() < deadline:
+                    time.sleep(poll_interval)
+                    found, value = self._lookup(key)
+                    if found:
+                        return value
+                    if self._connection().execute("SELECT 1 FROM inflight WHERE key = ?", (key,)).fetchone() is None:
+                        break
+
+        return self._single_flight.do(key, compute_once)
+
+    def recent(self, limit):
+        """
+        Returns up to limit unexpired (key, value) pairs, most recently used first.
+        """
+        rows = self._connection().execute(
+            "SELECT key, value FROM cache WHERE expires_at IS NULL OR expires_at > ? "
+            "ORDER BY accessed_at DESC LIMIT ?",
+            (time.time(), limit)
+        ).fetchall()
+        return [(key, pickle.loads(value)) for key, value in rows]
+
+    def stats(self):
+        """
+        Returns hit/miss counters for this process and the current number of entries.
+        """
+        with self._counter_lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': len(self),
+            'bytes': self.total_bytes(),
+        }
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory least-recently-used cache with optional TTL.
+
+    When `sizeof` is given, each entry's size is recorded when it is stored and the
+    oldest entries are also evicted while the total exceeds `max_bytes`.
+
+    Parameters:
+        max_entries (int): Number of entries kept before the oldest is evicted.
+        ttl_seconds (float): Time-to-live for entries (None for no expiry).
+        max_bytes (int): Upper bound on the total size of entries (None for unbounded).
+        sizeof (callable): Returns the size in bytes of a (key, value) pair.
+    """
+    def __init__(self, max_entries=1024, ttl_seconds=None, max_bytes=None, sizeof=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for key, or default if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.time():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl_seconds=None):
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = time.time() + ttl_seconds if ttl_seconds is not None else None
+        size = self.sizeof(key, value) if self.sizeof is not None else 0
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self.total_bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or (self.max_bytes is not None and self.total_bytes > self.max_bytes)
+            ):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            hits, misses, total_bytes = self.hits, self.misses, self.total_bytes
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'entries': len(self),
+            'bytes': total_bytes,
+        }
+
+
+class TieredCache:
+    """
+    An in-memory LRU in front of an optional SQLiteCache. Disk hits are promoted
+    into memory; writes go to both tiers.
+    """
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+        self._update_lock = threading.Lock()
+
+    def get(self, key, default=None):
+        missing = object()
+        value = self.memory.get(key, missing)
+        if value is not missing:
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key, missing)
+            if value is not missing:
+                self.memory.set(key, value)
+                return value
+        return default
+
+    def set(self, key, value, ttl_seconds=None):
+        self.memory.set(key, value, ttl_seconds)
+        if self.disk is not None:
+            self.disk.set(key, value, ttl_seconds)
+
+    def update(self, key, fn, ttl_seconds=None):
+        """
+        Replaces the value under key with fn(current value, or None) and returns the new
+        value. With a disk tier the current value is read from disk, where updates from
+        every process are serialized; otherwise a lock serializes them in this process.
+        """
+        with self._update_lock:
+            if self.disk is not None:
+                value = self.disk.update(key, fn, ttl_seconds)
+            else:
+                value = fn(self.memory.get(key))
+            self.memory.set(key, value, ttl_seconds)
+        return value
+
+    def delete(self, key):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def warm(self, limit=None):
+        """
+        Loads the most recently used disk entries into memory, up to limit (the memory
+        tier's max_entries by default). Returns the number of entries loaded.
+        """
+        if self.disk is None:
+            return 0
+        entries = self.disk.recent(self.memory.max_entries if limit is None else limit)
+        # Oldest first, so the most recent entries end up at the fresh end of the LRU
+        for key, value in reversed(entries):
+            self.memory.set(key, value)
+        return len(entries)
+
+    def stats(self):
+        stats = {'memory': self.memory.stats()}
+        if self.disk is not None:
+            stats['disk'] = self.disk.stats()
+        return stats
@@ -0,0 +1,207 @@
+# calc_executor.py
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+
+import swisseph as swe
+
+from metrics import collect_samples, record_samples
+
+# Worker pool settings. KUNDALI_CALC_WORKERS=0 runs calculations in the request thread.
+CALC_WORKERS = int(os.environ.get('KUNDALI_CALC_WORKERS', str(os.cpu_count() or 1)))
+CALC_MAX_PENDING = int(os.environ.get('KUNDALI_CALC_MAX_PENDING', str(4 * (os.cpu_count() or 1))))
+# Batch chunks queued or running at any time. Kept below the worker count, so batches
+# never occupy every worker and single charts do not queue behind them.
+CALC_MAX_BATCH_PENDING = int(os.environ.get('KUNDALI_CALC_MAX_BATCH_PENDING', str(max(1, CALC_WORKERS // 2))))
+CALC_QUEUE_TIMEOUT = float(os.environ.get('KUNDALI_CALC_QUEUE_TIMEOUT', '0.5'))
+CALC_TIMEOUT = float(os.environ.get('KUNDALI_CALC_TIMEOUT', '30'))
+CALC_START_METHOD = os.environ.get('KUNDALI_CALC_START_METHOD', 'forkserver')
+EPHEMERIS_PATH = os.environ.get('KUNDALI_EPHE_PATH')
+
+
+class ExecutorBusyError(Exception):
+    """
+    Raised when the calculation queue is full and a job could not be admitted in time.
+    """
+
+
+class CalculationTimeoutError(Exception):
+    """
+    Raised when a calculation does not finish within its timeout.
+    """
+
+
+def _initialize_worker(ephemeris_path, ayanamsa):
+    """
+    Runs once in each worker process: configures Swiss Ephemeris and opens the
+    ephemeris files so the first real job does not pay for it.
+    """
+    if ephemeris_path:
+        swe.set_ephe_path(ephemeris_path)
+        # The engine found depends on the path, so probe it again
+        from kundali_calculations import ephemeris_engine
+        ephemeris_engine.cache_clear()
+    swe.set_sid_mode(ayanamsa)
+    jd = swe.julday(2000, 1, 1, 12.0)
+    for body in (swe.SUN, swe.MOON, swe.MARS, swe.MERCURY, swe.JUPITER, swe.VENUS, swe.SATURN, swe.TRUE_NODE):
+        swe.calc_ut(jd, body, swe.FLG_SIDEREAL)
+
+    # Import the calculation module here so its setup cost is paid at start-up
+    import kundali_calculations  # noqa: F401
+
+
+# Jobs return (result, metric samples); see `CalculationExecutor.unwrap`
+def _calculate_kundali_job(date_of_birth, time_of_birth, place_name, ayanamsa, vargas=None):
+    from kundali_calculations import calculate_kundali
+    return collect_samples(calculate_kundali, date_of_birth, time_of_birth, place_name, ayanamsa=ayanamsa,
+                           vargas=vargas)
+
+
+def _calculate_kundali_at_job(date_of_birth, time_of_birth, latitude, longitude, ayanamsa, vargas=None):
+    from kundali_calculations import calculate_kundali_at
+    return collect_samples(calculate_kundali_at, date_of_birth, time_of_birth, latitude, longitude,
+                           ayanamsa=ayanamsa, vargas=vargas)
+
+
+def _calculate_kundali_batch_job(records, vargas=None):
+    from kundali_calculations import calculate_kundali_batch
+    return collect_samples(calculate_kundali_batch, records, vargas=vargas)
+
+
+class CalculationExecutor:
+    """
+    Runs chart calculations in a pool of worker processes.
+
+    Swiss Ephemeris keeps its sidereal mode and file handles in global state, so each
+    worker process owns its own copy and requests never share it. At most
+    `max_pending` single-chart jobs and `max_batch_pending` batch chunks are queued or
+    running; the two have separate slots, so a large batch cannot lock single charts
+    out. Further submissions wait up to `queue_timeout` seconds for a slot and then fail
+    with ExecutorBusyError.
+
+    Parameters:
+        max_workers (int): Number of worker processes.
+        max_pending (int): Single-chart jobs admitted (queued plus running) at any time.
+        max_batch_pending (int): Batch chunks admitted at any time.
+        queue_timeout (float): Seconds to wait for a free slot before rejecting a job.
+        timeout (float): Default seconds to wait for a job's result.
+    """
+    def __init__(self, max_workers=CALC_WORKERS, max_pending=CALC_MAX_PENDING, queue_timeout=CALC_QUEUE_TIMEOUT,
+                 timeout=CALC_TIMEOUT, ephemeris_path=EPHEMERIS_PATH, ayanamsa=swe.SIDM_LAHIRI,
+                 start_method=CALC_START_METHOD, max_batch_pending=CALC_MAX_BATCH_PENDING):
+        if start_method not in multiprocessing.get_all_start_methods():
+            start_method = 'spawn'
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_batch_pending = max_batch_pending
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._batch_slots = threading.BoundedSemaphore(max_batch_pending)
+        self._pool = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_initialize_worker,
+            initargs=(ephemeris_path, ayanamsa),
+        )
+
+    def submit(self, fn, *args, queue_timeout=None, batch=False):
+        """
+        Queues fn(*args) on the pool and returns its Future. batch=True takes a batch
+        slot instead of a single-chart slot.
+        Raises ExecutorBusyError if no slot frees up within queue_timeout seconds.
+        """
+        slots = self._batch_slots if batch else self._slots
+        if not slots.acquire(timeout=self.queue_timeout if queue_timeout is None else queue_timeout):
+            raise ExecutorBusyError("Calculation queue is full, try again shortly.")
+        try:
+            future = self._pool.submit(fn, *args)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    @staticmethod
+    def unwrap(value):
+        """
+        Returns the result of a calculation job and records the stage timings and
+        counters it collected in the worker (see metrics.py) for the current request.
+        """
+        result, samples = value
+        record_samples(samples)
+        return result
+
+    def run(self, fn, *args, timeout=None):
+        """
+        Runs a calculation job on the pool and waits for its result.
+        Raises CalculationTimeoutError if it takes longer than timeout seconds.
+        """
+        future = self.submit(fn, *args)
+        try:
+            return self.unwrap(future.result(timeout=self.timeout if timeout is None else timeout))
+        except FutureTimeoutError:
+            future.cancel()
+            raise CalculationTimeoutError("Kundali calculation timed out.")
+
+    def calculate_kundali(self, date_of_birth, time_of_birth, place_name, ayanamsa=swe.SIDM_LAHIRI, timeout=None,
+                          vargas=None):
+        """
+        Same as `kundali_calculations.calculate_kundali`, computed in a worker process.
+        """
+        return self.run(_calculate_kundali_job, date_of_birth, time_of_birth, place_name, ayanamsa, vargas,
+                        timeout=timeout)
+
+    def submit_kundali_at(self, date_of_birth, time_of_birth, latitude, longitude, ayanamsa=swe.SIDM_LAHIRI,
+                          queue_timeout=None, vargas=None):
+        """
+        Queues `kundali_calculations.calculate_kundali_at` and returns its Future, for
+        callers (such as the ASGI server) that wait on the result asynchronously; pass
+        the Future's result through `unwrap`.
+        """
+        return self.submit(_calculate_kundali_at_job, date_of_birth, time_of_birth, latitude, longitude, ayanamsa,
+                           vargas, queue_timeout=queue_timeout)
+
+    def calculate_kundali_batch(self, records, chunk_size=500, timeout=None, vargas=None):
+        """
+        Same as `kundali_calculations.calculate_kundali_batch`, split into chunks that
+        run on all workers in parallel. Results keep the input order.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        futures = []
+        results = []
+        try:
+            # Later chunks wait for earlier ones to free a slot instead of being rejected
+            for start in range(0, len(records), chunk_size):
+                futures.append(self.submit(_calculate_kundali_batch_job, records[start:start + chunk_size],
+                                           vargas, queue_timeout=timeout, batch=True))
+            for future in futures:
+                results.extend(self.unwrap(future.result(timeout=timeout)))
+        except FutureTimeoutError:
+            raise CalculationTimeoutError("Kundali batch calculation timed out.")
+        finally:
+            for future in futures:
+                future.cancel()
+        return results
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_calculation_executor():
+    """
+    Returns the shared CalculationExecutor, or None when KUNDALI_CALC_WORKERS is 0.
+    """
+    global _executor
+    if CALC_WORKERS <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = CalculationExecutor()
+    return _executor
@@ -0,0 +1,456 @@
+# chart_model.py
+"""
+Compact Kundali chart.
+
+A chart is stored as a handful of numbers: the nine sidereal longitudes, the ascendant,
+the birth Julian Day, its Dasha timeline (epoch and starting planet) and the moment its
+"current" Dasha periods refer to. Signs, houses, house lords and strengths are integer
+codes derived from those with NumPy lookups. The dict and string views used by the
+presentation, the summaries and the chatbot (planetary positions, per-planet details,
+Dasha periods, summaries, vargas) are built on first access and kept on the instance.
+
+`Chart.to_bytes` packs a chart into one CHART_DTYPE record (107 bytes); `pack_charts`
+and `unpack_charts` do the same for many charts as one structured array. Pickling uses
+the packed form too, so charts stay small in caches and between worker processes.
+
+Callers written against the old dict report can still use `chart[key]` and
+`chart.get(key)` with the report keys ('Sun', 'Mahadasha', 'kundali_summary', ...).
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+from dasha_timeline import ACTIVE_DTYPE, DASHA_PLANETS, DashaTimeline, datetime_to_jd, jd_to_datetime
+from vargas import SIGN_NAMES, VARGA_DIVISIONS, calculate_vargas, varga_report
+
+# Planet codes are indices into PLANETS, sign codes run from 1 (Aries) to 12 (Pisces)
+PLANETS = ('Sun', 'Moon', 'Mars', 'Mercury', 'Jupiter', 'Venus', 'Saturn', 'Rahu', 'Ketu')
+STRENGTHS = ('Neutral', 'Exalted', 'Debilitated', 'Strong', 'Weak')
+
+# Short codes used by the compact summary
+STRENGTH_CODES = {'Exalted': 'Ex', 'Debilitated': 'Db', 'Strong': 'Own', 'Weak': 'Wk', 'Neutral': 'Nt'}
+
+# Lord of each sign, as a planet code
+SIGN_LORDS = np.array([PLANETS.index(planet) for planet in (
+    'Mars', 'Venus', 'Mercury', 'Moon', 'Sun', 'Mercury', 'Venus', 'Mars', 'Jupiter', 'Saturn', 'Saturn', 'Jupiter'
+)], dtype=np.int8)
+
+# Report keys served by `Chart.__getitem__` besides the planets
+REPORT_KEYS = ('Mahadasha', 'Antardasha', 'kundali_summary', 'kundali_summary_compact', 'planetary_positions',
+               'planet_in_houses', 'planetary_signs', 'house_rulers', 'dasha_periods', 'current_dasha',
+               'current_antardasha', 'dasha_timeline', 'ascendant', 'asc_sign_name')
+
+# One packed chart; 'vargas' is a bit mask over VARGA_DIVISIONS and 'as_of_jd' is NaN when unset
+CHART_DTYPE = np.dtype([
+    ('longitudes', '<f8', (len(PLANETS),)), ('ascendant', '<f8'), ('birth_jd', '<f8'), ('epoch_jd', '<f8'),
+    ('as_of_jd', '<f8'), ('dasha_start', 'u1'), ('vargas', '<u2'),
+])
+VARGA_BITS = {name: 1 << bit for bit, name in enumerate(VARGA_DIVISIONS)}
+
+
+def get_planetary_strength(planet, sign):
+    """
+    Determines the strength of a planet based on its sign.
+    Returns:
+        strength: String indicating the strength ('Strong', 'Exalted', 'Debilitated', 'Weak', 'Neutral')
+        is_benefic: Boolean indicating if the planet is benefic
+    """
+    # Define benefic and malefic planets
+    benefics = ['Sun', 'Venus', 'Jupiter', 'Mercury', 'Moon']
+    malefics = ['Mars', 'Saturn', 'Rahu', 'Ketu']
+
+    # Define exaltation and debilitation signs
+    exaltation = {
+        'Sun': 'Aries',
+        'Moon': 'Taurus',
+        'Mars': 'Capricorn',
+        'Mercury': 'Virgo',
+        'Jupiter': 'Cancer',
+        'Venus': 'Pisces',
+        'Saturn': 'Libra'
+        # Rahu and Ketu have no exaltation/debilitation
+    }
+
+    debilitation = {
+        'Sun': 'Libra',
+        'Moon': 'Scorpio',
+        'Mars': 'Cancer',
+        'Mercury': 'Pisces',
+        'Jupiter': 'Capricorn',
+        'Venus': 'Virgo',
+        'Saturn': 'Aries'
+        # Rahu and Ketu have no exaltation/debilitation
+    }
+
+    # Define own signs
+    own_signs = {
+        'Sun': ['Leo'],
+        'Moon': ['Cancer'],
+        'Mars': ['Aries', 'Scorpio'],
+        'Mercury': ['Gemini', 'Virgo'],
+        'Jupiter': ['Sagittarius', 'Pisces'],
+        'Venus': ['Taurus', 'Libra'],
+        'Saturn': ['Capricorn', 'Aquarius']
+        # Rahu and Ketu do not have own signs
+    }
+
+    # Determine strength
+    if planet in exaltation and sign == exaltation[planet]:
+        strength = 'Exalted'
+    elif planet in debilitation and sign == debilitation[planet]:
+        strength = 'Debilitated'
+    elif planet in own_signs and sign in own_signs[planet]:
+        strength = 'Strong'
+    elif planet in malefics and sign in ['Cancer', 'Capricorn', 'Virgo', 'Pisces']:
+        strength = 'Weak'
+    elif planet in benefics and sign in ['Scorpio', 'Libra', 'Capricorn', 'Aquarius']:
+        strength = 'Weak'
+    else:
+        strength = 'Neutral'
+
+    # Determine if benefic
+    is_benefic = planet in benefics
+
+    return strength, is_benefic
+
+
+# Strength code of each planet in each sign, and the benefic flag of each planet
+STRENGTH_TABLE = np.array(
+    [[STRENGTHS.index(get_planetary_strength(planet, sign)[0]) for sign in SIGN_NAMES] for planet in PLANETS],
+    dtype=np.int8,
+)
+BENEFIC = np.array([get_planetary_strength(planet, SIGN_NAMES[0])[1] for planet in PLANETS])
+
+
+def _period_dict(period, date_format=None):
+    """
+    Formats an ACTIVE_DTYPE row as {'planet', 'start_date', 'end_date'}, with datetimes
+    or, given date_format, strings.
+    """
+    start_date, end_date = jd_to_datetime(period['start_jd']), jd_to_datetime(period['end_jd'])
+    if date_format:
+        start_date, end_date = start_date.strftime(date_format), end_date.strftime(date_format)
+    return {'planet': DASHA_PLANETS[period['planet']], 'start_date': start_date, 'end_date': end_date}
+
+
+class Chart:
+    """
+    A Kundali chart with lazily derived views.
+
+    Parameters:
+        longitudes (array-like): Sidereal longitudes in PLANETS order.
+        ascendant (float): Sidereal longitude of the ascendant.
+        birth_jd (float): Julian Day (UT) of birth.
+        dasha_timeline (DashaTimeline): Built from the Moon when not given.
+        as_of_jd (float): Julian Day the current Dasha periods refer to; None for a
+            time-invariant chart, which has no current periods.
+        varga_names (list): Divisional charts served by `vargas` (see vargas.py).
+    """
+    __slots__ = ('longitudes', 'ascendant', 'birth_jd', 'dasha_timeline', 'as_of_jd', 'varga_names', '_views')
+
+    def __init__(self, longitudes, ascendant, birth_jd, dasha_timeline=None, as_of_jd=None, varga_names=None):
+        self.longitudes = np.array(longitudes, dtype=np.float64)
+        self.longitudes.flags.writeable = False
+        self.ascendant = float(ascendant)
+        self.birth_jd = float(birth_jd)
+        self.dasha_timeline = dasha_timeline or DashaTimeline.from_moon(self.birth_jd, self.longitudes[1])
+        self.as_of_jd = None if as_of_jd is None else float(as_of_jd)
+        # Kept in VARGA_DIVISIONS order so that packing round-trips
+        names = set(varga_names or ())
+        self.varga_names = tuple(name for name in VARGA_DIVISIONS if name in names)
+        self._views = None
+
+    def at(self, as_of_jd=None, varga_names=None):
+        """
+        Returns a chart sharing this one's positions, with current Dasha periods as of a
+        Julian Day (now by default) and the given vargas. Cached charts are never changed.
+        """
+        chart = Chart.__new__(Chart)
+        chart.longitudes = self.longitudes
+        chart.ascendant = self.ascendant
+        chart.birth_jd = self.birth_jd
+        chart.dasha_timeline = self.dasha_timeline
+        chart.as_of_jd = datetime_to_jd(datetime.utcnow()) if as_of_jd is None else float(as_of_jd)
+        names = set(varga_names or ())
+        chart.varga_names = tuple(name for name in VARGA_DIVISIONS if name in names)
+        chart._views = None
+        return chart
+
+    def __repr__(self):
+        return (f"Chart(birth_jd={self.birth_jd!r}, ascendant={self.ascendant!r}, "
+                f"as_of_jd={self.as_of_jd!r}, varga_names={self.varga_names!r})")
+
+    def _view(self, name, build):
+        if self._views is None:
+            self._views = {}
+        if name not in self._views:
+            self._views[name] = build()
+        return self._views[name]
+
+    def seed_view(self, name, value):
+        """
+        Stores a view computed elsewhere (such as a batch's varga arrays) on the chart.
+        """
+        if self._views is None:
+            self._views = {}
+        self._views[name] = value
+
+    # Integer codes
+
+    @property
+    def signs(self):
+        return (self.longitudes // 30.0).astype(np.int8) % 12 + 1
+
+    @property
+    def asc_sign(self):
+        return int(self.ascendant // 30.0) % 12 + 1
+
+    @property
+    def houses(self):
+        return (self.signs - self.asc_sign) % 12 + 1
+
+    @property
+    def house_lords(self):
+        """
+        Planet code of the lord of houses 1 to 12.
+        """
+        return SIGN_LORDS[(self.asc_sign - 1 + np.arange(12)) % 12]
+
+    @property
+    def strengths(self):
+        """
+        Strength code (index into STRENGTHS) of each planet.
+        """
+        return STRENGTH_TABLE[np.arange(len(PLANETS)), self.signs - 1]
+
+    @property
+    def current_periods(self):
+        """
+        The Mahadasha and Antardasha active at as_of_jd, as ACTIVE_DTYPE rows.
+        """
+        def build():
+            if self.as_of_jd is None:
+                return np.empty(0, dtype=ACTIVE_DTYPE)
+            return self.dasha_timeline.active_at(self.as_of_jd, 2)
+        return self._view('current_periods', build)
+
+    @property
+    def varga_arrays(self):
+        """
+        (planet signs, houses, ascendant signs) of this chart's vargas, from `calculate_vargas`.
+        """
+        def build():
+            planet_signs, houses, ascendant_signs = calculate_vargas(
+                self.longitudes[None, :], [self.ascendant], self.varga_names
+            )
+            return planet_signs[0], houses[0], ascendant_signs[0]
+        return self._view('varga_arrays', build)
+
+    # Report views
+
+    @property
+    def asc_sign_name(self):
+        return SIGN_NAMES[self.asc_sign - 1]
+
+    @property
+    def planetary_positions(self):
+        return self._view('planetary_positions', lambda: dict(zip(PLANETS, self.longitudes.tolist())))
+
+    @property
+    def planetary_signs(self):
+        return self._view('planetary_signs', lambda: {
+            planet: SIGN_NAMES[sign - 1] for planet, sign in zip(PLANETS, self.signs.tolist())
+        })
+
+    @property
+    def planet_in_houses(self):
+        return self._view('planet_in_houses', lambda: dict(zip(PLANETS, self.houses.tolist())))
+
+    @property
+    def house_rulers(self):
+        return self._view('house_rulers', lambda: {
+            house: PLANETS[lord] for house, lord in enumerate(self.house_lords.tolist(), start=1)
+        })
+
+    @property
+    def planets(self):
+        """
+        Per-planet details: house, house ruler, strength, benefic, position and sign.
+        """
+        def build():
+            lords = self.house_lords
+            return {
+                planet: {
+                    'house': house,
+                    'house_ruler': PLANETS[lords[house - 1]],
+                    'strength': STRENGTHS[strength],
+                    'benefic': bool(BENEFIC[index]),
+                    'position': position,
+                    'planetary_sign': SIGN_NAMES[sign - 1],
+                }
+                for index, (planet, house, strength, position, sign) in enumerate(zip(
+                    PLANETS, self.houses.tolist(), self.strengths.tolist(), self.longitudes.tolist(),
+                    self.signs.tolist()
+                ))
+            }
+        return self._view('planets', build)
+
+    @property
+    def dasha_periods(self):
+        return self._view('dasha_periods', self.dasha_timeline.mahadashas)
+
+    @property
+    def current_dasha(self):
+        periods = self.current_periods
+        return _period_dict(periods[0]) if len(periods) > 0 else None
+
+    @property
+    def current_antardasha(self):
+        periods = self.current_periods
+        return _period_dict(periods[1]) if len(periods) > 1 else None
+
+    @property
+    def mahadasha(self):
+        periods = self.current_periods
+        return _period_dict(periods[0], '%Y-%m-%d') if len(periods) > 0 else {}
+
+    @property
+    def antardasha(self):
+        periods = self.current_periods
+        return _period_dict(periods[1], '%Y-%m-%d') if len(periods) > 1 else {}
+
+    @property
+    def vargas(self):
+        if not self.varga_names:
+            return {}
+        return self._view('vargas', lambda: varga_report(PLANETS, *self.varga_arrays, self.varga_names))
+
+    @property
+    def kundali_summary(self):
+        """
+        Detailed summary of the chart, used as context for the chatbot.
+        """
+        def build():
+            summary = "Kundali Report Summary:\n"
+            summary += f"Ascendant (Lagna): {self.asc_sign_name} ({self.ascendant:.2f}°)\n\n"
+            summary += "Planetary Positions:\n"
+            for planet, details in self.planets.items():
+                summary += (f"{planet}: {details['position']:.2f}° in {details['planetary_sign']}, "
+                            f"House {details['house']} ({details['house_ruler']}), "
+                            f"Strength: {details['strength']}, Nature: {'Benefic' if details['benefic'] else 'Malefic'}\n")
+
+            mahadasha, antardasha = self.mahadasha, self.antardasha
+            summary += "\nCurrent Mahadasha: "
+            if mahadasha:
+                summary += f"{mahadasha['planet']} (from {mahadasha['start_date']} to {mahadasha['end_date']})\n"
+            else:
+                summary += "Not Found\n"
+
+            summary += "Current Antardasha: "
+            if antardasha:
+                summary += f"{antardasha['planet']} (from {antardasha['start_date']} to {antardasha['end_date']})\n"
+            else:
+                summary += "No current Antardasha found.\n"
+            return summary
+        return self._view('kundali_summary', build)
+
+    @property
+    def kundali_summary_compact(self):
+        """
+        The same facts as `kundali_summary` as a fixed-schema table, which takes far fewer
+        prompt tokens. Degrees are given within the sign.
+        """
+        def build():
+            lines = [
+                "Kundali (sidereal, whole sign houses)",
+                f"Asc {self.asc_sign_name} {self.ascendant % 30:.2f}",
+                "planet sign deg house lord strength nature",
+            ]
+            for planet, details in self.planets.items():
+                lines.append(
+                    f"{planet} {details['planetary_sign']} {details['position'] % 30:.2f} {details['house']} "
+                    f"{details['house_ruler']} {STRENGTH_CODES[details['strength']]} "
+                    f"{'B' if details['benefic'] else 'M'}"
+                )
+            for period, current in (('Mahadasha', self.mahadasha), ('Antardasha', self.antardasha)):
+                if current:
+                    lines.append(f"{period} {current['planet']} {current['start_date']}..{current['end_date']}")
+                else:
+                    lines.append(f"{period} none")
+            lines.append("Codes: Ex exalted, Db debilitated, Own own sign, Wk weak, Nt neutral; B benefic, M malefic")
+            return "\n".join(lines) + "\n"
+        return self._view('kundali_summary_compact', build)
+
+    # Dict report compatibility
+
+    def keys(self):
+        return list(PLANETS) + list(REPORT_KEYS) + (['vargas'] if self.varga_names else [])
+
+    def __getitem__(self, key):
+        if key in PLANETS:
+            return self.planets[key]
+        if key == 'Mahadasha':
+            return self.mahadasha
+        if key == 'Antardasha':
+            return self.antardasha
+        if key in REPORT_KEYS or (key == 'vargas' and self.varga_names):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in PLANETS or key in REPORT_KEYS or (key == 'vargas' and bool(self.varga_names))
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def to_dict(self):
+        """
+        Returns the chart as the dict report `calculate_kundali` used to return.
+        """
+        return {key: self[key] for key in self.keys()}
+
+    # Packed form
+
+    def to_bytes(self):
+        return pack_charts([self]).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        return unpack_charts(data)[0]
+
+    def __reduce__(self):
+        return (Chart.from_bytes, (self.to_bytes(),))
+
+
+def pack_charts(charts):
+    """
+    Packs charts into a CHART_DTYPE array. Derived views are not stored.
+    """
+    records = np.empty(len(charts), dtype=CHART_DTYPE)
+    for row, chart in enumerate(charts):
+        records[row] = (
+            chart.longitudes, chart.ascendant, chart.birth_jd, chart.dasha_timeline.epoch_jd,
+            np.nan if chart.as_of_jd is None else chart.as_of_jd, chart.dasha_timeline.start,
+            sum(VARGA_BITS[name] for name in chart.varga_names),
+        )
+    return records
+
+
+def unpack_charts(records):
+    """
+    Rebuilds charts from a CHART_DTYPE array or its bytes.
+    """
+    if isinstance(records, (bytes, bytearray, memoryview)):
+        records = np.frombuffer(records, dtype=CHART_DTYPE)
+    charts = []
+    for record in records:
+        birth_jd = float(record['birth_jd'])
+        as_of_jd = float(record['as_of_jd'])
+        charts.append(Chart(
+            record['longitudes'], record['ascendant'], birth_jd,
+            DashaTimeline(birth_jd, record['epoch_jd'], record['dasha_start']),
+            None if np.isnan(as_of_jd) else as_of_jd,
+            [name for name, bit in VARGA_BITS.items() if int(record['vargas']) & bit],
+        ))
+    return charts
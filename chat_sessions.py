@@ -0,0 +1,212 @@
+# chat_sessions.py
+
+import os
+import re
+import time
+import uuid
+
+from cache_utils import LRUCache, SQLiteCache, TieredCache
+
+try:
+    import tiktoken
+except ImportError:  # Optional: token counts fall back to an estimate
+    tiktoken = None
+
+# Sessions live in memory, and optionally in a SQLite file shared by all workers
+SESSION_CACHE_SIZE = int(os.environ.get('KUNDALI_CHAT_SESSION_CACHE_SIZE', '10000'))
+SESSION_TTL_SECONDS = float(os.environ.get('KUNDALI_CHAT_SESSION_TTL', str(6 * 3600)))
+SESSION_PATH = os.environ.get('KUNDALI_CHAT_SESSION_PATH')
+
+# Prompt size limits, in tokens. Older turns that no longer fit are folded into a short
+# summary of the earlier conversation, itself capped at SUMMARY_TOKEN_BUDGET.
+HISTORY_TOKEN_BUDGET = int(os.environ.get('KUNDALI_CHAT_TOKEN_BUDGET', '6000'))
+SUMMARY_TOKEN_BUDGET = int(os.environ.get('KUNDALI_CHAT_SUMMARY_TOKENS', '300'))
+TOKENS_PER_MESSAGE = 4  # Role and separators added by the chat format
+SUMMARY_NOTE_CHARS = 120
+ESTIMATE_PATTERN = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+_encodings = {}
+
+
+def estimate_tokens(text):
+    """
+    Estimates a BPE token count without a tokenizer: roughly one token per word,
+    per group of up to three digits and per punctuation mark.
+    """
+    return len(ESTIMATE_PATTERN.findall(text))
+
+
+def count_tokens(text, model_id="gpt-4"):
+    """
+    Counts the tokens in text with tiktoken when it is installed and its encoding is
+    available, otherwise estimates them with `estimate_tokens`.
+    """
+    if tiktoken is None:
+        return estimate_tokens(text)
+    if model_id not in _encodings:
+        try:
+            try:
+                _encodings[model_id] = tiktoken.encoding_for_model(model_id)
+            except KeyError:
+                # Fine-tuned and unknown model names use the GPT-4 encoding
+                _encodings[model_id] = tiktoken.get_encoding('cl100k_base')
+        except Exception:
+            # The encoding files could not be loaded (for example when offline)
+            _encodings[model_id] = None
+    encoding = _encodings[model_id]
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text))
+
+
+def token_counter_name(model_id="gpt-4"):
+    """
+    Returns 'tiktoken' if token counts for model_id are exact, or 'estimate'.
+    """
+    count_tokens('', model_id)
+    return 'tiktoken' if _encodings.get(model_id) is not None else 'estimate'
+
+
+def count_message_tokens(messages, model_id="gpt-4"):
+    """
+    Counts the prompt tokens of a list of chat messages.
+    """
+    return sum(TOKENS_PER_MESSAGE + count_tokens(message['content'], model_id) for message in messages)
+
+
+def summarize_turn(turn):
+    """
+    Condenses one turn into a short note: its first sentence, truncated.
+    """
+    text = ' '.join(turn['content'].split())
+    first_sentence = re.split(r'(?<=[.?!])\s', text, maxsplit=1)[0]
+    if len(first_sentence) > SUMMARY_NOTE_CHARS:
+        first_sentence = first_sentence[:SUMMARY_NOTE_CHARS - 3].rstrip() + '...'
+    prefix = 'User asked' if turn['role'] == 'user' else 'You answered'
+    return f"{prefix}: {first_sentence}"
+
+
+def new_session(kundali_summary, session_id=None):
+    """
+    Creates a chat session holding the chart summary and no turns yet.
+    """
+    return {
+        'session_id': session_id or uuid.uuid4().hex,
+        'kundali_summary': kundali_summary,
+        'summary_notes': [],
+        'turns': [],
+        'created_at': time.time(),
+        # Bumped on every save, so a save can tell whether another turn got in first
+        'version': 0,
+    }
+
+
+def trim_session(session, system_prompt, token_budget=HISTORY_TOKEN_BUDGET, model_id="gpt-4"):
+    """
+    Folds the oldest turns into the session's summary notes until the prompt (system
+    prompt, summary and remaining turns) fits token_budget. The newest turn is always kept.
+
+    Returns:
+        int: The prompt size in tokens after trimming.
+    """
+    turn_tokens = [TOKENS_PER_MESSAGE + count_tokens(turn['content'], model_id) for turn in session['turns']]
+    fixed_tokens = count_message_tokens([{'content': system_prompt}], model_id)
+    summary_tokens = sum(count_tokens(note, model_id) for note in session['summary_notes'])
+
+    while len(session['turns']) > 1 and fixed_tokens + summary_tokens + sum(turn_tokens) > token_budget:
+        note = summarize_turn(session['turns'].pop(0))
+        turn_tokens.pop(0)
+        session['summary_notes'].append(note)
+        summary_tokens += count_tokens(note, model_id)
+        while len(session['summary_notes']) > 1 and summary_tokens > SUMMARY_TOKEN_BUDGET:
+            summary_tokens -= count_tokens(session['summary_notes'].pop(0), model_id)
+
+    return fixed_tokens + summary_tokens + sum(turn_tokens)
+
+
+def session_messages(session, system_prompt):
+    """
+    Builds the conversation history sent to the model for a session.
+    """
+    if session['summary_notes']:
+        system_prompt += "\n\nEarlier in this conversation:\n" + "\n".join(session['summary_notes'])
+    return [{"role": "system", "content": system_prompt}] + [
+        {"role": turn['role'], "content": turn['content']} for turn in session['turns']
+    ]
+
+
+class SessionStore:
+    """
+    Chat sessions keyed by session id, kept in an in-memory LRU and optionally
+    persisted to SQLite so that every worker process (and restarts) can resume them.
+
+    Parameters:
+        max_entries (int): Sessions kept in memory.
+        ttl_seconds (float): Idle time after which a session expires.
+        path (str): SQLite file for persistence (None for memory only).
+    """
+    def __init__(self, max_entries=SESSION_CACHE_SIZE, ttl_seconds=SESSION_TTL_SECONDS, path=SESSION_PATH):
+        disk = SQLiteCache(path, max_entries=None, ttl_seconds=ttl_seconds) if path else None
+        self._cache = TieredCache(LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds), disk)
+
+    def get(self, session_id):
+        return self._cache.get(f"session:{session_id}")
+
+    def save(self, session, new_turns=None):
+        """
+        Stores a session. With new_turns (the turns added since the session was opened),
+        a save that finds the session was saved by another request in the meantime
+        appends new_turns to the stored session instead of overwriting it, so concurrent
+        turns of one conversation keep each other's messages. The check and the write
+        are atomic, across processes when the sessions are persisted.
+
+        Returns:
+            dict: The session as stored.
+        """
+        version = session.get('version', 0)
+
+        def merge(stored):
+            if stored is None or new_turns is None or stored.get('version', 0) == version:
+                return dict(session, version=version + 1)
+            return dict(stored, turns=list(stored['turns']) + list(new_turns), version=stored.get('version', 0) + 1)
+
+        saved = self._cache.update(f"session:{session['session_id']}", merge)
+        session['version'] = saved['version']
+        return saved
+
+    def delete(self, session_id):
+        self._cache.delete(f"session:{session_id}")
+
+    def open(self, session_id=None, kundali_summary=None):
+        """
+        Returns the session for session_id, or a new one for kundali_summary when no id
+        is given or the session does not exist (or has expired). A new summary replaces
+        the stored one; changes are only kept once the session is saved. Raises KeyError
+        for an unknown session without a summary.
+        """
+        session = self.get(session_id) if session_id else None
+        if session is None:
+            if session_id and kundali_summary is None:
+                raise KeyError(f"Unknown or expired chat session: {session_id}")
+            return new_session(kundali_summary or '', session_id)
+        # Work on a copy so a failed turn never leaks into the stored session
+        session = dict(session, summary_notes=list(session['summary_notes']), turns=list(session['turns']))
+        if kundali_summary:
+            session['kundali_summary'] = kundali_summary
+        return session
+
+    def stats(self):
+        return self._cache.stats()
+
+
+_session_store = None
+
+
+def get_session_store():
+    """
+    Returns the shared SessionStore, creating it on first use.
+    """
+    global _session_store
+    if _session_store is None:
+        _session_store = SessionStore()
+    return _session_store
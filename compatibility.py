@@ -0,0 +1,322 @@
+# compatibility.py
+"""
+Ashtakoota (eight koota, 36 point) compatibility from the Moon's sidereal longitude.
+
+Every koota depends only on the Moon's nakshatra, rasi or half-rasi (Vashya), and all
+three are whole multiples of 1/216 of the zodiac (a half pada of 1°40'). So a Moon
+position reduces to one of 216 units, the kootas are precomputed as 27x27, 12x12 and
+24x24 tables, and their sum is folded into one 216x216 table of totals. Scoring a
+query against a pool is a single NumPy gather of that table's row over the pool's
+unit array; `top_matches` then keeps the best k with a bounded heap over chunks.
+
+Tables follow the common North Indian conventions. Scores are oriented from the
+groom to the bride where a koota is asymmetric (Varna, Tara counting, Gana).
+"""
+
+import heapq
+import os
+
+import numpy as np
+
+from kundali_calculations import calculate_kundali_batch
+
+UNITS = 216
+UNIT_DEGREES = 360.0 / UNITS
+MATCH_CHUNK_SIZE = 1 << 16
+# Request limits for `match_batch`
+MAX_MATCH_CANDIDATES = int(os.environ.get('KUNDALI_MATCH_MAX_CANDIDATES', '1000000'))
+MAX_MATCH_RESULTS = 1000
+
+KOOTAS = ['varna', 'vashya', 'tara', 'yoni', 'graha_maitri', 'gana', 'bhakoot', 'nadi']
+ROLES = ['groom', 'bride']
+
+# Varna by sign (Aries first): 3 Brahmin, 2 Kshatriya, 1 Vaishya, 0 Shudra
+SIGN_VARNA = np.array([2, 1, 0, 3, 2, 1, 0, 3, 2, 1, 0, 3])
+# Vashya by half sign: 0 Chatushpada, 1 Manava, 2 Jalachara, 3 Vanachara, 4 Keeta
+HALF_SIGN_VASHYA = np.array([0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 1, 1, 1, 1, 4, 4, 1, 0, 0, 2, 1, 1, 2, 2])
+VASHYA_POINTS = np.array([
+    [2.0, 1.0, 1.0, 0.5, 1.0],
+    [1.0, 2.0, 0.5, 0.0, 1.0],
+    [1.0, 0.5, 2.0, 1.0, 1.0],
+    [0.5, 0.0, 1.0, 2.0, 0.0],
+    [1.0, 1.0, 1.0, 0.0, 2.0],
+])
+# Yoni animal by nakshatra: Horse, Elephant, Sheep, Serpent, Dog, Cat, Rat, Cow,
+# Buffalo, Tiger, Deer, Monkey, Mongoose, Lion
+NAKSHATRA_YONI = np.array([0, 1, 2, 3, 3, 4, 5, 2, 5, 6, 6, 7, 8, 9, 8, 9, 10, 10, 4, 11, 12, 11, 13, 0, 13, 7, 1])
+YONI_POINTS = np.array([
+    [4, 2, 2, 3, 2, 2, 2, 1, 0, 1, 3, 3, 2, 1],
+    [2, 4, 3, 3, 2, 2, 2, 2, 3, 1, 2, 3, 2, 0],
+    [2, 3, 4, 2, 1, 2, 1, 3, 3, 1, 2, 0, 3, 1],
+    [3, 3, 2, 4, 2, 1, 1, 1, 1, 2, 2, 2, 0, 2],
+    [2, 2, 1, 2, 4, 2, 1, 2, 2, 1, 0, 2, 1, 1],
+    [2, 2, 2, 1, 2, 4, 0, 2, 2, 1, 3, 3, 2, 1],
+    [2, 2, 1, 1, 1, 0, 4, 2, 2, 2, 2, 2, 1, 2],
+    [1, 2, 3, 1, 2, 2, 2, 4, 3, 0, 3, 2, 2, 1],
+    [0, 3, 3, 1, 2, 2, 2, 3, 4, 1, 2, 2, 2, 1],
+    [1, 1, 1, 2, 1, 1, 2, 0, 1, 4, 1, 1, 2, 1],
+    [3, 2, 2, 2, 0, 3, 2, 3, 2, 1, 4, 2, 2, 1],
+    [3, 3, 0, 2, 2, 3, 2, 2, 2, 1, 2, 4, 3, 2],
+    [2, 2, 3, 0, 1, 2, 1, 2, 2, 2, 2, 3, 4, 2],
+    [1, 0, 1, 2, 1, 1, 2, 1, 1, 1, 1, 2, 2, 4],
+], dtype=np.float64)
+# Sign lords (Aries first) as indices into MAITRI_PLANETS, and their natural relationships:
+# 2 friend, 1 neutral, 0 enemy (row planet's view of the column planet)
+MAITRI_PLANETS = ['Sun', 'Moon', 'Mars', 'Mercury', 'Jupiter', 'Venus', 'Saturn']
+SIGN_LORD = np.array([2, 5, 3, 1, 0, 3, 5, 2, 4, 6, 6, 4])
+RELATIONSHIP = np.array([
+    [2, 2, 2, 1, 2, 0, 0],
+    [2, 2, 1, 2, 1, 1, 1],
+    [2, 2, 2, 0, 2, 1, 1],
+    [2, 0, 1, 2, 1, 2, 1],
+    [2, 2, 2, 0, 2, 0, 1],
+    [0, 0, 1, 2, 1, 2, 2],
+    [0, 0, 0, 2, 1, 2, 2],
+])
+# Points by (groom's view, bride's view), sorted so the pair order does not matter
+MAITRI_POINTS = {(2, 2): 5.0, (1, 2): 4.0, (1, 1): 3.0, (0, 2): 1.0, (0, 1): 0.5, (0, 0): 0.0}
+# Gana by nakshatra: 0 Deva, 1 Manushya, 2 Rakshasa; points indexed [groom, bride]
+NAKSHATRA_GANA = np.array([0, 1, 2, 1, 0, 1, 0, 0, 2, 2, 1, 1, 0, 2, 0, 2, 0, 2, 2, 1, 1, 0, 2, 2, 1, 1, 0])
+GANA_POINTS = np.array([
+    [6.0, 6.0, 0.0],
+    [5.0, 6.0, 0.0],
+    [1.0, 0.0, 6.0],
+])
+# Nadi by nakshatra: 0 Adi, 1 Madhya, 2 Antya
+NAKSHATRA_NADI = np.array([0, 1, 2, 2, 1, 0, 0, 1, 2, 2, 1, 0, 0, 1, 2, 2, 1, 0, 0, 1, 2, 2, 1, 0, 0, 1, 2])
+
+
+def _nakshatra_tables():
+    """
+    Tara, Yoni, Gana and Nadi points indexed [groom nakshatra, bride nakshatra].
+    """
+    groom, bride = np.meshgrid(np.arange(27), np.arange(27), indexing='ij')
+    # Tara: count each way, inclusive; remainders 3, 5 and 7 (of 9) are inauspicious
+    def auspicious(count):
+        return ~np.isin(count % 9, [3, 5, 7])
+    tara = 1.5 * auspicious((groom - bride) % 27 + 1) + 1.5 * auspicious((bride - groom) % 27 + 1)
+    yoni = YONI_POINTS[NAKSHATRA_YONI[groom], NAKSHATRA_YONI[bride]]
+    gana = GANA_POINTS[NAKSHATRA_GANA[groom], NAKSHATRA_GANA[bride]]
+    nadi = np.where(NAKSHATRA_NADI[groom] == NAKSHATRA_NADI[bride], 0.0, 8.0)
+    return {'tara': tara, 'yoni': yoni, 'gana': gana, 'nadi': nadi}
+
+
+def _sign_tables():
+    """
+    Varna, Graha Maitri and Bhakoot points indexed [groom sign, bride sign].
+    """
+    groom, bride = np.meshgrid(np.arange(12), np.arange(12), indexing='ij')
+    varna = (SIGN_VARNA[groom] >= SIGN_VARNA[bride]).astype(np.float64)
+    groom_view = RELATIONSHIP[SIGN_LORD[groom], SIGN_LORD[bride]]
+    bride_view = RELATIONSHIP[SIGN_LORD[bride], SIGN_LORD[groom]]
+    same_lord = SIGN_LORD[groom] == SIGN_LORD[bride]
+    maitri = np.vectorize(lambda a, b: MAITRI_POINTS[tuple(sorted((a, b)))])(groom_view, bride_view)
+    maitri = np.where(same_lord, 5.0, maitri)
+    # Bhakoot: 2/12, 5/9 and 6/8 sign relationships score nothing
+    distance = (bride - groom) % 12 + 1
+    bhakoot = np.where(np.isin(distance, [2, 12, 5, 9, 6, 8]), 0.0, 7.0)
+    return {'varna': varna, 'graha_maitri': maitri, 'bhakoot': bhakoot}
+
+
+def _unit_tables():
+    """
+    Every koota as a 216x216 table indexed [groom unit, bride unit].
+    """
+    units = np.arange(UNITS)
+    nakshatra = units // 8
+    sign = units // 18
+    half_sign = units // 9
+    groom, bride = np.meshgrid(units, units, indexing='ij')
+    tables = {}
+    for koota, table in _nakshatra_tables().items():
+        tables[koota] = table[nakshatra[groom], nakshatra[bride]]
+    for koota, table in _sign_tables().items():
+        tables[koota] = table[sign[groom], sign[bride]]
+    tables['vashya'] = VASHYA_POINTS[HALF_SIGN_VASHYA[half_sign[groom]], HALF_SIGN_VASHYA[half_sign[bride]]]
+    return np.stack([tables[koota] for koota in KOOTAS]).astype(np.float32)
+
+
+KOOTA_TABLES = _unit_tables()
+TOTAL_TABLE = KOOTA_TABLES.sum(axis=0)
+
+
+def moon_units(moon_longitudes):
+    """
+    Maps Moon sidereal longitudes to their 1/216 zodiac units (uint8).
+    """
+    longitudes = np.asarray(moon_longitudes, dtype=np.float64) % 360.0
+    return np.minimum((longitudes / UNIT_DEGREES).astype(np.int64), UNITS - 1).astype(np.uint8)
+
+
+def _check_role(role):
+    if role not in ROLES:
+        raise ValueError(f"Role must be one of {ROLES}, got {role!r}.")
+
+
+def _score_row(moon_longitude, role):
+    """
+    The totals of one chart against every unit, oriented by its role.
+    """
+    _check_role(role)
+    query_unit = int(moon_units([moon_longitude])[0])
+    row = TOTAL_TABLE[query_unit, :] if role == 'groom' else TOTAL_TABLE[:, query_unit]
+    return np.ascontiguousarray(row)
+
+
+def score_candidates(moon_longitude, candidate_units, role='groom'):
+    """
+    Total Ashtakoota points of one chart against every candidate.
+
+    Parameters:
+        moon_longitude (float): The query chart's Moon sidereal longitude.
+        candidate_units (numpy.ndarray): Candidate units from `moon_units`.
+        role (str): The query chart's role, 'groom' or 'bride'.
+
+    Returns:
+        numpy.ndarray: float32 points out of 36 per candidate.
+    """
+    return _score_row(moon_longitude, role)[candidate_units]
+
+
+def koota_breakdown(moon_longitude, candidate_longitude, role='groom'):
+    """
+    Points of each koota for one pair.
+
+    Returns:
+        dict: Koota name to points, plus 'total'.
+    """
+    _check_role(role)
+    query_unit, candidate_unit = (int(unit) for unit in moon_units([moon_longitude, candidate_longitude]))
+    if role == 'groom':
+        points = KOOTA_TABLES[:, query_unit, candidate_unit]
+    else:
+        points = KOOTA_TABLES[:, candidate_unit, query_unit]
+    breakdown = {koota: float(value) for koota, value in zip(KOOTAS, points)}
+    breakdown['total'] = float(points.sum())
+    return breakdown
+
+
+def top_matches(moon_longitude, candidate_units, k=10, role='groom', min_score=0.0):
+    """
+    Finds the k best candidates. Candidates are scored in chunks of MATCH_CHUNK_SIZE;
+    each chunk's best k are pre-selected with `np.partition` and merged into a bounded
+    min-heap, so memory stays O(chunk + k) however large the pool is. Ties keep the
+    earlier candidate.
+
+    Returns:
+        list: (candidate position, points) pairs, best first.
+    """
+    row = _score_row(moon_longitude, role)
+    if k <= 0:
+        return []
+
+    heap = []  # (points, -position): the root is the weakest match kept so far
+    for chunk_start in range(0, len(candidate_units), MATCH_CHUNK_SIZE):
+        scores = row[candidate_units[chunk_start:chunk_start + MATCH_CHUNK_SIZE]]
+        if len(scores) > k:
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+            best = np.flatnonzero(scores > threshold)
+            ties = np.flatnonzero(scores == threshold)[:k - len(best)]
+            best = np.concatenate([best, ties])
+        else:
+            best = np.arange(len(scores))
+        for position, points in zip(best.tolist(), scores[best].tolist()):
+            if points < min_score:
+                continue
+            entry = (points, -(chunk_start + position))
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    return [(-negative_position, points) for points, negative_position in sorted(heap, reverse=True)]
+
+
+class CandidatePool:
+    """
+    Stored charts for matching, kept as an id list and a uint8 unit array.
+
+    Parameters:
+        ids (list): Candidate identifiers.
+        moon_longitudes (list): Each candidate's Moon sidereal longitude.
+    """
+    def __init__(self, ids, moon_longitudes):
+        if len(ids) != len(moon_longitudes):
+            raise ValueError("Every candidate needs exactly one Moon longitude.")
+        self.ids = list(ids)
+        self.moon_longitudes = np.asarray(moon_longitudes, dtype=np.float64)
+        self.units = moon_units(self.moon_longitudes)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def top_matches(self, moon_longitude, k=10, role='groom', min_score=0.0):
+        """
+        Returns the k best candidates as dicts with 'id', 'score' and the koota breakdown.
+        """
+        return [
+            {'id': self.ids[position], 'score': points,
+             'kootas': koota_breakdown(moon_longitude, self.moon_longitudes[position], role)}
+            for position, points in top_matches(moon_longitude, self.units, k, role, min_score)
+        ]
+
+
+def resolve_moon_longitudes(records, calculate_batch=calculate_kundali_batch):
+    """
+    Returns each record's Moon longitude: its 'moon_longitude' if given, otherwise
+    computed from its birth data in one `calculate_kundali_batch` call.
+
+    Returns:
+        list: Floats, or {'error': message} for records that could not be resolved.
+    """
+    longitudes = [None] * len(records)
+    pending = []
+    for index, record in enumerate(records):
+        if record.get('moon_longitude') is not None:
+            longitudes[index] = float(record['moon_longitude'])
+        else:
+            pending.append(index)
+    if pending:
+        reports = calculate_batch([records[index] for index in pending])
+        for index, report in zip(pending, reports):
+            longitudes[index] = report if 'error' in report else report['planetary_positions']['Moon']
+    return longitudes
+
+
+def match_batch(chart, candidates, k=10, role='groom', min_score=0.0, calculate_batch=calculate_kundali_batch):
+    """
+    Scores one chart against a batch of candidates and returns the best k.
+
+    Parameters:
+        chart (dict): 'moon_longitude', or 'date_of_birth', 'time_of_birth' and
+            'place_of_birth' (or 'latitude' and 'longitude').
+        candidates (list): Dicts like chart, each with an 'id'.
+        k (int): Number of matches (at most MAX_MATCH_RESULTS).
+        role (str): The chart's role, 'groom' or 'bride'.
+        min_score (float): Points below which candidates are dropped.
+        calculate_batch (callable): Computes reports for records given as birth data.
+
+    Returns:
+        dict: 'matches' (id, score and koota breakdown, best first) and 'errors'
+            (candidates whose Moon position could not be computed).
+    """
+    _check_role(role)
+    if len(candidates) > MAX_MATCH_CANDIDATES:
+        raise ValueError(f"At most {MAX_MATCH_CANDIDATES} candidates can be matched per request.")
+    k = min(int(k), MAX_MATCH_RESULTS)
+
+    resolved = resolve_moon_longitudes([chart] + list(candidates), calculate_batch)
+    if isinstance(resolved[0], dict):
+        raise ValueError(f"Could not calculate the chart: {resolved[0]['error']}")
+
+    ids, longitudes, errors = [], [], []
+    for position, (candidate, longitude) in enumerate(zip(candidates, resolved[1:])):
+        candidate_id = candidate.get('id', position)
+        if isinstance(longitude, dict):
+            errors.append({'id': candidate_id, 'error': longitude['error']})
+        else:
+            ids.append(candidate_id)
+            longitudes.append(longitude)
+
+    pool = CandidatePool(ids, longitudes)
+    return {'matches': pool.top_matches(resolved[0], k, role, min_score), 'errors': errors}
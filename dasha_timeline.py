@@ -0,0 +1,261 @@
+# dasha_timeline.py
+"""
+Vimshottari dasha hierarchy (Maha, Antar, Pratyantar, Sookshma and Prana dashas) as
+arrays of period boundaries.
+
+Every Vimshottari cycle has the same shape: its 120 years split into nine Mahadashas
+in the fixed sequence, each split into nine sub-periods starting from its own planet,
+and so on down. A chart only decides which planet the cycle starts from and when
+(the epoch, before birth by the elapsed part of the birth nakshatra). So boundaries
+are kept once per starting planet and depth, as day offsets from the epoch, and built
+lazily the first time a depth is asked for. A chart's timeline is then just
+(birth, epoch, start planet):
+
+- "which periods are active at T" is one `np.searchsorted` at the deepest level; the
+  enclosing periods are found by integer division of the period number by 9.
+- "all periods in [a, b]" is two searches and a slice of the shared arrays.
+
+Periods are returned as NumPy structured arrays (`period_dtype`), not dicts; use
+`period_records` to turn a slice into JSON-ready dicts.
+"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# Vimshottari sequence and period lengths in years
+DASHA_PLANETS = ['Ketu', 'Venus', 'Sun', 'Moon', 'Mars', 'Rahu', 'Jupiter', 'Saturn', 'Mercury']
+DASHA_YEARS = np.array([7, 20, 6, 10, 7, 18, 16, 19, 17], dtype=np.float64)
+DASHA_LEVELS = ['Mahadasha', 'Antardasha', 'Pratyantardasha', 'Sookshmadasha', 'Pranadasha']
+MAX_DEPTH = len(DASHA_LEVELS)
+
+DAYS_PER_YEAR = 365.25
+CYCLE_DAYS = DASHA_YEARS.sum() * DAYS_PER_YEAR
+NAKSHATRA_SPAN = 360.0 / 27.0
+UNIX_EPOCH_JD = 2440587.5
+
+# Row i holds the cumulative fractions of a period whose sub-periods start from planet i
+_ROTATIONS = (np.arange(9)[:, None] + np.arange(9)[None, :]) % 9
+_SUB_FRACTIONS = np.concatenate(
+    [np.zeros((9, 1)), np.cumsum(DASHA_YEARS[_ROTATIONS], axis=1) / DASHA_YEARS.sum()], axis=1
+)
+
+# (start planet, depth) -> (boundary offsets in days from the epoch, planet of each period)
+_levels = {}
+
+
+def jd_to_datetime(jd):
+    """
+    Converts a Julian Day (UT) to a naive UTC datetime.
+    """
+    return datetime(1970, 1, 1) + timedelta(days=float(jd) - UNIX_EPOCH_JD)
+
+
+def datetime_to_jd(moment):
+    """
+    Converts a naive UTC datetime to a Julian Day.
+    """
+    return UNIX_EPOCH_JD + (moment - datetime(1970, 1, 1)) / timedelta(days=1)
+
+
+def _level(start, depth):
+    """
+    Returns (offsets, planets) for one depth of a cycle starting from planet index start.
+    offsets has one more entry than planets: the end of the last period.
+    """
+    key = (start, depth)
+    if key not in _levels:
+        if depth == 1:
+            planets = _ROTATIONS[start].astype(np.int8)
+            offsets = _SUB_FRACTIONS[start] * CYCLE_DAYS
+        else:
+            parent_offsets, parent_planets = _level(start, depth - 1)
+            lengths = np.diff(parent_offsets)
+            starts = parent_offsets[:-1, None] + lengths[:, None] * _SUB_FRACTIONS[parent_planets, :9]
+            offsets = np.append(starts.ravel(), parent_offsets[-1])
+            planets = _ROTATIONS[parent_planets].astype(np.int8).ravel()
+        _levels[key] = (offsets, planets)
+    return _levels[key]
+
+
+def _check_depth(depth):
+    if not 1 <= depth <= MAX_DEPTH:
+        raise ValueError(f"Dasha depth must be between 1 and {MAX_DEPTH}, got {depth}.")
+
+
+def _lineage(start, indices, depth):
+    """
+    Planet indices of each period and its enclosing periods, shape (len(indices), depth).
+    """
+    lineage = np.empty((len(indices), depth), dtype=np.int8)
+    for level in range(1, depth + 1):
+        lineage[:, level - 1] = _level(start, level)[1][indices // 9 ** (depth - level)]
+    return lineage
+
+
+# One row per level for `DashaTimeline.active_at`
+ACTIVE_DTYPE = np.dtype([('level', 'i1'), ('planet', 'i1'), ('start_jd', '<f8'), ('end_jd', '<f8')])
+
+
+def period_dtype(depth):
+    """
+    Structured dtype of the periods at a depth: start and end Julian Days and the
+    planet indices from the Mahadasha down.
+    """
+    return np.dtype([('start_jd', '<f8'), ('end_jd', '<f8'), ('planets', 'i1', (depth,))])
+
+
+def period_records(periods):
+    """
+    Converts a periods array (from `periods_between` or `active_at`) into dicts with
+    the level, planet, lineage (periods arrays only) and dates.
+    """
+    records = []
+    for row in periods:
+        if 'planets' in periods.dtype.names:
+            lineage = [DASHA_PLANETS[planet] for planet in row['planets']]
+            record = {'level': DASHA_LEVELS[len(lineage) - 1], 'planet': lineage[-1], 'lineage': lineage}
+        else:
+            record = {'level': DASHA_LEVELS[row['level'] - 1], 'planet': DASHA_PLANETS[row['planet']]}
+        record['start_date'] = jd_to_datetime(row['start_jd']).strftime('%Y-%m-%d %H:%M')
+        record['end_date'] = jd_to_datetime(row['end_jd']).strftime('%Y-%m-%d %H:%M')
+        records.append(record)
+    return records
+
+
+class DashaTimeline:
+    """
+    The dasha hierarchy of one chart. Periods that began before birth are clipped to
+    the birth moment, and the timeline ends with the last Mahadasha of the cycle.
+
+    Parameters:
+        birth_jd (float): Julian Day (UT) of birth.
+        epoch_jd (float): Julian Day the birth Mahadasha began (before birth).
+        start (int): Index in DASHA_PLANETS of the birth Mahadasha.
+    """
+    __slots__ = ('birth_jd', 'epoch_jd', 'start')
+
+    def __init__(self, birth_jd, epoch_jd, start):
+        self.birth_jd = float(birth_jd)
+        self.epoch_jd = float(epoch_jd)
+        self.start = int(start)
+
+    @classmethod
+    def from_moon(cls, birth_jd, moon_lon):
+        """
+        Builds the timeline from the Moon's sidereal longitude at birth.
+        """
+        nakshatra = int((moon_lon % 360) / NAKSHATRA_SPAN)
+        start = nakshatra % 9
+        elapsed = ((moon_lon % 360) % NAKSHATRA_SPAN) / NAKSHATRA_SPAN
+        return cls(birth_jd, birth_jd - elapsed * DASHA_YEARS[start] * DAYS_PER_YEAR, start)
+
+    def __getstate__(self):
+        return (self.birth_jd, self.epoch_jd, self.start)
+
+    def __setstate__(self, state):
+        self.birth_jd, self.epoch_jd, self.start = state
+
+    def __repr__(self):
+        return f"DashaTimeline(birth_jd={self.birth_jd!r}, epoch_jd={self.epoch_jd!r}, start={self.start!r})"
+
+    @property
+    def end_jd(self):
+        return self.epoch_jd + CYCLE_DAYS
+
+    def _slice(self, first, last, depth):
+        """
+        Periods first..last-1 at a depth, clipped to birth.
+        """
+        offsets, _ = _level(self.start, depth)
+        periods = np.empty(max(last - first, 0), dtype=period_dtype(depth))
+        if len(periods):
+            periods['start_jd'] = np.maximum(self.epoch_jd + offsets[first:last], self.birth_jd)
+            periods['end_jd'] = self.epoch_jd + offsets[first + 1:last + 1]
+            periods['planets'] = _lineage(self.start, np.arange(first, last), depth)
+        return periods
+
+    def active_at(self, jd, depth=2):
+        """
+        Returns the periods active at a Julian Day as ACTIVE_DTYPE rows, from the
+        Mahadasha down to depth; empty before birth or after the cycle ends.
+        """
+        _check_depth(depth)
+        if not self.birth_jd <= jd < self.end_jd:
+            return np.empty(0, dtype=ACTIVE_DTYPE)
+        offsets, _ = _level(self.start, depth)
+        index = int(np.searchsorted(offsets, jd - self.epoch_jd, side='right')) - 1
+        index = min(max(index, 0), len(offsets) - 2)
+
+        periods = np.empty(depth, dtype=ACTIVE_DTYPE)
+        for level in range(1, depth + 1):
+            offsets, planets = _level(self.start, level)
+            position = index // 9 ** (depth - level)
+            periods[level - 1] = (level, planets[position], max(self.epoch_jd + offsets[position], self.birth_jd),
+                                  self.epoch_jd + offsets[position + 1])
+        return periods
+
+    def periods_between(self, jd_start, jd_end, depth=1):
+        """
+        Returns every period at depth that overlaps [jd_start, jd_end], in order.
+        """
+        _check_depth(depth)
+        offsets, _ = _level(self.start, depth)
+        jd_start = max(jd_start, self.birth_jd)
+        first = max(int(np.searchsorted(offsets, jd_start - self.epoch_jd, side='right')) - 1, 0)
+        last = min(int(np.searchsorted(offsets, jd_end - self.epoch_jd, side='right')), len(offsets) - 1)
+        return self._slice(first, last, depth)
+
+    def mahadashas(self):
+        """
+        Returns the Mahadashas from birth as dicts with 'planet', 'start_date' and
+        'end_date' datetimes, the format of `calculate_vimshottari_dasha`.
+        """
+        return [
+            {'planet': DASHA_PLANETS[planets[0]], 'start_date': jd_to_datetime(start_jd),
+             'end_date': jd_to_datetime(end_jd)}
+            for start_jd, end_jd, planets in self.periods_between(self.birth_jd, self.end_jd)
+        ]
+
+
+def active_periods_bulk(timelines, jd, depth=2):
+    """
+    Finds the active period at depth for many charts at once.
+
+    Parameters:
+        timelines (list): DashaTimeline objects.
+        jd (float): Julian Day to look up.
+        depth (int): Level to resolve (2 for Antardasha).
+
+    Returns:
+        numpy.ndarray: One row of `period_dtype(depth)` per timeline; charts for which
+            no period is active have start_jd and end_jd set to NaN and planets to -1.
+    """
+    _check_depth(depth)
+    epochs = np.array([timeline.epoch_jd for timeline in timelines], dtype=np.float64)
+    births = np.array([timeline.birth_jd for timeline in timelines], dtype=np.float64)
+    starts = np.array([timeline.start for timeline in timelines], dtype=np.int64)
+
+    periods = np.empty(len(timelines), dtype=period_dtype(depth))
+    periods['start_jd'] = np.nan
+    periods['end_jd'] = np.nan
+    periods['planets'] = -1
+    active = (jd >= births) & (jd < epochs + CYCLE_DAYS)
+    # Charts sharing a starting planet share boundary arrays, so search them together
+    for start in np.unique(starts[active]):
+        rows = np.flatnonzero(active & (starts == start))
+        offsets, _ = _level(int(start), depth)
+        indices = np.clip(np.searchsorted(offsets, jd - epochs[rows], side='right') - 1, 0, len(offsets) - 2)
+        periods['start_jd'][rows] = np.maximum(epochs[rows] + offsets[indices], births[rows])
+        periods['end_jd'][rows] = epochs[rows] + offsets[indices + 1]
+        periods['planets'][rows] = _lineage(int(start), indices, depth)
+    return periods
+
+
+def export_timelines(timelines, jd_start, jd_end, depth=2):
+    """
+    Returns the periods at depth overlapping [jd_start, jd_end] for each timeline,
+    using the boundary arrays shared by all charts with the same starting planet.
+    """
+    _check_depth(depth)
+    return [timeline.periods_between(jd_start, jd_end, depth) for timeline in timelines]
@@ -0,0 +1,415 @@
+# gazetteer.py
+
+import argparse
+import bisect
+import contextlib
+import difflib
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import re
+import unicodedata
+
+import numpy as np
+
+# Bundled GeoNames-style dump and the directory the compiled index is written to
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DEFAULT_DUMP_PATH = os.path.join(DATA_DIR, 'cities_gazetteer.txt.gz')
+DEFAULT_ADMIN1_PATH = os.path.join(DATA_DIR, 'admin1CodesASCII.txt')
+DEFAULT_COUNTRY_PATH = os.path.join(DATA_DIR, 'countryInfo.txt')
+DEFAULT_INDEX_DIR = os.environ.get('KUNDALI_GAZETTEER_INDEX', os.path.join(DATA_DIR, 'gazetteer_index'))
+
+# Columns of the GeoNames "geoname" table used by the index
+COL_NAME = 1
+COL_ASCIINAME = 2
+COL_ALTERNATENAMES = 3
+COL_LATITUDE = 4
+COL_LONGITUDE = 5
+COL_COUNTRY = 8
+COL_ADMIN1 = 10
+COL_POPULATION = 14
+
+PLACE_DTYPE = np.dtype([
+    ('latitude', '<f8'),
+    ('longitude', '<f8'),
+    ('population', '<i8'),
+    ('country', 'S2'),
+    ('admin1', 'S20'),
+])
+
+FUZZY_CUTOFF = 0.8
+AUTOCOMPLETE_SCAN_LIMIT = 5000
+
+
+def normalize_place_name(place_name):
+    """
+    Normalizes a place name for matching: strips accents, lowercases,
+    replaces punctuation with spaces and collapses whitespace.
+    """
+    text = unicodedata.normalize('NFKD', place_name)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r'[^0-9a-z]+', ' ', text.lower())
+    return text.strip()
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def _load_admin1_names(admin1_path):
+    """
+    Reads a GeoNames admin1CodesASCII file into {'US.IL': 'Illinois', ...}.
+    """
+    names = {}
+    if admin1_path and os.path.exists(admin1_path):
+        with _open_text(admin1_path) as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) >= 2:
+                    names[fields[0]] = fields[1]
+    return names
+
+
+def _load_country_names(country_path):
+    """
+    Reads a GeoNames countryInfo file into {'IN': 'India', ...}.
+    """
+    names = {}
+    if country_path and os.path.exists(country_path):
+        with _open_text(country_path) as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) >= 5:
+                    names[fields[0]] = fields[4]
+    return names
+
+
+def sources_digest(dump_path, admin1_path=None, country_path=None):
+    """
+    SHA-256 of the files an index is compiled from; the optional region files count
+    only when they exist, as in `build_gazetteer_index`.
+    """
+    digest = hashlib.sha256()
+    for path in (dump_path, admin1_path, country_path):
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+def _pack_strings(strings):
+    """
+    Packs a list of strings into a UTF-8 blob and an offsets array.
+    """
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return blob, offsets
+
+
+def _save_array(path, array):
+    """
+    Writes an .npy file under a temporary name and renames it into place, so processes
+    that have the previous file memory-mapped keep reading it intact.
+    """
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        np.save(f, array)
+    os.replace(temporary, path)
+
+
+def _save_json(path, data):
+    """
+    Writes a JSON file atomically, like `_save_array`.
+    """
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temporary, path)
+
+
+@contextlib.contextmanager
+def _index_lock(index_dir):
+    """
+    Holds an exclusive lock on index_dir/.lock, so only one process (say, one of the
+    pre-forked workers) checks and rebuilds an index at a time and the others wait
+    and then load the finished files.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, '.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def build_gazetteer_index(dump_path=DEFAULT_DUMP_PATH, index_dir=DEFAULT_INDEX_DIR,
+                          admin1_path=DEFAULT_ADMIN1_PATH, country_path=DEFAULT_COUNTRY_PATH):
+    """
+    Compiles a GeoNames-style dump into the memory-mappable index read by `Gazetteer`.
+
+    Parameters:
+        dump_path (str): Tab-separated GeoNames "geoname" table (optionally gzipped).
+        index_dir (str): Directory to write the index arrays into.
+        admin1_path (str): Optional GeoNames admin1CodesASCII file for region names.
+        country_path (str): Optional GeoNames countryInfo file for country names.
+
+    Returns:
+        int: The number of places in the index.
+    """
+    admin1_names = _load_admin1_names(admin1_path)
+    country_names = _load_country_names(country_path)
+
+    places = []
+    display_names = []
+    key_entries = []
+    with _open_text(dump_path) as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) <= COL_POPULATION:
+                continue
+            place_index = len(places)
+            country = fields[COL_COUNTRY]
+            admin1 = fields[COL_ADMIN1]
+            population = int(fields[COL_POPULATION] or 0)
+            places.append((float(fields[COL_LATITUDE]), float(fields[COL_LONGITUDE]),
+                           population, country.encode(), admin1.encode()))
+
+            region = admin1_names.get(f"{country}.{admin1}")
+            parts = [fields[COL_NAME]] + ([region] if region else []) + [country_names.get(country, country)]
+            display_names.append(', '.join(parts))
+
+            names = {fields[COL_NAME], fields[COL_ASCIINAME]}
+            names.update(n for n in fields[COL_ALTERNATENAMES].split(',') if n)
+            keys = {normalize_place_name(n) for n in names}
+            for key in keys:
+                if key:
+                    key_entries.append((key, -population, place_index))
+
+    # Sorted by key, then by descending population so the best match comes first
+    key_entries.sort()
+
+    os.makedirs(index_dir, exist_ok=True)
+    key_blob, key_offsets = _pack_strings([entry[0] for entry in key_entries])
+    display_blob, display_offsets = _pack_strings(display_names)
+    _save_array(os.path.join(index_dir, 'places.npy'), np.array(places, dtype=PLACE_DTYPE))
+    _save_array(os.path.join(index_dir, 'keys.npy'), key_blob)
+    _save_array(os.path.join(index_dir, 'key_offsets.npy'), key_offsets)
+    _save_array(os.path.join(index_dir, 'key_places.npy'), np.array([e[2] for e in key_entries], dtype=np.int32))
+    _save_array(os.path.join(index_dir, 'display.npy'), display_blob)
+    _save_array(os.path.join(index_dir, 'display_offsets.npy'), display_offsets)
+
+    region_aliases = {}
+    for code, name in admin1_names.items():
+        region_aliases[normalize_place_name(name)] = code
+    for code, name in country_names.items():
+        region_aliases[normalize_place_name(name)] = code
+    alias_keys = sorted(region_aliases)
+    alias_blob, alias_offsets = _pack_strings([f"{k}\t{region_aliases[k]}" for k in alias_keys])
+    _save_array(os.path.join(index_dir, 'aliases.npy'), alias_blob)
+    _save_array(os.path.join(index_dir, 'alias_offsets.npy'), alias_offsets)
+
+    # Written last: a meta.json with the current digest means the arrays are complete
+    _save_json(os.path.join(index_dir, 'meta.json'), {
+        'sources': [os.path.abspath(path) if path else None for path in (dump_path, admin1_path, country_path)],
+        'sources_sha256': sources_digest(dump_path, admin1_path, country_path),
+        'places': len(places),
+    })
+    return len(places)
+
+
+class _PackedStrings:
+    """
+    Read-only sequence view over a packed string blob, usable with `bisect`.
+    """
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.blob[start:end].tobytes().decode('utf-8')
+
+
+class Gazetteer:
+    """
+    Offline place lookup over a memory-mapped index built by `build_gazetteer_index`.
+    """
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR):
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode='r')
+
+        self.places = load('places.npy')
+        self.keys = _PackedStrings(load('keys.npy'), load('key_offsets.npy'))
+        self.key_places = load('key_places.npy')
+        self.display_names = _PackedStrings(load('display.npy'), load('display_offsets.npy'))
+
+        # Region and country aliases are tiny, so they live in a plain dict
+        aliases = _PackedStrings(load('aliases.npy'), load('alias_offsets.npy'))
+        self.region_aliases = {}
+        for i in range(len(aliases)):
+            alias, code = aliases[i].split('\t')
+            self.region_aliases[alias] = code
+
+    def _key_range(self, key, prefix=False):
+        """
+        Returns the [start, end) range of index entries equal to (or starting with) key.
+        """
+        start = bisect.bisect_left(self.keys, key)
+        if prefix:
+            end = bisect.bisect_left(self.keys, key + '\uffff', lo=start)
+        else:
+            end = bisect.bisect_right(self.keys, key, lo=start)
+        return start, end
+
+    def _qualifier_codes(self, qualifiers):
+        """
+        Turns qualifiers such as "IL", "Illinois" or "India" into admin1/country codes.
+        """
+        codes = []
+        for qualifier in qualifiers:
+            code = self.region_aliases.get(qualifier, qualifier.upper())
+            # Admin1 aliases are stored as "US.IL"; keep both parts as separate constraints
+            codes.append(code.split('.'))
+        return codes
+
+    def _matches(self, place_index, codes):
+        place = self.places[place_index]
+        country = place['country'].decode()
+        admin1 = place['admin1'].decode()
+        for code in codes:
+            if len(code) == 2 and code[0] == country and code[1] == admin1:
+                continue
+            if len(code) == 1 and code[0] in (country, admin1):
+                continue
+            return False
+        return True
+
+    def _candidates(self, name_key, codes):
+        start, end = self._key_range(name_key)
+        for entry in range(start, end):
+            place_index = int(self.key_places[entry])
+            if self._matches(place_index, codes):
+                return place_index
+        return None
+
+    def lookup(self, place_name, fuzzy=True):
+        """
+        Resolves a free-form place name such as "Mumbai" or "Springfield, IL".
+
+        Parameters:
+            place_name (str): The place to resolve. Comma-separated trailing parts are
+                treated as region or country qualifiers.
+            fuzzy (bool): Fall back to close spellings when there is no exact match.
+
+        Returns:
+            tuple or None: (latitude, longitude) of the most populous match, or None.
+        """
+        place_index = self.resolve(place_name, fuzzy=fuzzy)
+        if place_index is None:
+            return None
+        place = self.places[place_index]
+        return float(place['latitude']), float(place['longitude'])
+
+    def resolve(self, place_name, fuzzy=True):
+        """
+        Same as `lookup`, but returns the index of the matching place.
+        """
+        parts = [normalize_place_name(part) for part in place_name.split(',')]
+        parts = [part for part in parts if part]
+        if not parts:
+            return None
+        name_key, qualifiers = parts[0], parts[1:]
+        codes = self._qualifier_codes(qualifiers)
+
+        place_index = self._candidates(name_key, codes)
+        if place_index is not None or not fuzzy:
+            return place_index
+
+        # Fuzzy match: compare against names sharing the first few characters
+        start, end = self._key_range(name_key[:3], prefix=True)
+        nearby = sorted({self.keys[entry] for entry in range(start, min(end, start + AUTOCOMPLETE_SCAN_LIMIT))})
+        for candidate in difflib.get_close_matches(name_key, nearby, n=5, cutoff=FUZZY_CUTOFF):
+            place_index = self._candidates(candidate, codes)
+            if place_index is not None:
+                return place_index
+        return None
+
+    def autocomplete(self, prefix, limit=10):
+        """
+        Suggests places whose name starts with the given prefix, most populous first.
+
+        Returns:
+            list: Dicts with 'name', 'latitude' and 'longitude'.
+        """
+        key = normalize_place_name(prefix)
+        if not key:
+            return []
+        start, end = self._key_range(key, prefix=True)
+        end = min(end, start + AUTOCOMPLETE_SCAN_LIMIT)
+        place_indices = np.unique(np.asarray(self.key_places[start:end]))
+        populations = self.places['population'][place_indices]
+        place_indices = place_indices[np.argsort(-populations, kind='stable')[:limit]]
+
+        suggestions = []
+        for place_index in place_indices:
+            place = self.places[place_index]
+            suggestions.append({
+                'name': self.display_names[int(place_index)],
+                'latitude': float(place['latitude']),
+                'longitude': float(place['longitude']),
+            })
+        return suggestions
+
+
+_gazetteer = None
+
+
+def get_gazetteer():
+    """
+    Returns the shared Gazetteer, compiling the bundled dump first if the index is
+    missing, and recompiling it if the files it was built from have changed (under the
+    index directory's lock, like the other indexes).
+    """
+    global _gazetteer
+    if _gazetteer is None:
+        with _index_lock(DEFAULT_INDEX_DIR):
+            meta_path = os.path.join(DEFAULT_INDEX_DIR, 'meta.json')
+            sources = [DEFAULT_DUMP_PATH, DEFAULT_ADMIN1_PATH, DEFAULT_COUNTRY_PATH]
+            stale = True
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                # Keep an index built from another dump with `--dump`, as long as that dump is still there
+                if meta.get('sources') and os.path.exists(meta['sources'][0]):
+                    sources = meta['sources']
+                stale = meta.get('sources_sha256') != sources_digest(*sources)
+            if stale:
+                build_gazetteer_index(sources[0], DEFAULT_INDEX_DIR, sources[1], sources[2])
+            _gazetteer = Gazetteer()
+    return _gazetteer
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compile a GeoNames-style dump into the offline gazetteer index.")
+    parser.add_argument('--dump', default=DEFAULT_DUMP_PATH, help="GeoNames geoname table (.txt or .txt.gz).")
+    parser.add_argument('--admin1', default=DEFAULT_ADMIN1_PATH, help="GeoNames admin1CodesASCII file.")
+    parser.add_argument('--countries', default=DEFAULT_COUNTRY_PATH, help="GeoNames countryInfo file.")
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR, help="Output directory for the index.")
+    args = parser.parse_args()
+
+    with _index_lock(args.index_dir):
+        count = build_gazetteer_index(args.dump, args.index_dir, args.admin1, args.countries)
+    print(f"Indexed {count} places into {args.index_dir}")
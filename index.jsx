@@ -65,9 +65,9 @@
 //   },
 // });
 // app/index.js
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import { View, StyleSheet } from 'react-native';
-import { TextInput, Button, Title } from 'react-native-paper';
+import { TextInput, Button, Title, List } from 'react-native-paper';
 import { useRouter } from 'expo-router';
 
 
@@ -75,9 +75,34 @@ export default function HomeScreen() {
   const [dateOfBirth, setDateOfBirth] = useState('');
   const [timeOfBirth, setTimeOfBirth] = useState('');
   const [placeOfBirth, setPlaceOfBirth] = useState('');
+  const [placeSuggestions, setPlaceSuggestions] = useState([]);
 
   const router = useRouter();
 
+  // Suggest places from the server-side gazetteer while the user types
+  useEffect(() => {
+    if (placeOfBirth.trim().length < 2) {
+      setPlaceSuggestions([]);
+      return;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const response = await fetch(
+          `http://192.168.210.8:5000/places/autocomplete?q=${encodeURIComponent(placeOfBirth)}&limit=5`
+        );
+        const data = await response.json();
+        const suggestions = data.suggestions || [];
+        // Hide the list once the field already holds a chosen suggestion
+        setPlaceSuggestions(
+          suggestions.length === 1 && suggestions[0].name === placeOfBirth ? [] : suggestions
+        );
+      } catch (error) {
+        console.error('Error fetching place suggestions:', error);
+      }
+    }, 250);
+    return () => clearTimeout(timer);
+  }, [placeOfBirth]);
+
   const handleCalculateKundali = () => {
     router.push({
       pathname: '/KundaliScreen',
@@ -113,6 +138,17 @@ export default function HomeScreen() {
         mode="outlined"
         style={styles.input}
       />
+      {placeSuggestions.map((suggestion) => (
+        <List.Item
+          key={suggestion.name}
+          title={suggestion.name}
+          onPress={() => {
+            setPlaceOfBirth(suggestion.name);
+            setPlaceSuggestions([]);
+          }}
+          style={styles.suggestion}
+        />
+      ))}
       <Button mode="contained" onPress={handleCalculateKundali} style={styles.button}>
         Calculate Kundali
       </Button>
@@ -146,6 +182,11 @@ const styles = StyleSheet.create({
     borderWidth: 1,
     borderColor: '#E0E0E0', // Border for subtle definition
   },
+  suggestion: {
+    backgroundColor: '#FFFFFF',
+    borderBottomWidth: 1,
+    borderBottomColor: '#E0E0E0',
+  },
   button: {
     marginTop: 30,
     paddingVertical: 14,
@@ -0,0 +1,416 @@
+# interpretation_index.py
+"""
+Compiled index of the interpretations in preprocessed_astrology_validation_data.jsonl.
+
+Each prompt key, such as
+    Education_Influence_Sun_in_9th_house_with_aspect_from_Venus_and_Ketu_interpretation_negative
+is parsed into a structured row (kind, domain, planets, house, aspecting planets,
+polarity, ...) stored in a NumPy structured array, with the prompt and completion
+texts packed into UTF-8 blobs. The index is memory-mapped, and `match` evaluates
+every row against a chart with a handful of vectorized comparisons on bitmasks, so
+interpretations for a report are found without an LLM round-trip.
+
+Build the index with:
+    python interpretation_index.py
+It is also rebuilt automatically when the JSONL changes.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+from ephemeris_tables import GRAHAS
+from gazetteer import _index_lock, _pack_strings, _PackedStrings, _save_array, _save_json
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCE_PATH = os.path.join(DATA_DIR, 'preprocessed_astrology_validation_data.jsonl')
+DEFAULT_INDEX_DIR = os.environ.get(
+    'KUNDALI_INTERPRETATION_INDEX', os.path.join(DATA_DIR, 'data', 'interpretation_index')
+)
+
+KINDS = ['placement', 'drishti', 'dasha', 'house_lord', 'house_detail', 'house', 'yoga']
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+POLARITIES = {'positive': 1, 'negative': -1}
+NO_PLANET = len(GRAHAS)
+
+# House detail conditions that can be evaluated on a chart
+CONDITIONS = [
+    'house_lord_in_exaltation',
+    'house_lord_in_own_sign',
+    'house_lord_with_Benefic_conjunction',
+    'house_lord_with_Malefic_conjunction',
+    'influence_with_Benefic_aspect',
+    'influence_with_Malefic_aspect',
+    'influence_with_Conjunction_Malefic_planet',
+]
+CONDITION_CODES = {condition: code for code, condition in enumerate(CONDITIONS)}
+NO_CONDITION = 255
+
+FLAG_NO_ASPECTS = 1
+
+ENTRY_DTYPE = np.dtype([
+    ('kind', 'u1'),
+    ('domain', 'u1'),
+    ('planet', 'u1'),      # Primary planet (NO_PLANET if none)
+    ('planet2', 'u1'),     # Antardasha planet for dasha rows
+    ('planets', '<u2'),    # Bitmask of planets that must share the house
+    ('aspects', '<u2'),    # Bitmask of planets that must aspect the house
+    ('house', 'u1'),
+    ('target', 'u1'),      # Second house (house lord rows) or condition code (house detail rows)
+    ('flags', 'u1'),
+    ('polarity', 'i1'),
+])
+
+# Graha drishti: every planet aspects the 7th house from itself; these add special aspects
+SPECIAL_ASPECTS = {'Mars': (4, 8), 'Jupiter': (5, 9), 'Saturn': (3, 10), 'Rahu': (5, 9), 'Ketu': (5, 9)}
+BENEFICS = ['Sun', 'Venus', 'Jupiter', 'Mercury', 'Moon']
+
+PLANET_NAMES = '|'.join(GRAHAS)
+PLACEMENT_PATTERN = re.compile(
+    r'^(?P<domain>[A-Za-z]+)_Influence_(?P<planets>.+?)_in_(?P<house>\d+)(?:st|nd|rd|th)_house'
+    r'(?:_(?:with_aspects?_from|aspected_by)_(?P<aspects>.+?)|_(?P<none>without_aspects))?'
+    r'_interpretation_(?P<polarity>positive|negative)$'
+)
+DASHA_PATTERN = re.compile(
+    rf'^(?P<maha>{PLANET_NAMES})_(?P<antar>{PLANET_NAMES})_(?:(?P<polarity>positive|negative)_influences'
+    r'|interaction_with_house_lord_(?P<house>\d+)(?:st|nd|rd|th)_house_lord_in_(?P<target>\d+)(?:st|nd|rd|th))$'
+)
+HOUSE_LORD_PATTERN = re.compile(
+    r'^(?P<house>\d+)(?:st|nd|rd|th)_house_lord_in_(?P<target>\d+)(?:st|nd|rd|th)_house_(?P<polarity>positive|negative)$'
+)
+DRISHTI_PATTERN = re.compile(rf'^(?P<planet>{PLANET_NAMES})_(?P<house>\d+)_(?P<polarity>positive|negative)$')
+PLANET_HOUSE_PATTERN = re.compile(
+    rf'Planet: (?P<planet>{PLANET_NAMES})\. (?:House|Position): (?P<house>\d+)\. Influence type: (?P<polarity>positive|negative)'
+)
+HOUSE_DETAIL_PATTERN = re.compile(r'^(?P<house>\d+)_(?P<detail>.+)$')
+
+
+def _planet_mask(names):
+    mask = 0
+    for name in names:
+        mask |= 1 << GRAHAS.index(name)
+    return mask
+
+
+def _planet_list(text):
+    return re.findall(PLANET_NAMES, text)
+
+
+def parse_prompt(prompt, domains):
+    """
+    Parses one prompt key into a structured row. New domains are appended to domains.
+
+    Returns:
+        tuple: A row matching ENTRY_DTYPE, or None if the prompt is not recognized.
+    """
+    def row(kind, domain='General', planet=None, planet2=None, planets=(), aspects=(), house=0, target=0,
+            flags=0, polarity=None):
+        if domain not in domains:
+            domains.append(domain)
+        return (KIND_CODES[kind], domains.index(domain),
+                GRAHAS.index(planet) if planet else NO_PLANET, GRAHAS.index(planet2) if planet2 else NO_PLANET,
+                _planet_mask(planets), _planet_mask(aspects), house, target, flags, POLARITIES.get(polarity, 0))
+
+    if prompt.startswith('Combined effects.'):
+        key = prompt.split('Combined effect:', 1)[1].strip().rstrip('.').replace(' ', '_')
+        match = PLACEMENT_PATTERN.match(key)
+        if match is None:
+            return None
+        planets = _planet_list(match['planets'])
+        return row('placement', match['domain'], planets[0], planets=planets, aspects=_planet_list(match['aspects'] or ''),
+                   house=int(match['house']), flags=FLAG_NO_ASPECTS if match['none'] else 0,
+                   polarity=match['polarity'])
+
+    if prompt.startswith(('Planetary influences.', 'Planetary positions.')):
+        match = PLANET_HOUSE_PATTERN.search(prompt)
+        if match is None:
+            return None
+        return row('placement', planet=match['planet'], planets=[match['planet']], house=int(match['house']),
+                   polarity=match['polarity'])
+
+    if prompt.startswith('Drishti effects.'):
+        match = DRISHTI_PATTERN.match(prompt.split('Drishti effect:', 1)[1].strip().rstrip('.'))
+        if match is None:
+            return None
+        return row('drishti', planet=match['planet'], house=int(match['house']), polarity=match['polarity'])
+
+    if prompt.startswith('Mahadasha antardasha.'):
+        match = DASHA_PATTERN.match(prompt.split('Interaction:', 1)[1].strip().rstrip('.'))
+        if match is None:
+            return None
+        return row('dasha', planet=match['maha'], planet2=match['antar'], house=int(match['house'] or 0),
+                   target=int(match['target'] or 0), polarity=match['polarity'])
+
+    if prompt.startswith('House lord relationships.'):
+        match = HOUSE_LORD_PATTERN.match(prompt.split('Relationship:', 1)[1].strip().rstrip('.'))
+        if match is None:
+            return None
+        return row('house_lord', house=int(match['house']), target=int(match['target']), polarity=match['polarity'])
+
+    if prompt.startswith('House detail - '):
+        match = HOUSE_DETAIL_PATTERN.match(prompt[len('House detail - '):].strip())
+        if match is None:
+            return None
+        return row('house_detail', house=int(match['house']),
+                   target=CONDITION_CODES.get(match['detail'], NO_CONDITION))
+
+    if prompt.startswith('House number - '):
+        return row('house', house=int(prompt[len('House number - '):].split('|')[0]))
+
+    if prompt.startswith('Yoga dosha - '):
+        return row('yoga')
+
+    return None
+
+
+def source_digest(source_path):
+    with open(source_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def build_interpretation_index(source_path=DEFAULT_SOURCE_PATH, index_dir=DEFAULT_INDEX_DIR):
+    """
+    Parses the interpretation JSONL and writes the memory-mappable index read by
+    `InterpretationIndex`.
+
+    Parameters:
+        source_path (str): JSONL file of {"prompt": ..., "completion": ...} pairs.
+        index_dir (str): Directory to write the index into.
+
+    Returns:
+        dict: The index metadata, including entry counts per kind.
+    """
+    domains = ['General']
+    entries = []
+    prompts = []
+    completions = []
+    skipped = 0
+    with open(source_path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            entry = parse_prompt(record['prompt'], domains)
+            if entry is None:
+                skipped += 1
+                continue
+            entries.append(entry)
+            prompts.append(record['prompt'])
+            completions.append(record['completion'])
+
+    os.makedirs(index_dir, exist_ok=True)
+    prompt_blob, prompt_offsets = _pack_strings(prompts)
+    completion_blob, completion_offsets = _pack_strings(completions)
+    entries = np.array(entries, dtype=ENTRY_DTYPE)
+    _save_array(os.path.join(index_dir, 'entries.npy'), entries)
+    _save_array(os.path.join(index_dir, 'prompts.npy'), prompt_blob)
+    _save_array(os.path.join(index_dir, 'prompt_offsets.npy'), prompt_offsets)
+    _save_array(os.path.join(index_dir, 'completions.npy'), completion_blob)
+    _save_array(os.path.join(index_dir, 'completion_offsets.npy'), completion_offsets)
+
+    meta = {
+        'source_sha256': source_digest(source_path),
+        'domains': domains,
+        'entries': len(entries),
+        'skipped': skipped,
+        'kinds': {kind: int(np.sum(entries['kind'] == code)) for kind, code in KIND_CODES.items()},
+    }
+    # Written last: a meta.json with the current digest means the arrays are complete
+    _save_json(os.path.join(index_dir, 'meta.json'), meta)
+    return meta
+
+
+def aspected_houses(planet, house):
+    """
+    Houses (1 to 12) aspected by a planet in the given house.
+    """
+    offsets = (7,) + SPECIAL_ASPECTS.get(planet, ())
+    return [(house + offset - 2) % 12 + 1 for offset in offsets]
+
+
+class ChartFeatures:
+    """
+    The chart facts the index is matched against, as small NumPy lookup tables
+    indexed by house number (1 to 12) or planet index (GRAHAS order).
+    """
+    def __init__(self, report):
+        planet_in_houses = report['planet_in_houses']
+        house_rulers = report['house_rulers']
+        benefic_mask = _planet_mask(BENEFICS)
+        malefic_mask = _planet_mask(GRAHAS) & ~benefic_mask
+
+        self.occupants = np.zeros(13, dtype=np.uint16)
+        self.aspects = np.zeros(13, dtype=np.uint16)
+        self.polarity = np.zeros(NO_PLANET + 1, dtype=np.int8)
+        strengths = {}
+        for index, planet in enumerate(GRAHAS):
+            house = planet_in_houses[planet]
+            self.occupants[house] |= 1 << index
+            for aspected in aspected_houses(planet, house):
+                self.aspects[aspected] |= 1 << index
+            details = report[planet]
+            strengths[planet] = details['strength']
+            positive = details['strength'] in ('Exalted', 'Strong') or (details['benefic'] and details['strength'] == 'Neutral')
+            self.polarity[index] = 1 if positive else -1
+
+        self.lord = np.full(13, NO_PLANET, dtype=np.uint8)
+        self.lord_house = np.zeros(13, dtype=np.uint8)
+        self.conditions = np.zeros((13, len(CONDITIONS) + 1), dtype=bool)
+        for house in range(1, 13):
+            lord = house_rulers[house]
+            lord_house = planet_in_houses[lord]
+            companions = self.occupants[lord_house] & ~np.uint16(1 << GRAHAS.index(lord))
+            self.lord[house] = GRAHAS.index(lord)
+            self.lord_house[house] = lord_house
+            self.conditions[house, :len(CONDITIONS)] = [
+                strengths[lord] == 'Exalted',
+                strengths[lord] == 'Strong',
+                bool(companions & benefic_mask),
+                bool(companions & malefic_mask),
+                bool(self.aspects[house] & benefic_mask),
+                bool(self.aspects[house] & malefic_mask),
+                bool(self.occupants[house] & malefic_mask),
+            ]
+
+        mahadasha = (report.get('Mahadasha') or {}).get('planet')
+        antardasha = (report.get('Antardasha') or {}).get('planet')
+        self.mahadasha = GRAHAS.index(mahadasha) if mahadasha else -1
+        self.antardasha = GRAHAS.index(antardasha) if antardasha else -1
+
+
+class InterpretationIndex:
+    """
+    Memory-mapped interpretation index built by `build_interpretation_index`.
+    """
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR):
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode='r')
+
+        with open(os.path.join(index_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.domains = self.meta['domains']
+        self.entries = load('entries.npy')
+        self.prompts = _PackedStrings(load('prompts.npy'), load('prompt_offsets.npy'))
+        self.completions = _PackedStrings(load('completions.npy'), load('completion_offsets.npy'))
+
+        # Column views of the mapped array, so matching does not copy fields per call
+        self.kind = self.entries['kind']
+        self.planet = self.entries['planet']
+        self.planet2 = self.entries['planet2']
+        self.planets = self.entries['planets']
+        self.aspects = self.entries['aspects']
+        self.house = self.entries['house']
+        self.target = self.entries['target']
+        self.no_aspects = (self.entries['flags'] & FLAG_NO_ASPECTS) != 0
+        self.polarity = self.entries['polarity']
+
+    def __len__(self):
+        return len(self.entries)
+
+    def match_indices(self, report):
+        """
+        Returns the row numbers of the interpretations that apply to a report.
+        """
+        chart = report if isinstance(report, ChartFeatures) else ChartFeatures(report)
+        kind = self.kind
+        house = self.house
+        planet_polarity = chart.polarity[self.planet]
+
+        occupants = chart.occupants[house]
+        aspects = chart.aspects[house]
+        placement = (
+            (kind == KIND_CODES['placement'])
+            & ((occupants & self.planets) == self.planets)
+            & ((aspects & self.aspects) == self.aspects)
+            & (~self.no_aspects | (aspects == 0))
+            & (self.polarity == planet_polarity)
+        )
+        drishti = (
+            (kind == KIND_CODES['drishti'])
+            & (((aspects >> np.minimum(self.planet, NO_PLANET - 1)) & 1) == 1)
+            & (self.polarity == planet_polarity)
+        )
+        dasha = (
+            (kind == KIND_CODES['dasha'])
+            & (self.planet == chart.mahadasha)
+            & (self.planet2 == chart.antardasha)
+            & ((self.polarity == 0) | (self.polarity == planet_polarity))
+            & ((self.target == 0) | (chart.lord_house[house] == self.target))
+        )
+        house_lord = (
+            (kind == KIND_CODES['house_lord'])
+            & (chart.lord_house[house] == self.target)
+            & (self.polarity == chart.polarity[chart.lord[house]])
+        )
+        house_detail = (
+            (kind == KIND_CODES['house_detail'])
+            & chart.conditions[house, np.minimum(self.target, len(CONDITIONS))]
+        )
+        return np.flatnonzero(placement | drishti | dasha | house_lord | house_detail)
+
+    def entry(self, index):
+        """
+        Returns one index row as a dictionary with its prompt key and interpretation.
+        """
+        row = self.entries[index]
+        planets = [planet for i, planet in enumerate(GRAHAS) if row['planets'] >> i & 1]
+        if not planets:
+            # Drishti and dasha rows name their planets in the planet fields
+            planets = [GRAHAS[i] for i in (row['planet'], row['planet2']) if i != NO_PLANET]
+        return {
+            'kind': KINDS[row['kind']],
+            'domain': self.domains[row['domain']],
+            'planets': planets,
+            'house': int(row['house']) or None,
+            'aspects': [planet for i, planet in enumerate(GRAHAS) if row['aspects'] >> i & 1],
+            'polarity': {1: 'positive', -1: 'negative'}.get(int(row['polarity'])),
+            'prompt': self.prompts[index],
+            'interpretation': self.completions[index],
+        }
+
+    def match(self, report):
+        """
+        Returns the interpretations that apply to a `calculate_kundali` report.
+        """
+        return [self.entry(index) for index in self.match_indices(report)]
+
+
+_interpretation_index = None
+
+
+def get_interpretation_index():
+    """
+    Returns the shared InterpretationIndex, (re)compiling it first if it is missing or
+    the JSONL has changed since it was built. The check, the rebuild and the load hold
+    the index directory's lock, so concurrent processes build it once and never load a
+    half-written index.
+    """
+    global _interpretation_index
+    if _interpretation_index is None:
+        with _index_lock(DEFAULT_INDEX_DIR):
+            meta_path = os.path.join(DEFAULT_INDEX_DIR, 'meta.json')
+            stale = True
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    stale = json.load(f).get('source_sha256') != source_digest(DEFAULT_SOURCE_PATH)
+            if stale:
+                build_interpretation_index()
+            _interpretation_index = InterpretationIndex()
+    return _interpretation_index
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compile the interpretation JSONL into a memory-mappable index.")
+    parser.add_argument('--source', default=DEFAULT_SOURCE_PATH, help="JSONL of prompt/completion pairs.")
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR, help="Output directory for the index.")
+    args = parser.parse_args()
+
+    with _index_lock(args.index_dir):
+        meta = build_interpretation_index(args.source, args.index_dir)
+    print(f"Indexed {meta['entries']} interpretations into {args.index_dir} ({meta['skipped']} skipped)")
+    for kind, count in meta['kinds'].items():
+        print(f"  {kind:13s} {count}")
@@ -2,16 +2,129 @@
 
 import swisseph as swe
 from opencage.geocoder import OpenCageGeocode
-from datetime import datetime, timedelta
+from datetime import datetime
 import pytz
-from functools import lru_cache
+import asyncio
+import functools
+import numpy as np
 import os
+from gazetteer import get_gazetteer
+from cache_utils import SQLiteCache, LRUCache, TieredCache
+from ephemeris_tables import get_ephemeris_tables
+from dasha_timeline import DASHA_PLANETS, DashaTimeline, datetime_to_jd, jd_to_datetime
+from vargas import calculate_vargas, normalize_vargas
+# get_planetary_strength lives with the Chart model and is re-exported here for existing callers
+from chart_model import PLANETS, Chart, get_planetary_strength  # noqa: F401
+from metrics import count, stage
+from timezone_index import timezone_at
 
 
 # Your OpenCage API key (Ensure this is securely stored)
 opencage_api_key = 'opencage_api_key'    # Ensure this is securely stored
 geocoder = OpenCageGeocode(opencage_api_key)
 
+# Places are resolved from the offline gazetteer first; OpenCage is only used as a fallback
+use_opencage_fallback = os.environ.get('KUNDALI_OPENCAGE_FALLBACK', '1') == '1'
+
+# Geocoder results are kept in a SQLite cache shared by all worker processes
+GEOCODE_CACHE_PATH = os.environ.get(
+    'KUNDALI_GEOCODE_CACHE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'geocode_cache.sqlite3')
+)
+GEOCODE_CACHE_MAX_ENTRIES = int(os.environ.get('KUNDALI_GEOCODE_CACHE_MAX_ENTRIES', '100000'))
+GEOCODE_CACHE_TTL_SECONDS = float(os.environ.get('KUNDALI_GEOCODE_CACHE_TTL', str(30 * 24 * 3600)))
+
+# Time zone of births given without a place (see timezone_index.py for the others)
+DEFAULT_TIMEZONE = 'Asia/Kolkata'
+
+# Sidereal mode and house system used for every chart
+AYANAMSA = swe.SIDM_LAHIRI
+HOUSE_SYSTEM = 'W'  # Whole Sign Houses
+
+# Planetary longitudes come from Swiss Ephemeris ('swisseph') or the precomputed
+# Chebyshev tables in ephemeris_tables.py ('tables')
+EPHEMERIS_BACKEND = os.environ.get('KUNDALI_EPHEMERIS_BACKEND', 'swisseph')
+# Swiss Ephemeris flags of every position calculation
+CALC_FLAGS = swe.FLG_SIDEREAL
+
+# Time-invariant chart data is cached in memory, and optionally on disk
+CHART_CACHE_SIZE = int(os.environ.get('KUNDALI_CHART_CACHE_SIZE', '4096'))
+CHART_CACHE_PATH = os.environ.get('KUNDALI_CHART_CACHE_PATH')
+
+_geocode_cache = None
+_chart_cache = None
+
+def get_geocode_cache():
+    """
+    Returns the shared geocode cache, opening it on first use.
+    """
+    global _geocode_cache
+    if _geocode_cache is None:
+        _geocode_cache = SQLiteCache(
+            GEOCODE_CACHE_PATH, max_entries=GEOCODE_CACHE_MAX_ENTRIES, ttl_seconds=GEOCODE_CACHE_TTL_SECONDS
+        )
+    return _geocode_cache
+
+def get_chart_cache():
+    """
+    Returns the shared chart cache, opening it on first use.
+    """
+    global _chart_cache
+    if _chart_cache is None:
+        disk = SQLiteCache(CHART_CACHE_PATH, max_entries=None) if CHART_CACHE_PATH else None
+        _chart_cache = TieredCache(LRUCache(max_entries=CHART_CACHE_SIZE), disk)
+    return _chart_cache
+
+def chart_cache_key(jd, latitude, longitude, ayanamsa=AYANAMSA, house_system=HOUSE_SYSTEM, ephemeris=None):
+    """
+    Builds the chart cache key from everything the time-invariant chart depends on,
+    including the ephemeris that computes it (see `ephemeris_id`).
+    """
+    ephemeris = ephemeris or ephemeris_id(jd, ayanamsa)
+    return f"chart3:{jd:.8f}:{latitude:.6f}:{longitude:.6f}:{ayanamsa}:{house_system}:{ephemeris}"
+
+def get_tables_for(jds, ayanamsa=AYANAMSA):
+    """
+    Returns the ephemeris tables if the 'tables' backend is selected and they can serve
+    these Julian Days with this ayanamsa; otherwise None (use Swiss Ephemeris).
+    """
+    if EPHEMERIS_BACKEND != 'tables':
+        return None
+    tables = get_ephemeris_tables()
+    if tables.ayanamsa != ayanamsa or not tables.covers(jds):
+        return None
+    return tables
+
+def ephemeris_id(jd, ayanamsa=AYANAMSA):
+    """
+    Identifies the ephemeris a chart for this Julian Day is calculated with, and its
+    flags: the precomputed tables when they serve it, else the Swiss Ephemeris engine
+    that actually answers ('swieph' with the ephemeris files, 'moseph' when it falls
+    back to the built-in Moshier model), which depends on the files found.
+    """
+    if get_tables_for([jd], ayanamsa) is not None:
+        return f"tables:{CALC_FLAGS}"
+    return f"{ephemeris_engine()}:{CALC_FLAGS}"
+
+@functools.lru_cache(maxsize=None)
+def ephemeris_engine():
+    """
+    Returns the Swiss Ephemeris engine in use: 'swieph' when the ephemeris files are
+    found, 'moseph' when it falls back to the built-in Moshier model. Probed once per
+    process; call `ephemeris_engine.cache_clear()` after `swe.set_ephe_path`.
+    """
+    _, ret = swe.calc_ut(swe.julday(2000, 1, 1, 12.0), swe.SUN, CALC_FLAGS)
+    return 'moseph' if ret & swe.FLG_MOSEPH else 'swieph'
+
+def geocode_cache_key(place_name):
+    """
+    Normalizes a place name into a cache key, so that "Mumbai, India" and
+    " mumbai ,  india" share an entry. Only case and whitespace are normalized: the
+    geocoder is sent the name as given, so names it may resolve differently (such as
+    "Paris" and "Paris, India") keep separate entries.
+    """
+    parts = [' '.join(part.lower().split()) for part in place_name.split(',')]
+    return 'geocode2:' + ','.join(part for part in parts if part)
+
 def sign_name(sign_number):
     """
     Maps a sign number to its corresponding zodiac sign name.
@@ -33,30 +146,117 @@ def sign_name(sign_number):
     }
     return signs_english.get(sign_number, "Unknown Sign")
 
-@lru_cache(maxsize=128)
 def get_coordinates_from_place(place_name):
     """
-    Retrieves the latitude and longitude for a given place name using the OpenCage Geocoding API.
-    Implements caching to avoid redundant API calls.
+    Retrieves the latitude and longitude for a given place name.
+    Looks the place up in the offline gazetteer and falls back to the OpenCage
+    Geocoding API when it is not found there (unless the fallback is disabled).
+    OpenCage results are kept in the shared geocode cache, and concurrent misses
+    for the same place make a single outbound request.
     """
-    result = geocoder.geocode(place_name)
-    if result and len(result):
-        latitude = result[0]['geometry']['lat']
-        longitude = result[0]['geometry']['lng']
-        return latitude, longitude
-    else:
+    coordinates = get_gazetteer().lookup(place_name)
+    count('kundali_cache_lookups_total', ('gazetteer', 'miss' if coordinates is None else 'hit'))
+    if coordinates is not None:
+        return coordinates
+
+    if not use_opencage_fallback:
         raise ValueError(f"Coordinates not found for the place: {place_name}")
 
-def calculate_julian_day(date_of_birth, time_of_birth):
+    requested = False
+
+    def geocode_place():
+        nonlocal requested
+        requested = True
+        count('kundali_cache_lookups_total', ('geocode', 'miss'))
+        outcome = 'error'
+        try:
+            result = geocoder.geocode(place_name)
+            outcome = 'found' if result and len(result) else 'not_found'
+        finally:
+            count('kundali_geocoder_requests_total', (outcome,))
+        if result and len(result):
+            latitude = result[0]['geometry']['lat']
+            longitude = result[0]['geometry']['lng']
+            return latitude, longitude
+        else:
+            raise ValueError(f"Coordinates not found for the place: {place_name}")
+
+    coordinates = get_geocode_cache().get_or_set(geocode_cache_key(place_name), geocode_place)
+    if not requested:
+        count('kundali_cache_lookups_total', ('geocode', 'hit'))
+    return coordinates
+
+# Geocode cache key -> task running that OpenCage request
+_geocode_inflight = {}
+
+async def _geocode_async(place_name, key, client):
+    outcome = 'error'
+    try:
+        response = await client.get(
+            'https://api.opencagedata.com/geocode/v1/json',
+            params={'q': place_name, 'key': opencage_api_key, 'limit': 1, 'no_annotations': 1}
+        )
+        response.raise_for_status()
+        results = response.json().get('results', [])
+        outcome = 'found' if results else 'not_found'
+        if not results:
+            raise ValueError(f"Coordinates not found for the place: {place_name}")
+        coordinates = (results[0]['geometry']['lat'], results[0]['geometry']['lng'])
+        await asyncio.to_thread(get_geocode_cache().set, key, coordinates)
+        return coordinates
+    finally:
+        count('kundali_geocoder_requests_total', (outcome,))
+
+def _geocode_done(key, task):
+    if _geocode_inflight.get(key) is task:
+        del _geocode_inflight[key]
+    if not task.cancelled():
+        # Mark the exception as retrieved in case every caller has gone
+        task.exception()
+
+async def get_coordinates_from_place_async(place_name, client):
     """
-    Calculates the Julian Day for the given birth date and time.
-    Timezone is fixed to Asia/Kolkata.
+    Async counterpart of `get_coordinates_from_place` for the ASGI server.
+    The OpenCage request is made with the given httpx.AsyncClient and the SQLite cache
+    is read and written in a thread, so the event loop is never blocked. Concurrent
+    misses for the same place share one request, which runs in a task of its own, so a
+    cancelled caller leaves it running for the others.
     """
-    timezone_name = 'Asia/Kolkata'
-    try:
-        tz = pytz.timezone(timezone_name)
-    except pytz.UnknownTimeZoneError:
-        raise ValueError(f"Unknown timezone: {timezone_name}")
+    coordinates = get_gazetteer().lookup(place_name)
+    count('kundali_cache_lookups_total', ('gazetteer', 'miss' if coordinates is None else 'hit'))
+    if coordinates is not None:
+        return coordinates
+
+    if not use_opencage_fallback:
+        raise ValueError(f"Coordinates not found for the place: {place_name}")
+
+    key = geocode_cache_key(place_name)
+    coordinates = await asyncio.to_thread(get_geocode_cache().get, key)
+    count('kundali_cache_lookups_total', ('geocode', 'miss' if coordinates is None else 'hit'))
+    if coordinates is not None:
+        return coordinates
+
+    task = _geocode_inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_geocode_async(place_name, key, client))
+        _geocode_inflight[key] = task
+        task.add_done_callback(functools.partial(_geocode_done, key))
+    return await asyncio.shield(task)
+
+def calculate_julian_day(date_of_birth, time_of_birth, timezone=DEFAULT_TIMEZONE):
+    """
+    Calculates the Julian Day for the given birth date and local time.
+    timezone is a pytz time zone or an IANA name such as 'Europe/London'; the offset in
+    force at the birth date (historical offsets and daylight saving time included) is
+    taken from the tz database. Use `timezone_index.timezone_at` for the birth place.
+    """
+    if isinstance(timezone, str):
+        try:
+            tz = pytz.timezone(timezone)
+        except pytz.UnknownTimeZoneError:
+            raise ValueError(f"Unknown timezone: {timezone}")
+    else:
+        tz = timezone
     
     try:
         datetime_of_birth = tz.localize(datetime.strptime(f"{date_of_birth} {time_of_birth}", '%Y-%m-%d %H:%M'))
@@ -86,11 +286,18 @@ def calculate_planetary_positions_and_houses(date_of_birth, time_of_birth, place
     # Get coordinates
     latitude, longitude = get_coordinates_from_place(place_name)
     
-    # Calculate Julian Day (UTC)
-    jd = calculate_julian_day(date_of_birth, time_of_birth)
+    # Calculate Julian Day (UTC) from the local time at the birth place
+    jd = calculate_julian_day(date_of_birth, time_of_birth, timezone_at(latitude, longitude))
     
-    # Set the sidereal mode with Lahiri ayanamsa
-    swe.set_sid_mode(swe.SIDM_LAHIRI)
+    return calculate_positions_for_jd(jd, latitude, longitude)
+
+def calculate_positions_for_jd(jd, latitude, longitude, ayanamsa=AYANAMSA, house_system=HOUSE_SYSTEM):
+    """
+    Calculates planetary positions and houses for a Julian Day (UTC) and location.
+    Returns the same tuple as `calculate_planetary_positions_and_houses`.
+    """
+    # Set the sidereal mode (Lahiri ayanamsa by default)
+    swe.set_sid_mode(ayanamsa)
     
     # Define planets to calculate with their corresponding Swiss Ephemeris constants
     planets = {
@@ -111,28 +318,37 @@ def calculate_planetary_positions_and_houses(date_of_birth, time_of_birth, place
     planet_in_houses = {}
     
     # Define the flags for sidereal calculations
-    iflag = swe.FLG_SIDEREAL
-    
-    # Calculate planetary positions using Swiss Ephemeris
-    for planet, planet_code in planets.items():
-        if planet == "Ketu":
-            # Ketu's position is always opposite Rahu
-            rahu_position, ret = swe.calc_ut(jd, swe.TRUE_NODE, iflag)
-            if ret < 0:
-                raise Exception(f"Error calculating position for Rahu: {swe.get_error_message(ret)}")
-            rahu_lon = rahu_position[0]  # Extract Rahu's longitude as float
-            ketu_lon = (rahu_lon + 180.0) % 360.0
-            planetary_positions["Ketu"] = ketu_lon
+    iflag = CALC_FLAGS
+    
+    # Calculate planetary positions from the precomputed tables when selected
+    with stage('ephemeris'):
+        tables = get_tables_for([jd], ayanamsa)
+        if tables is not None:
+            longitudes = tables.all_longitudes([jd])[0]
+            for column, planet in enumerate(planets):
+                planetary_positions[planet] = float(longitudes[column])
         else:
-            position_data, ret = swe.calc_ut(jd, planet_code, iflag)
-            if ret < 0:
-                raise Exception(f"Error calculating position for {planet}: {swe.get_error_message(ret)}")
-            lon = position_data[0]  # Extract longitude as float
-            planetary_positions[planet] = lon
+            # Calculate planetary positions using Swiss Ephemeris
+            for planet, planet_code in planets.items():
+                if planet == "Ketu":
+                    # Ketu's position is always opposite Rahu
+                    rahu_position, ret = swe.calc_ut(jd, swe.TRUE_NODE, iflag)
+                    if ret < 0:
+                        raise Exception(f"Error calculating position for Rahu: {swe.get_error_message(ret)}")
+                    rahu_lon = rahu_position[0]  # Extract Rahu's longitude as float
+                    ketu_lon = (rahu_lon + 180.0) % 360.0
+                    planetary_positions["Ketu"] = ketu_lon
+                else:
+                    position_data, ret = swe.calc_ut(jd, planet_code, iflag)
+                    if ret < 0:
+                        raise Exception(f"Error calculating position for {planet}: {swe.get_error_message(ret)}")
+                    lon = position_data[0]  # Extract longitude as float
+                    planetary_positions[planet] = lon
     
     # Calculate house cusps and ascendant using Whole Sign Houses in SIDEREAL mode
-    hsys = 'W'  # Use Whole Sign Houses
-    house_cusps, ascmc = swe.houses_ex(jd, latitude, longitude, hsys.encode(), iflag)
+    hsys = house_system
+    with stage('houses'):
+        house_cusps, ascmc = swe.houses_ex(jd, latitude, longitude, hsys.encode(), iflag)
     ascendant = ascmc[0]  # Ascendant in degrees
     
     # Calculate the sign of the Ascendant
@@ -151,353 +367,258 @@ def calculate_planetary_positions_and_houses(date_of_birth, time_of_birth, place
     
     return planetary_positions, planet_in_houses, planetary_signs, ascendant, asc_sign_name
 
-def calculate_vimshottari_dasha(jd_birth):
+def calculate_dasha_timeline(jd_birth, moon_lon=None):
+    """
+    Builds the Vimshottari Dasha timeline (all levels, see dasha_timeline.py) based on
+    the birth Julian Day. If the Moon's sidereal longitude is already known it can be
+    passed as moon_lon.
+    """
+    if moon_lon is None:
+        iflag = CALC_FLAGS
+        moon_position, ret = swe.calc_ut(jd_birth, swe.MOON, iflag)
+        if ret < 0:
+            raise Exception(f"Error calculating Moon position: {swe.get_error_message(ret)}")
+        moon_lon = moon_position[0]
+    return DashaTimeline.from_moon(jd_birth, moon_lon)
+
+def calculate_vimshottari_dasha(jd_birth, moon_lon=None):
     """
     Calculates the Vimshottari Dasha periods based on the birth Julian Day.
+    If the Moon's sidereal longitude is already known it can be passed as moon_lon.
     Returns a list of dictionaries with 'planet', 'start_date', and 'end_date'.
     """
-    # Vimshottari Dasha sequence and their lengths in years
-    dasha_sequence = [
-        ('Ketu', 7),
-        ('Venus', 20),
-        ('Sun', 6),
-        ('Moon', 10),
-        ('Mars', 7),
-        ('Rahu', 18),
-        ('Jupiter', 16),
-        ('Saturn', 19),
-        ('Mercury', 17)
-    ]
+    return calculate_dasha_timeline(jd_birth, moon_lon).mahadashas()
 
-    # Get the Moon's nakshatra at birth
-    iflag = swe.FLG_SIDEREAL
-    moon_position, ret = swe.calc_ut(jd_birth, swe.MOON, iflag)
-    if ret < 0:
-        raise Exception(f"Error calculating Moon position: {swe.get_error_message(ret)}")
-    moon_lon = moon_position[0]
-    nakshatra_number = int((moon_lon % 360) / 13.3333333)  # Each nakshatra is ~13.3333 degrees
-
-    # Determine the starting dasha
-    dasha_order = dasha_sequence[nakshatra_number % 9:] + dasha_sequence[:nakshatra_number % 9]
-
-    # Calculate the fraction of the nakshatra completed
-    nakshatra_pada = (moon_lon % 13.3333333) / 13.3333333  # Fraction completed
-    balance_years = dasha_order[0][1] * (1 - nakshatra_pada)
-
-    # Calculate Dasha periods
-    dasha_periods = []
-
-    # Convert jd_birth to datetime
-    year, month, day, hour = swe.revjul(jd_birth, swe.GREG_CAL)
-    int_hour = int(hour)
-    minute = int((hour - int_hour) * 60)
-    second = int((((hour - int_hour) * 60) - minute) * 60)
-    current_time = datetime(year, month, day, int_hour, minute, second)
-
-    # First Dasha
-    start_date = current_time
-    end_date = start_date + timedelta(days=balance_years * 365.25)
-    dasha_periods.append({
-        'planet': dasha_order[0][0],
-        'start_date': start_date,
-        'end_date': end_date
-    })
-    current_time = end_date
-
-    # Subsequent Dashas
-    for planet, years in dasha_order[1:]:
-        start_date = current_time
-        end_date = start_date + timedelta(days=years * 365.25)
-        dasha_periods.append({
-            'planet': planet,
-            'start_date': start_date,
-            'end_date': end_date
-        })
-        current_time = end_date
-
-    return dasha_periods
-
-def get_current_dasha(dasha_periods):
-    """
-    Finds the current Mahadasha from the list of Dasha periods.
-    """
-    current_time = datetime.utcnow()
-    current_dasha = None
-    for dasha in dasha_periods:
-        if dasha['start_date'] <= current_time <= dasha['end_date']:
-            current_dasha = dasha
-            break
-    return current_dasha
-
-def calculate_antardasha(current_dasha, dasha_periods):
-    """
-    Calculates the current Antardasha within the current Mahadasha.
-    """
-    if not current_dasha:
-        return None  # No current Mahadasha found
-
-    # Vimshottari Dasha cycle has a total of 120 years
-    # Each Mahadasha is divided into Antardashas based on the sequence
-    dasha_sequence = [
-        'Ketu', 'Venus', 'Sun', 'Moon', 'Mars', 
-        'Rahu', 'Jupiter', 'Saturn', 'Mercury'
+def get_current_periods(timeline, at=None, depth=2):
+    """
+    Finds the Dasha periods active at a moment (now by default), from the Mahadasha
+    down to depth, with one bisect over the timeline's boundaries.
+    Returns a list of dictionaries with 'planet', 'start_date', and 'end_date';
+    empty if the moment is outside the timeline.
+    """
+    jd = datetime_to_jd(at or datetime.utcnow())
+    return [
+        {'planet': DASHA_PLANETS[period['planet']], 'start_date': jd_to_datetime(period['start_jd']),
+         'end_date': jd_to_datetime(period['end_jd'])}
+        for period in timeline.active_at(jd, depth)
     ]
 
-    mahadasha_planet = current_dasha['planet']
-    try:
-        start_index = dasha_sequence.index(mahadasha_planet)
-    except ValueError:
-        raise Exception(f"Mahadasha planet {mahadasha_planet} not found in the sequence.")
-
-    # Define Antardasha sequence starting from Mahadasha planet
-    antardasha_sequence = dasha_sequence[start_index:] + dasha_sequence[:start_index]
-
-    # Define the lengths of each Antardasha in years
-    antardasha_lengths = {
-        'Ketu': 7,
-        'Venus': 20,
-        'Sun': 6,
-        'Moon': 10,
-        'Mars': 7,
-        'Rahu': 18,
-        'Jupiter': 16,
-        'Saturn': 19,
-        'Mercury': 17
-    }
-
-    # Total Mahadasha duration in days
-    total_dasha_duration = (current_dasha['end_date'] - current_dasha['start_date']).days
-
-    # Calculate the duration of each Antardasha
-    antardasha_periods = []
-    cumulative_days = 0
-    for planet in antardasha_sequence:
-        duration_years = antardasha_lengths[planet]
-        duration_days = (duration_years / 120.0) * total_dasha_duration
-        start = current_dasha['start_date'] + timedelta(days=cumulative_days)
-        end = start + timedelta(days=duration_days)
-        antardasha_periods.append({
-            'planet': planet,
-            'start_date': start,
-            'end_date': end
-        })
-        cumulative_days += duration_days
-
-    # Find current Antardasha
-    current_antardasha = None
-    for antardasha in antardasha_periods:
-        if antardasha['start_date'] <= datetime.utcnow() <= antardasha['end_date']:
-            current_antardasha = antardasha
-            break
-
-    return current_antardasha
-
-def determine_house_rulers(asc_sign):
-    """
-    Determines the ruling planet for each house based on the Ascendant sign using Whole Sign Houses.
-    """
-    # Each house corresponds to a sign in Whole Sign Houses
-    sign_rulers = {
-        "Aries": "Mars",
-        "Taurus": "Venus",
-        "Gemini": "Mercury",
-        "Cancer": "Moon",
-        "Leo": "Sun",
-        "Virgo": "Mercury",
-        "Libra": "Venus",
-        "Scorpio": "Mars",
-        "Sagittarius": "Jupiter",
-        "Capricorn": "Saturn",
-        "Aquarius": "Saturn",
-        "Pisces": "Jupiter"
-    }
-    
-    house_rulers = {}
-    for house in range(1, 13):
-        # In Whole Sign Houses, each house corresponds to a sign
-        sign_index = (asc_sign + house - 2) % 12 + 1  # Adjusted for 1-based indexing
-        sign_name_str = sign_name(sign_index)
-        ruler = sign_rulers.get(sign_name_str, "Unknown")
-        house_rulers[house] = ruler
-    return house_rulers
-
-def get_planetary_strength(planet, sign):
-    """
-    Determines the strength of a planet based on its sign.
-    Returns:
-        strength: String indicating the strength ('Strong', 'Exalted', 'Debilitated', 'Weak', 'Neutral')
-        is_benefic: Boolean indicating if the planet is benefic
+def calculate_chart(jd, latitude, longitude, ayanamsa=AYANAMSA, house_system=HOUSE_SYSTEM):
     """
-    # Define benefic and malefic planets
-    benefics = ['Sun', 'Venus', 'Jupiter', 'Mercury', 'Moon']
-    malefics = ['Mars', 'Saturn', 'Rahu', 'Ketu']
-    
-    # Define exaltation and debilitation signs
-    exaltation = {
-        'Sun': 'Aries',
-        'Moon': 'Taurus',
-        'Mars': 'Capricorn',
-        'Mercury': 'Virgo',
-        'Jupiter': 'Cancer',
-        'Venus': 'Pisces',
-        'Saturn': 'Libra'
-        # Rahu and Ketu have no exaltation/debilitation
-    }
-    
-    debilitation = {
-        'Sun': 'Libra',
-        'Moon': 'Scorpio',
-        'Mars': 'Cancer',
-        'Mercury': 'Pisces',
-        'Jupiter': 'Capricorn',
-        'Venus': 'Virgo',
-        'Saturn': 'Aries'
-        # Rahu and Ketu have no exaltation/debilitation
-    }
-    
-    # Define own signs
-    own_signs = {
-        'Sun': ['Leo'],
-        'Moon': ['Cancer'],
-        'Mars': ['Aries', 'Scorpio'],
-        'Mercury': ['Gemini', 'Virgo'],
-        'Jupiter': ['Sagittarius', 'Pisces'],
-        'Venus': ['Taurus', 'Libra'],
-        'Saturn': ['Capricorn', 'Aquarius']
-        # Rahu and Ketu do not have own signs
-    }
-    
-    # Determine strength
-    if planet in exaltation and sign == exaltation[planet]:
-        strength = 'Exalted'
-    elif planet in debilitation and sign == debilitation[planet]:
-        strength = 'Debilitated'
-    elif planet in own_signs and sign in own_signs[planet]:
-        strength = 'Strong'
-    elif planet in malefics and sign in ['Cancer', 'Capricorn', 'Virgo', 'Pisces']:
-        strength = 'Weak'
-    elif planet in benefics and sign in ['Scorpio', 'Libra', 'Capricorn', 'Aquarius']:
-        strength = 'Weak'
-    else:
-        strength = 'Neutral'
-    
-    # Determine if benefic
-    is_benefic = planet in benefics
-    
-    return strength, is_benefic
+    Calculates the time-invariant part of a Kundali: positions, the ascendant and the
+    Dasha timeline. Nothing here depends on the current date, so the result can be
+    cached indefinitely.
+    Returns a Chart (see chart_model.py) without current Dasha periods.
+    """
+    planetary_positions, _, _, ascendant, _ = calculate_positions_for_jd(
+        jd, latitude, longitude, ayanamsa, house_system
+    )
+    longitudes = [planetary_positions[planet] for planet in PLANETS]
+    with stage('dasha'):
+        timeline = calculate_dasha_timeline(jd, moon_lon=planetary_positions['Moon'])
+    return Chart(longitudes, ascendant, jd, timeline)
 
-def make_personalized_report(planet_in_houses, house_rulers, dasha_periods, current_dasha, current_antardasha, planetary_positions, planetary_signs, asc_sign_name, ascendant):
+def get_cached_chart(jd, latitude, longitude, ayanamsa=AYANAMSA, house_system=HOUSE_SYSTEM):
     """
-    Creates a personalized astrological report without predictions.
-    Returns a dictionary containing all relevant astrological data.
+    Returns the time-invariant chart for the inputs, computing and caching it on a miss.
     """
-    report = {}
-    
-    # Add planetary information
-    for planet, house in planet_in_houses.items():
-        sign = planetary_signs.get(planet, "Unknown")
-        strength, is_benefic = get_planetary_strength(planet, sign)
-        report[planet] = {
-            'house': house,
-            'house_ruler': house_rulers.get(house, "Unknown"),
-            'strength': strength,
-            'benefic': is_benefic,
-            'position': planetary_positions.get(planet, 0),
-            'planetary_sign': sign
-        }
-    
-    # Add Dasha information
-    report['Mahadasha'] = {}
-    if current_dasha:
-        report['Mahadasha'] = {
-            'planet': current_dasha['planet'],
-            'start_date': current_dasha['start_date'].strftime('%Y-%m-%d'),
-            'end_date': current_dasha['end_date'].strftime('%Y-%m-%d')
-        }
-    
-    report['Antardasha'] = {}
-    if current_antardasha:
-        report['Antardasha'] = {
-            'planet': current_antardasha['planet'],
-            'start_date': current_antardasha['start_date'].strftime('%Y-%m-%d'),
-            'end_date': current_antardasha['end_date'].strftime('%Y-%m-%d')
-        }
-
-    # Prepare overall summary
-    kundali_summary = prepare_kundali_summary(
-        planetary_positions, planet_in_houses, house_rulers, report, asc_sign_name, ascendant
-    )
-    
-    report['kundali_summary'] = kundali_summary
-    
-    # Add additional data if necessary
-    report['planetary_positions'] = planetary_positions
-    report['planet_in_houses'] = planet_in_houses
-    report['house_rulers'] = house_rulers
-    report['dasha_periods'] = dasha_periods
-    report['current_dasha'] = current_dasha
-    report['current_antardasha'] = current_antardasha
-    
-    return report
-
-def prepare_kundali_summary(planetary_positions, planet_in_houses, house_rulers, report, asc_sign_name, ascendant):
-    """
-    Prepares a detailed summary of the Kundali report to be used as context for the chatbot.
-    """
-    summary = "Kundali Report Summary:\n"
-    summary += f"Ascendant (Lagna): {asc_sign_name} ({ascendant:.2f}°)\n\n"
-    summary += "Planetary Positions:\n"
-    for planet, details in report.items():
-        if planet in ['Mahadasha', 'Antardasha', 'kundali_summary']:
-            continue
-        sign_number = int(details['position'] / 30) + 1
-        sign_number = sign_number if sign_number <= 12 else sign_number - 12
-        sign_name_str = sign_name(sign_number)
-        summary += (f"{planet}: {details['position']:.2f}° in {sign_name_str}, "
-                   f"House {details['house']} ({details['house_ruler']}), "
-                   f"Strength: {details['strength']}, Nature: {'Benefic' if details['benefic'] else 'Malefic'}\n")
-    
-    summary += "\nCurrent Mahadasha: "
-    if report.get('Mahadasha'):
-        summary += (f"{report['Mahadasha']['planet']} (from {report['Mahadasha']['start_date']} "
-                   f"to {report['Mahadasha']['end_date']})\n")
-    else:
-        summary += "Not Found\n"
-    
-    summary += "Current Antardasha: "
-    if report.get('Antardasha'):
-        summary += (f"{report['Antardasha']['planet']} (from {report['Antardasha']['start_date']} "
-                   f"to {report['Antardasha']['end_date']})\n")
-    else:
-        summary += "No current Antardasha found.\n"
-    
-    return summary
+    cache = get_chart_cache()
+    key = chart_cache_key(jd, latitude, longitude, ayanamsa, house_system)
+    chart = cache.get(key)
+    count('kundali_cache_lookups_total', ('chart', 'miss' if chart is None else 'hit'))
+    if chart is None:
+        chart = calculate_chart(jd, latitude, longitude, ayanamsa, house_system)
+        cache.set(key, chart)
+    return chart
+
+def make_report_from_chart(chart, varga_names=None, at=None):
+    """
+    Returns a copy of a (possibly cached) chart whose current Mahadasha, Antardasha and
+    summaries refer to a moment (now by default), with the requested vargas. This runs
+    on every request, so cached charts never carry a stale "current" period; the views
+    are derived lazily from the chart's positions.
+    """
+    return chart.at(datetime_to_jd(at or datetime.utcnow()), varga_names)
 
-def calculate_kundali(date_of_birth, time_of_birth, place_name):
+def calculate_kundali(date_of_birth, time_of_birth, place_name, ayanamsa=AYANAMSA, vargas=None):
     """
     High-level function to calculate Kundali based on user input.
-    Returns a dictionary with all relevant astrological data.
+    ayanamsa selects the Swiss Ephemeris sidereal mode (Lahiri by default).
+    vargas opts in to divisional charts: True for DEFAULT_VARGAS or a list of names
+    such as ['D9', 'D10'] (see vargas.py); they are returned as the chart's `vargas`.
+    Returns a Chart (see chart_model.py) with all relevant astrological data.
     """
-    # Step 1: Calculate planetary positions and houses
-    planetary_positions, planet_in_houses, planetary_signs, ascendant, asc_sign_name = calculate_planetary_positions_and_houses(
-        date_of_birth, time_of_birth, place_name
-    )
-    
-    # Step 2: Determine house rulers
-    house_rulers = determine_house_rulers(int(ascendant / 30) + 1)
+    # Step 1: Resolve the birth place
+    with stage('geocode'):
+        latitude, longitude = get_coordinates_from_place(place_name)
     
-    # Step 3: Calculate Dasha periods
-    jd_birth = calculate_julian_day(date_of_birth, time_of_birth)
-    dasha_periods = calculate_vimshottari_dasha(jd_birth)
-    current_dasha = get_current_dasha(dasha_periods)
-    current_antardasha = calculate_antardasha(current_dasha, dasha_periods)
+    return calculate_kundali_at(date_of_birth, time_of_birth, latitude, longitude, ayanamsa, vargas)
+
+def calculate_kundali_at(date_of_birth, time_of_birth, latitude, longitude, ayanamsa=AYANAMSA, vargas=None):
+    """
+    Same as `calculate_kundali` for a birth place that is already resolved to coordinates.
+    """
+    varga_names = normalize_vargas(vargas) if vargas else None
+
+    # Step 1: Resolve the birth time in the time zone of the birth place
+    with stage('timezone'):
+        tz = timezone_at(latitude, longitude)
+    with stage('julian_day'):
+        jd_birth = calculate_julian_day(date_of_birth, time_of_birth, tz)
     
-    # Step 4: Create personalized report
-    report = make_personalized_report(
-        planet_in_houses, house_rulers, dasha_periods, current_dasha, current_antardasha,
-        planetary_positions, planetary_signs, asc_sign_name, ascendant
-    )
+    # Step 2: Positions, houses, house rulers and Dasha periods (cached)
+    chart = get_cached_chart(jd_birth, latitude, longitude, ayanamsa)
     
-    return report
+    # Step 3: Current Dasha periods, personalized report and divisional charts (lazy)
+    return make_report_from_chart(chart, varga_names)
+
+
+def calculate_kundali_batch(records, vargas=None):
+    """
+    Calculates Kundali reports for many births at once.
+
+    Work is grouped so that each distinct place is geocoded once, each distinct
+    Julian Day is computed once per planet, and sign/house assignment runs as
+    NumPy array operations over the whole batch.
 
+    Parameters:
+        records (list): Dicts with 'date_of_birth', 'time_of_birth' and 'place_of_birth'
+            keys, or (date_of_birth, time_of_birth, place_name) tuples. A dict may also
+            carry 'latitude' and 'longitude' to skip geocoding.
+        vargas: Divisional charts to add to every report, as in `calculate_kundali`;
+            they are computed for the whole batch in one vectorized pass.
 
+    Returns:
+        list: One entry per record, in input order. Each entry is the Chart returned by
+            `calculate_kundali`, or {'error': message} if that record failed.
+    """
+    results = [None] * len(records)
+    varga_names = normalize_vargas(vargas) if vargas else None
+
+    # Step 1: Resolve coordinates and Julian Days, once per distinct input
+    coordinates = {}
+    julian_days = {}
+    valid_indices = []
+    jd_list = []
+    lat_list = []
+    lon_list = []
+    with stage('resolve'):
+        for index, record in enumerate(records):
+            try:
+                if isinstance(record, dict):
+                    date_of_birth = record['date_of_birth']
+                    time_of_birth = record['time_of_birth']
+                    place_name = record.get('place_of_birth')
+                    latitude = record.get('latitude')
+                    longitude = record.get('longitude')
+                else:
+                    date_of_birth, time_of_birth, place_name = record
+                    latitude = longitude = None
+
+                if latitude is None or longitude is None:
+                    if place_name not in coordinates:
+                        coordinates[place_name] = get_coordinates_from_place(place_name)
+                    latitude, longitude = coordinates[place_name]
+
+                tz = timezone_at(float(latitude), float(longitude))
+                birth_key = (date_of_birth, time_of_birth, tz.zone)
+                if birth_key not in julian_days:
+                    julian_days[birth_key] = calculate_julian_day(date_of_birth, time_of_birth, tz)
+            except Exception as e:
+                results[index] = {'error': str(e)}
+                continue
+
+            valid_indices.append(index)
+            jd_list.append(julian_days[birth_key])
+            lat_list.append(float(latitude))
+            lon_list.append(float(longitude))
+
+    if not valid_indices:
+        return results
+
+    jds = np.array(jd_list, dtype=np.float64)
+    latitudes = np.array(lat_list, dtype=np.float64)
+    longitudes = np.array(lon_list, dtype=np.float64)
+
+    # Step 2: Planetary longitudes, one calc_ut per distinct (Julian Day, planet)
+    swe.set_sid_mode(AYANAMSA)
+    iflag = CALC_FLAGS
+    unique_jds, jd_index = np.unique(jds, return_inverse=True)
+    planet_codes = [swe.SUN, swe.MOON, swe.MARS, swe.MERCURY, swe.JUPITER,
+                    swe.VENUS, swe.SATURN, swe.TRUE_NODE]
+    planet_names = ['Sun', 'Moon', 'Mars', 'Mercury', 'Jupiter', 'Venus', 'Saturn', 'Rahu', 'Ketu']
+    # Error message by unique Julian Day row; only the charts of that day fail
+    jd_errors = {}
+    with stage('ephemeris'):
+        tables = get_tables_for(unique_jds)
+        if tables is not None:
+            # All distinct Julian Days for all planets in one vectorized evaluation
+            unique_positions = tables.all_longitudes(unique_jds)
+        else:
+            unique_positions = np.empty((len(unique_jds), len(planet_names)), dtype=np.float64)
+            for column, (planet, planet_code) in enumerate(zip(planet_names, planet_codes)):
+                for row, jd in enumerate(unique_jds):
+                    if row in jd_errors:
+                        continue
+                    try:
+                        position_data, ret = swe.calc_ut(float(jd), planet_code, iflag)
+                        if ret < 0:
+                            raise Exception(swe.get_error_message(ret))
+                    except Exception as e:
+                        jd_errors[row] = f"Error calculating position for {planet}: {e}"
+                        continue
+                    unique_positions[row, column] = position_data[0]
+            # Ketu's position is always opposite Rahu
+            unique_positions[:, 8] = (unique_positions[:, 7] + 180.0) % 360.0
+        positions = unique_positions[jd_index]
+    errors = {row: jd_errors[jd_index[row]] for row in range(len(jds)) if jd_index[row] in jd_errors}
+
+    # Step 3: Ascendants, one houses_ex per distinct (Julian Day, latitude, longitude)
+    hsys = HOUSE_SYSTEM.encode()
+    ascendants = np.zeros(len(jds), dtype=np.float64)
+    ascendant_cache = {}
+    with stage('houses'):
+        for row in range(len(jds)):
+            if row in errors:
+                continue
+            key = (jds[row], latitudes[row], longitudes[row])
+            if key not in ascendant_cache:
+                try:
+                    house_cusps, ascmc = swe.houses_ex(float(jds[row]), float(latitudes[row]),
+                                                       float(longitudes[row]), hsys, iflag)
+                    ascendant_cache[key] = ascmc[0]
+                except Exception as e:
+                    ascendant_cache[key] = e
+            if isinstance(ascendant_cache[key], Exception):
+                errors[row] = f"Error calculating houses: {ascendant_cache[key]}"
+                continue
+            ascendants[row] = ascendant_cache[key]
+
+    # Charts that failed are reported on their own and left out of the remaining steps
+    if errors:
+        for row, message in errors.items():
+            results[valid_indices[row]] = {'error': message}
+        keep = np.array([row not in errors for row in range(len(jds))])
+        valid_indices = [index for index, kept in zip(valid_indices, keep) if kept]
+        if not valid_indices:
+            return results
+        jds, positions, ascendants = jds[keep], positions[keep], ascendants[keep]
+
+    # Step 4: Divisional charts for the whole batch; signs and houses are derived per chart
+    if varga_names:
+        with stage('vargas'):
+            varga_arrays = calculate_vargas(positions, ascendants, varga_names)
+
+    # Step 5: One compact Chart per record; reports and summaries are derived lazily
+    as_of_jd = datetime_to_jd(datetime.utcnow())
+    with stage('charts'):
+        for row, index in enumerate(valid_indices):
+            try:
+                chart = Chart(positions[row], ascendants[row], jds[row], as_of_jd=as_of_jd, varga_names=varga_names)
+                if varga_names:
+                    chart.seed_view('varga_arrays', tuple(array[row] for array in varga_arrays))
+                results[index] = chart
+            except Exception as e:
+                results[index] = {'error': str(e)}
+
+    return results
@@ -1,65 +1,494 @@
 # kundali_chatbot.py
 
 import openai
-from kundali_calculations import calculate_kundali, prepare_kundali_summary
+from kundali_calculations import calculate_kundali
+from cache_utils import LRUCache, SQLiteCache, TieredCache
+from llm_client import get_llm_client, chat_completion_async, stream_chat_completion_async
+from chat_sessions import get_session_store, trim_session, session_messages
+from metrics import count, stage, timed
+from retrieval_index import get_retrieval_index, chart_terms
+from chart_model import Chart
+from collections import deque
+from collections.abc import Mapping
+import asyncio
+import hashlib
+import json
 import os
+import re
+import threading
+import time
 
-def initialize_chatbot(kundali_summary, openai_api_key, model_id="ft:gpt-4o-2024-08-06:personal:kundali-analysis-2:ASW1lwhF"):
+SYSTEM_PROMPT = (
+    "You are an astrological chatbot. Utilize the following Kundali report to provide accurate and personalized predictions based on the user's queries. "
+    "Provide detailed life predictions categorized into sections such as Personality, Career, Relationships, Health, and Spirituality. "
+    "Use bullet points for clarity and ensure each section is comprehensive, regardless of how the user phrases their question.\n\n"
+)
+
+# Sampling parameters shared by every chat completion request
+COMPLETION_PARAMS = {
+    'temperature': 0.8,        # Adjusted for better coherence
+    'max_tokens': 2400,        # Sufficient for detailed responses
+    'top_p': 1.0,              # Nucleus sampling for slightly more diverse responses
+    'frequency_penalty': 0.1,  # Minimize repetitive content
+    'presence_penalty': 0.2,   # Encourage introducing new topics in responses
+}
+
+ERROR_PREFIX = "Error communicating with the chatbot"
+
+# Chart summary sent in the system prompt: the readable 'verbose' text or the
+# 'compact' table, which carries the same facts in fewer tokens
+SUMMARY_FORMAT = os.environ.get('KUNDALI_CHAT_SUMMARY_FORMAT', 'verbose')
+SUMMARY_KEYS = {
+    'verbose': 'kundali_summary',
+    'compact': 'kundali_summary_compact',
+}
+
+# Interpretation snippets retrieved for each question and added to the system prompt
+RETRIEVAL_ENABLED = os.environ.get('KUNDALI_RETRIEVAL', '1') == '1'
+SNIPPET_MAX_CHARS = 400
+
+# Completed answers are cached by (model, conversation), so repeated questions about the
+# same chart are not paid for twice. KUNDALI_LLM_CACHE=0 turns the cache off.
+RESPONSE_CACHE_ENABLED = os.environ.get('KUNDALI_LLM_CACHE', '1') == '1'
+RESPONSE_CACHE_SIZE = int(os.environ.get('KUNDALI_LLM_CACHE_SIZE', '4096'))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('KUNDALI_LLM_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get('KUNDALI_LLM_CACHE_TTL', str(24 * 3600)))
+RESPONSE_CACHE_PATH = os.environ.get('KUNDALI_LLM_CACHE_PATH')
+
+_response_cache = None
+_response_cache_bypassed = 0
+
+def get_response_cache():
+    """
+    Returns the shared LLM response cache, or None when it is disabled.
+    """
+    global _response_cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if _response_cache is None:
+        memory = LRUCache(
+            max_entries=RESPONSE_CACHE_SIZE,
+            ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+            max_bytes=RESPONSE_CACHE_MAX_BYTES,
+            sizeof=lambda key, answer: len(key) + len(answer.encode('utf-8'))
+        )
+        disk = SQLiteCache(
+            RESPONSE_CACHE_PATH, max_entries=None, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS,
+            max_bytes=RESPONSE_CACHE_MAX_BYTES
+        ) if RESPONSE_CACHE_PATH else None
+        _response_cache = TieredCache(memory, disk)
+    return _response_cache
+
+def normalize_question(message):
+    """
+    Normalizes a user message for cache lookups, so that "Tell me about my career?"
+    and "tell me about my  career" share an entry.
+    """
+    return re.sub(r'\s+', ' ', message.lower()).strip(' ?!.')
+
+def response_cache_key(conversation_history, model_id):
+    """
+    Builds the response cache key from the model, the completion parameters and the
+    conversation (system prompt verbatim, user messages normalized).
+    """
+    messages = [
+        [message['role'], normalize_question(message['content']) if message['role'] == 'user' else message['content']]
+        for message in conversation_history
+    ]
+    payload = json.dumps([model_id, COMPLETION_PARAMS, messages], sort_keys=True, ensure_ascii=False)
+    return 'llm:' + hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def cached_response(conversation_history, model_id, use_cache=True):
+    """
+    Returns (cache, key, answer) for a conversation. answer is None on a miss; cache
+    and key are None when caching is disabled or bypassed for this request.
+    """
+    global _response_cache_bypassed
+    cache = get_response_cache()
+    if cache is None or not use_cache:
+        if cache is not None:
+            _response_cache_bypassed += 1
+            count('kundali_cache_lookups_total', ('llm_response', 'bypass'))
+        return None, None, None
+    key = response_cache_key(conversation_history, model_id)
+    answer = cache.get(key)
+    count('kundali_cache_lookups_total', ('llm_response', 'miss' if answer is None else 'hit'))
+    return cache, key, answer
+
+def response_cache_stats():
+    """
+    Returns hit/miss counters and sizes of the LLM response cache.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return {'enabled': False}
+    stats = cache.stats()
+    memory = stats['memory']
+    # Every lookup reaches the memory tier; misses there may still be served from disk
+    lookups = memory['hits'] + memory['misses']
+    hits = memory['hits'] + (stats['disk']['hits'] if 'disk' in stats else 0)
+    stats.update({
+        'enabled': True,
+        'hits': hits,
+        'misses': lookups - hits,
+        'hit_rate': hits / lookups if lookups else 0.0,
+        'bypassed': _response_cache_bypassed,
+    })
+    return stats
+
+class StreamingStats:
+    """
+    Aggregates time-to-first-token and total duration of streamed responses.
+    """
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._ttft = deque(maxlen=window)
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def record(self, outcome, ttft_seconds=None):
+        with self._lock:
+            if outcome == 'completed':
+                self.completed += 1
+            elif outcome == 'cancelled':
+                self.cancelled += 1
+            else:
+                self.failed += 1
+            if ttft_seconds is not None:
+                self._ttft.append(ttft_seconds)
+
+    def snapshot(self):
+        """
+        Returns counters and time-to-first-token percentiles (in ms) over the recent window.
+        """
+        with self._lock:
+            samples = sorted(self._ttft)
+            stats = {'completed': self.completed, 'cancelled': self.cancelled, 'failed': self.failed}
+        for name, quantile in (('ttft_p50_ms', 0.5), ('ttft_p95_ms', 0.95), ('ttft_p99_ms', 0.99)):
+            stats[name] = samples[min(int(quantile * len(samples)), len(samples) - 1)] * 1000.0 if samples else None
+        return stats
+
+streaming_stats = StreamingStats()
+
+def sse_event(event, data):
+    """
+    Formats one Server-Sent Event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def parse_stream_line(line):
+    """
+    Extracts the text delta from one line of an OpenAI-style streaming response.
+    Returns None for keep-alives and empty deltas, and False for the final [DONE] line.
+    """
+    if not line or not line.startswith('data:'):
+        return None
+    payload = line[5:].strip()
+    if payload == '[DONE]':
+        return False
+    choices = json.loads(payload).get('choices') or [{}]
+    return choices[0].get('delta', {}).get('content') or None
+
+def select_kundali_summary(kundali_data, summary_format=None):
+    """
+    Picks the chart summary in the requested format from a Kundali report or a /kundali
+    response, falling back to the verbose summary for unknown formats or when the
+    requested one is not present.
+    
+    Parameters:
+        kundali_data (dict): A report from `calculate_kundali` or a /kundali response.
+        summary_format (str): 'verbose' or 'compact' (default is SUMMARY_FORMAT).
+        
+    Returns:
+        str: The summary, or None if kundali_data has none.
+    """
+    summary = kundali_data.get(SUMMARY_KEYS.get(summary_format or SUMMARY_FORMAT, 'kundali_summary'))
+    if summary is None:
+        summary = kundali_data.get('kundali_summary')
+    return summary
+
+def build_system_prompt(kundali_summary):
+    """
+    Builds the system prompt that gives the chatbot the Kundali report as context.
+    """
+    return SYSTEM_PROMPT + kundali_summary
+
+def initialize_chatbot(kundali_summary, openai_api_key, model_id="ft:gpt-4o-2024-08-06:personal:kundali-analysis-2:ASW1lwhF",
+                       summary_format=None):
     """
     Initializes the chatbot with the Kundali summary as context.
     
     Parameters:
-        kundali_summary (str): The summary of the Kundali report.
+        kundali_summary (str, dict or Chart): The summary of the Kundali report, or the report itself.
         openai_api_key (str): Your OpenAI API key.
         model_id (str): The OpenAI model ID to use (default is "gpt-4").
+        summary_format (str): 'verbose' or 'compact' summary when a report is given.
         
     Returns:
         tuple: A tuple containing the conversation history list and the model ID.
     """
     # Set OpenAI API key
     openai.api_key = openai_api_key
+
+    # A report may be a dict or a Chart (what calculate_kundali returns)
+    if isinstance(kundali_summary, (Mapping, Chart)):
+        kundali_summary = select_kundali_summary(kundali_summary, summary_format)
     
     # Initialize conversation history with the system prompt
     conversation_history = [
         {
             "role": "system",
-            "content": (
-                "You are an astrological chatbot. Utilize the following Kundali report to provide accurate and personalized predictions based on the user's queries. "
-                "Provide detailed life predictions categorized into sections such as Personality, Career, Relationships, Health, and Spirituality. "
-                "Use bullet points for clarity and ensure each section is comprehensive, regardless of how the user phrases their question.\n\n"
-                f"{kundali_summary}"
-            )
+            "content": build_system_prompt(kundali_summary)
         }
     ]
     
     return conversation_history, model_id
 
-def get_chatbot_response(conversation_history, model_id="gpt-4"):
+def request_chat_completion(conversation_history, model_id, key=None):
+    """
+    Calls the chat completion API through the shared LLM client (see llm_client.py) and
+    returns the answer text. Concurrent requests with the same key share one call.
+    Raises on failure.
+    """
+    with stage('llm'):
+        completion = get_llm_client().chat_completion(conversation_history, model_id, key=key, **COMPLETION_PARAMS)
+    return completion['choices'][0]['message']['content'].strip()
+
+@timed('chatbot_response')
+def get_chatbot_response(conversation_history, model_id="gpt-4", use_cache=True):
     """
     Sends the conversation history to OpenAI's API and retrieves the chatbot's response.
+    Answers are served from the response cache when the same question was already asked
+    about the same chart; concurrent identical requests share one API call.
     
     Parameters:
         conversation_history (list): The list of messages in the conversation history.
         model_id (str): The OpenAI model ID to use (default is "gpt-4").
+        use_cache (bool): Set to False to bypass the response cache.
         
     Returns:
         str: The chatbot's response or an error message.
     """
     
     try:
-        response = openai.ChatCompletion.create(
-            model=model_id,
-            messages=conversation_history,
-            temperature=0.8,        # Adjusted for better coherence
-            max_tokens=2400,        # Sufficient for detailed responses
-            top_p=1.0,             # Nucleus sampling for slightly more diverse responses
-            frequency_penalty=0.1,  # Minimize repetitive content
-            presence_penalty=0.2    # Encourage introducing new topics in responses
-        )
-        answer = response['choices'][0]['message']['content'].strip()
+        cache, key, answer = cached_response(conversation_history, model_id, use_cache)
+        if answer is not None:
+            return answer
+        answer = request_chat_completion(conversation_history, model_id, key)
+        if cache is not None:
+            cache.set(key, answer)
         return answer
     except Exception as e:
-        return f"Error communicating with the chatbot: {e}"
+        return f"{ERROR_PREFIX}: {e}"
+
+def stream_chatbot_response(conversation_history, model_id="gpt-4", use_cache=True, on_complete=None, route=None):
+    """
+    Streams the chatbot's response as Server-Sent Events while the model generates it.
+    
+    Yields 'token' events with each text delta, then a 'done' event with the
+    time-to-first-token and total duration, or an 'error' event. Closing the generator
+    (for example when the client disconnects) closes the upstream connection, which
+    cancels generation. A cached answer is sent as a single 'token' event, and a
+    completed stream is stored in the response cache.
+    
+    Parameters:
+        conversation_history (list): The list of messages in the conversation history.
+        model_id (str): The OpenAI model ID to use (default is "gpt-4").
+        use_cache (bool): Set to False to bypass the response cache.
+        on_complete (callable): Called with the full answer once it has been streamed.
+        route (str): Route the 'llm' stage is recorded for, since the stream outlives
+            the request's metrics hooks.
+        
+    Yields:
+        str: Formatted Server-Sent Events.
+    """
+    started = time.perf_counter()
+    cache, key, answer = cached_response(conversation_history, model_id, use_cache)
+    if answer is not None:
+        if on_complete is not None:
+            on_complete(answer)
+        yield sse_event('token', {'delta': answer})
+        yield sse_event('done', {'ttft_ms': None, 'total_ms': (time.perf_counter() - started) * 1000.0, 'cached': True})
+        return
+
+    ttft = None
+    parts = []
+    try:
+        with stage('llm', route):
+            with get_llm_client().stream_chat_completion(conversation_history, model_id, received=parts,
+                                                         **COMPLETION_PARAMS) as response:
+                for line in response.iter_lines(decode_unicode=True):
+                    delta = parse_stream_line(line)
+                    if delta is False:
+                        break
+                    if delta:
+                        if ttft is None:
+                            ttft = time.perf_counter() - started
+                        parts.append(delta)
+                        yield sse_event('token', {'delta': delta})
+        streaming_stats.record('completed', ttft)
+        answer = ''.join(parts).strip()
+        if cache is not None and answer:
+            cache.set(key, answer)
+        if on_complete is not None:
+            on_complete(answer)
+        yield sse_event('done', {
+            'ttft_ms': ttft * 1000.0 if ttft is not None else None,
+            'total_ms': (time.perf_counter() - started) * 1000.0,
+            'cached': False,
+        })
+    except GeneratorExit:
+        streaming_stats.record('cancelled', ttft)
+        raise
+    except Exception as e:
+        streaming_stats.record('failed', ttft)
+        yield sse_event('error', {'error': f"{ERROR_PREFIX}: {e}"})
+
+async def stream_chatbot_response_async(conversation_history, client, model_id="gpt-4", use_cache=True,
+                                        on_complete=None, route=None):
+    """
+    Async counterpart of `stream_chatbot_response` for the ASGI server. Cancelling the
+    consuming task (for example on client disconnect) closes the upstream stream. The
+    response cache and on_complete run in a thread, since both may touch SQLite.
+    """
+    started = time.perf_counter()
+    cache, key, answer = await asyncio.to_thread(cached_response, conversation_history, model_id, use_cache)
+    if answer is not None:
+        if on_complete is not None:
+            await asyncio.to_thread(on_complete, answer)
+        yield sse_event('token', {'delta': answer})
+        yield sse_event('done', {'ttft_ms': None, 'total_ms': (time.perf_counter() - started) * 1000.0, 'cached': True})
+        return
+
+    ttft = None
+    parts = []
+    try:
+        with stage('llm', route):
+            async with stream_chat_completion_async(client, conversation_history, model_id, received=parts,
+                                                    **COMPLETION_PARAMS) as response:
+                async for line in response.aiter_lines():
+                    delta = parse_stream_line(line)
+                    if delta is False:
+                        break
+                    if delta:
+                        if ttft is None:
+                            ttft = time.perf_counter() - started
+                        parts.append(delta)
+                        yield sse_event('token', {'delta': delta})
+        streaming_stats.record('completed', ttft)
+        answer = ''.join(parts).strip()
+        if cache is not None and answer:
+            await asyncio.to_thread(cache.set, key, answer)
+        if on_complete is not None:
+            await asyncio.to_thread(on_complete, answer)
+        yield sse_event('done', {
+            'ttft_ms': ttft * 1000.0 if ttft is not None else None,
+            'total_ms': (time.perf_counter() - started) * 1000.0,
+            'cached': False,
+        })
+    except (GeneratorExit, asyncio.CancelledError):
+        streaming_stats.record('cancelled', ttft)
+        raise
+    except Exception as e:
+        streaming_stats.record('failed', ttft)
+        yield sse_event('error', {'error': f"{ERROR_PREFIX}: {e}"})
+
+@timed('chatbot_response')
+async def get_chatbot_response_async(conversation_history, client, model_id="gpt-4", use_cache=True):
+    """
+    Async counterpart of `get_chatbot_response` for the ASGI server.
+    
+    Parameters:
+        conversation_history (list): The list of messages in the conversation history.
+        client (httpx.AsyncClient): Pooled HTTP client used for the request.
+        model_id (str): The OpenAI model ID to use (default is "gpt-4").
+        use_cache (bool): Set to False to bypass the response cache.
+        
+    Returns:
+        str: The chatbot's response or an error message.
+    """
+    try:
+        cache, key, answer = await asyncio.to_thread(cached_response, conversation_history, model_id, use_cache)
+        if answer is not None:
+            return answer
+        with stage('llm'):
+            completion = await chat_completion_async(client, conversation_history, model_id, key=key,
+                                                     **COMPLETION_PARAMS)
+        answer = completion['choices'][0]['message']['content'].strip()
+        if cache is not None:
+            await asyncio.to_thread(cache.set, key, answer)
+        return answer
+    except Exception as e:
+        return f"{ERROR_PREFIX}: {e}"
+
+def build_retrieval_context(message, chart=()):
+    """
+    Retrieves the interpretation snippets most relevant to the message and this chart,
+    formatted as a section of the system prompt.
+    """
+    snippets = get_retrieval_index().retrieve(message, chart)
+    if not snippets:
+        return ""
+    lines = []
+    for snippet in snippets:
+        text = snippet['interpretation']
+        if len(text) > SNIPPET_MAX_CHARS:
+            text = text[:SNIPPET_MAX_CHARS - 3].rstrip() + '...'
+        lines.append(f"- {text}")
+    return "\n\nRelevant interpretations:\n" + "\n".join(lines)
+
+def open_chat_session(session_id=None, kundali_data=None, summary_format=None):
+    """
+    Opens the chat session for a /chatbot request, or starts one from kundali_data.
+    
+    Parameters:
+        session_id (str): The session to continue (optional).
+        kundali_data (dict): A /kundali response or report; required for a new session.
+        summary_format (str): 'verbose' or 'compact' chart summary.
+        
+    Returns:
+        dict: The session. Raises KeyError for an unknown session without kundali_data.
+    """
+    kundali_summary = select_kundali_summary(kundali_data, summary_format) if kundali_data else None
+    session = get_session_store().open(session_id, kundali_summary)
+    if kundali_data:
+        session['chart_terms'] = chart_terms(kundali_data)
+    return session
+
+def start_session_turn(session, message, model_id="gpt-4", use_retrieval=True):
+    """
+    Adds the user's message to a chat session and returns the conversation history to
+    send to the model, with older turns trimmed to the session token budget.
+    
+    Parameters:
+        session (dict): A session from `open_chat_session`.
+        message (str): The user's new message.
+        model_id (str): The OpenAI model ID, used for token counting.
+        use_retrieval (bool): Add interpretation snippets relevant to the message.
+        
+    Returns:
+        list: The conversation history for this turn.
+    """
+    session['turns'].append({"role": "user", "content": message})
+    system_prompt = build_system_prompt(session['kundali_summary'])
+    if RETRIEVAL_ENABLED and use_retrieval:
+        with stage('retrieval'):
+            system_prompt += build_retrieval_context(message, session.get('chart_terms', ()))
+    with stage('trim_session'):
+        trim_session(session, system_prompt, model_id=model_id)
+    return session_messages(session, system_prompt)
+
+def finish_session_turn(session, answer):
+    """
+    Records the chatbot's answer and saves the session. Failed turns are not saved, so
+    the stored conversation only contains answered questions.
+    """
+    if not answer or answer.startswith(ERROR_PREFIX):
+        return
+    session['turns'].append({"role": "assistant", "content": answer})
+    # The question (never trimmed away) and the answer; appended if another turn was saved first
+    get_session_store().save(session, new_turns=session['turns'][-2:])
 
 def handle_chatbot_interaction(date_of_birth, time_of_birth, place_name, user_question):
     """
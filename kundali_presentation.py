@@ -0,0 +1,191 @@
+# kundali_presentation.py
+from datetime import datetime
+from kundali_calculations import calculate_kundali, sign_name
+from chart_model import PLANETS, SIGN_NAMES
+
+def display_ascendant_and_planetary_positions(report):
+    """
+    Retrieves the Ascendant sign and planetary positions from the Kundali chart.
+
+    Parameters:
+        report (Chart): The Kundali chart obtained from `calculate_kundali`.
+
+    Returns:
+        dict: A dictionary containing the Ascendant sign information and planetary positions.
+    """
+    planetary_info = {}
+    for planet, position, sign in zip(PLANETS, report.longitudes.tolist(), report.signs.tolist()):
+        planetary_info[planet] = {
+            'Position': f"{position:.2f}°",
+            'Sign': SIGN_NAMES[sign - 1]
+        }
+
+    ascendant_info = {
+        'Ascendant Sign': f"{report.asc_sign_name} ({report.ascendant:.2f}°)"
+    }
+
+    return {
+        'ascendant_info': ascendant_info,
+        'planetary_info': planetary_info
+    }
+
+def display_house_rulers(report):
+    """
+    Retrieves the ruling planets for each house from the Kundali chart.
+
+    Parameters:
+        report (Chart): The Kundali chart obtained from `calculate_kundali`.
+
+    Returns:
+        dict: A dictionary mapping each house to its ruling planet.
+    """
+    house_rulers_info = {}
+    for house, lord in enumerate(report.house_lords.tolist(), start=1):
+        house_rulers_info[f"House {house}"] = PLANETS[lord]
+    
+    return house_rulers_info
+
+def display_planets_in_houses(report):
+    """
+    Retrieves which planets are in which houses along with their strengths and nature.
+
+    Parameters:
+        report (Chart): The Kundali chart obtained from `calculate_kundali`.
+
+    Returns:
+        dict: A dictionary containing detailed information about each planet's house placement.
+    """
+    planets_info = {}
+    for planet, details in report.planets.items():
+        planets_info[planet] = {
+            'House': details['house'],
+            'House Ruler': details['house_ruler'],
+            'Strength': details['strength'],
+            'Nature': 'Benefic' if details['benefic'] else 'Malefic',
+            'Sign': details['planetary_sign']
+        }
+    
+    return planets_info
+
+def display_dasha_periods(report):
+    """
+    Retrieves the Vimshottari Dasha periods from the Kundali chart.
+
+    Parameters:
+        report (Chart): The Kundali chart obtained from `calculate_kundali`.
+
+    Returns:
+        list: A list of dictionaries, each containing details of a Dasha period.
+    """
+    dasha_periods = report.dasha_periods
+    
+    dasha_info = []
+    for dasha in dasha_periods:
+        dasha_info.append({
+            'Planet': dasha.get('planet', "Unknown"),
+            'Start Date': dasha.get('start_date', "").strftime('%Y-%m-%d') if isinstance(dasha.get('start_date'), datetime) else "",
+            'End Date': dasha.get('end_date', "").strftime('%Y-%m-%d') if isinstance(dasha.get('end_date'), datetime) else ""
+        })
+    
+    return dasha_info
+
+def display_current_dasha(report):
+    """
+    Retrieves the current Mahadasha period from the Kundali chart.
+
+    Parameters:
+        report (Chart): The Kundali chart obtained from `calculate_kundali`.
+
+    Returns:
+        dict or str: A dictionary containing current Mahadasha details or an error message.
+    """
+    current_dasha = report.current_dasha
+    
+    if current_dasha:
+        dasha_info = {
+            'Planet': current_dasha.get('planet', "Unknown"),
+            'Start Date': current_dasha.get('start_date', "").strftime('%Y-%m-%d') if isinstance(current_dasha.get('start_date'), datetime) else "",
+            'End Date': current_dasha.get('end_date', "").strftime('%Y-%m-%d') if isinstance(current_dasha.get('end_date'), datetime) else ""
+        }
+    else:
+        dasha_info = "No current Mahadasha found."
+    
+    return dasha_info
+
+def display_current_antardasha(report):
+    """
+    Retrieves the current Antardasha period from the Kundali chart.
+
+    Parameters:
+        report (Chart): The Kundali chart obtained from `calculate_kundali`.
+
+    Returns:
+        dict or str: A dictionary containing current Antardasha details or an error message.
+    """
+    current_antardasha = report.current_antardasha
+    
+    if current_antardasha:
+        antardasha_info = {
+            'Planet': current_antardasha.get('planet', "Unknown"),
+            'Start Date': current_antardasha.get('start_date', "").strftime('%Y-%m-%d') if isinstance(current_antardasha.get('start_date'), datetime) else "",
+            'End Date': current_antardasha.get('end_date', "").strftime('%Y-%m-%d') if isinstance(current_antardasha.get('end_date'), datetime) else ""
+        }
+    else:
+        antardasha_info = "No current Antardasha found."
+    
+    return antardasha_info
+
+def display_overall_summary(report):
+    """
+    Retrieves the overall Kundali summary from the Kundali chart.
+
+    Parameters:
+        report (Chart): The Kundali chart obtained from `calculate_kundali`.
+
+    Returns:
+        str: A string containing the overall Kundali summary.
+    """
+    summary = report.kundali_summary or "No summary available."
+    return summary
+
+def build_kundali_response(report):
+    """
+    Builds the JSON payload returned by the /kundali routes from a Kundali chart.
+
+    Parameters:
+        report (Chart): The Kundali chart obtained from `calculate_kundali`.
+
+    Returns:
+        dict: The ascendant, planetary, house and dasha sections plus the summary, and
+            the divisional charts when the report was calculated with vargas.
+    """
+    # The planetary and house sections are filled in one pass over the planets
+    planetary_info = {}
+    planets_info = {}
+    for planet, details in report.planets.items():
+        planetary_info[planet] = {
+            'Position': f"{details['position']:.2f}°",
+            'Sign': details['planetary_sign']
+        }
+        planets_info[planet] = {
+            'House': details['house'],
+            'House Ruler': details['house_ruler'],
+            'Strength': details['strength'],
+            'Nature': 'Benefic' if details['benefic'] else 'Malefic',
+            'Sign': details['planetary_sign']
+        }
+    current_dasha = display_current_dasha(report)
+    current_antardasha = display_current_antardasha(report)
+
+    response = {
+        'ascendant_info': {'Ascendant Sign': f"{report.asc_sign_name} ({report.ascendant:.2f}°)"},
+        'planetary_info': planetary_info,
+        'planets_info': planets_info,
+        'current_dasha': current_dasha,
+        'current_antardasha': current_antardasha,
+        'kundali_summary': report.kundali_summary,
+        'kundali_summary_compact': report.kundali_summary_compact,
+    }
+    if report.varga_names:
+        response['vargas'] = report.vargas
+    return response
@@ -0,0 +1,531 @@
+# llm_client.py
+"""
+Client for OpenAI-compatible chat completion APIs, shared by every chatbot request in
+a process.
+
+- Connections are pooled and kept alive: the sync path uses one `requests.Session`,
+  the async path the app's `httpx.AsyncClient`.
+- Concurrent identical requests share one API call (single flight).
+- A rate limiter budgets requests and tokens per minute with token buckets. Requests
+  over budget wait in a bounded queue. A request that cannot be sent before its
+  deadline, or that finds the queue full, fails at once with LLMBusyError instead of
+  being rejected by the provider.
+- Connection errors, timeouts, 429 and 5xx responses are retried with exponential
+  backoff and jitter, honouring Retry-After, but never past the request's deadline.
+  A 429 also pauses the limiter, so other requests back off too.
+
+KUNDALI_LLM_BASE_URL points the client at any OpenAI-compatible server, such as a
+local stub for load tests; it defaults to `openai.api_base`. The budgets apply per
+process, so set them to the account's limits divided by the number of server
+processes.
+"""
+
+import asyncio
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import httpx
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache_utils import SingleFlight
+from chat_sessions import count_message_tokens, count_tokens
+from metrics import count, stage
+
+LLM_BASE_URL = os.environ.get('KUNDALI_LLM_BASE_URL')
+LLM_API_KEY = os.environ.get('KUNDALI_LLM_API_KEY')
+
+# Keep-alive connections per process (sync path; see asgi_app.py for the async pool)
+LLM_POOL_SIZE = int(os.environ.get('KUNDALI_LLM_POOL_SIZE', '64'))
+
+# Rate limits; 0 disables a budget
+LLM_REQUESTS_PER_MINUTE = float(os.environ.get('KUNDALI_LLM_RPM', '500'))
+LLM_TOKENS_PER_MINUTE = float(os.environ.get('KUNDALI_LLM_TPM', '300000'))
+# Bursts may use up to this many seconds' worth of budget at once
+LLM_BURST_SECONDS = float(os.environ.get('KUNDALI_LLM_BURST_SECONDS', '10'))
+# Requests waiting for budget at any time; more are rejected with LLMBusyError
+LLM_MAX_QUEUED = int(os.environ.get('KUNDALI_LLM_MAX_QUEUED', '256'))
+
+# Seconds a call may take in total, including queueing and retries
+LLM_DEADLINE = float(os.environ.get('KUNDALI_LLM_DEADLINE', '120'))
+LLM_CONNECT_TIMEOUT = float(os.environ.get('KUNDALI_LLM_CONNECT_TIMEOUT', '10'))
+# Longest pause between two chunks of a streamed response
+LLM_STREAM_READ_TIMEOUT = float(os.environ.get('KUNDALI_LLM_STREAM_READ_TIMEOUT', '120'))
+LLM_MAX_RETRIES = int(os.environ.get('KUNDALI_LLM_MAX_RETRIES', '3'))
+LLM_BACKOFF_BASE = 0.5
+LLM_BACKOFF_MAX = 8.0
+# Pause after a 429 that carries no Retry-After
+RATE_LIMIT_PAUSE = 1.0
+
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class LLMBusyError(Exception):
+    """
+    Raised when a request cannot get rate-limit budget before its deadline, or too many
+    requests are already waiting for it.
+    """
+
+
+class TokenBucket:
+    """
+    Budget that refills at `per_minute` units per minute up to `capacity`. Units are
+    taken as soon as a request is admitted, so the level can go negative. Requests that
+    arrive later wait for the refill behind it, in arrival order.
+
+    Not thread-safe; RateLimiter serializes access.
+    """
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity or per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount, now):
+        """
+        Returns the seconds until `amount` units (at most `capacity`) are available.
+        """
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def refund(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RateLimiter:
+    """
+    Admits LLM requests against a requests-per-minute and a tokens-per-minute budget.
+
+    Parameters:
+        requests_per_minute (float): Request budget (0 for none).
+        tokens_per_minute (float): Prompt plus completion token budget (0 for none).
+        max_queued (int): Requests allowed to wait for budget at the same time.
+        burst_seconds (float): Seconds of budget that may be spent at once.
+    """
+    def __init__(self, requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                 max_queued=LLM_MAX_QUEUED, burst_seconds=LLM_BURST_SECONDS):
+        self._lock = threading.Lock()
+        self.requests = TokenBucket(requests_per_minute, max(1.0, requests_per_minute * burst_seconds / 60.0)) \
+            if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute * burst_seconds / 60.0) \
+            if tokens_per_minute > 0 else None
+        self.max_queued = max_queued
+        self.queued = 0
+        self.rejected = 0
+        self._paused_until = 0.0
+
+    def _reserve(self, tokens, deadline):
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if self.requests is not None:
+                wait = max(wait, self.requests.wait_time(1, now))
+            if self.tokens is not None:
+                wait = max(wait, self.tokens.wait_time(tokens, now))
+            busy = wait > 0 and (now + wait > deadline or self.queued >= self.max_queued)
+            if busy:
+                self.rejected += 1
+            else:
+                if self.requests is not None:
+                    self.requests.take(1)
+                if self.tokens is not None:
+                    self.tokens.take(tokens)
+                if wait > 0:
+                    self.queued += 1
+        if busy:
+            count('kundali_llm_requests_total', ('rejected',))
+            raise LLMBusyError("Chatbot is busy, try again shortly.")
+        return wait
+
+    def _dequeue(self):
+        with self._lock:
+            self.queued -= 1
+
+    def acquire(self, tokens, deadline):
+        """
+        Blocks until one request and `tokens` tokens may be sent. Raises LLMBusyError if
+        that would be after `deadline` (a time.monotonic() value) or the queue is full.
+        """
+        wait = self._reserve(tokens, deadline)
+        if wait > 0:
+            try:
+                with stage('llm_queue'):
+                    time.sleep(wait)
+            finally:
+                self._dequeue()
+
+    async def acquire_async(self, tokens, deadline):
+        """
+        Async counterpart of `acquire`.
+        """
+        wait = self._reserve(tokens, deadline)
+        if wait > 0:
+            try:
+                with stage('llm_queue'):
+                    await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.refund(tokens)
+                raise
+            finally:
+                self._dequeue()
+
+    def refund(self, tokens):
+        """
+        Returns unused tokens to the budget: those of failed attempts, and the part of a
+        reservation that the completion did not use.
+        """
+        if self.tokens is not None and tokens > 0:
+            with self._lock:
+                self.tokens.refund(tokens)
+
+    def pause(self, seconds):
+        """
+        Holds back every request for `seconds`, after the provider signalled a rate limit.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.wait_time(0, now)
+            return {
+                'queued': self.queued,
+                'rejected': self.rejected,
+                'requests_available': self.requests.level if self.requests is not None else None,
+                'tokens_available': self.tokens.level if self.tokens is not None else None,
+            }
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Returns the rate limiter shared by the sync and async paths of this process.
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RateLimiter()
+    return _rate_limiter
+
+
+def configure_api_key():
+    """
+    Loads the API key the apps send (KUNDALI_LLM_API_KEY, else OPENAI_API_KEY) into
+    openai.api_key. Raises RuntimeError when neither is set, so a server without a key
+    fails at start-up rather than on every chatbot request.
+    """
+    api_key = LLM_API_KEY or os.environ.get('OPENAI_API_KEY')
+    if not api_key:
+        raise RuntimeError("No LLM API key: set KUNDALI_LLM_API_KEY or OPENAI_API_KEY")
+    openai.api_key = api_key
+    return api_key
+
+
+def chat_completions_url(base_url=None):
+    return f"{(base_url or LLM_BASE_URL or openai.api_base).rstrip('/')}/chat/completions"
+
+
+def auth_headers(api_key=None):
+    return {'Authorization': f"Bearer {api_key or LLM_API_KEY or openai.api_key}"}
+
+
+def request_key(payload):
+    """
+    Single-flight key of a request payload.
+    """
+    return 'llm-request:' + hashlib.sha256(
+        json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def estimate_request_tokens(payload):
+    """
+    Tokens reserved for a request: its prompt plus the most the completion may use.
+    """
+    return count_message_tokens(payload['messages'], payload['model']) + payload.get('max_tokens', 0)
+
+
+def parse_retry_after(value):
+    """
+    Returns the seconds of a Retry-After header given in seconds, else None.
+    """
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt, retry_after, deadline, max_retries=LLM_MAX_RETRIES):
+    """
+    Returns the seconds to wait before retry number `attempt` + 1, or None when the
+    retries are used up or the wait would end past the deadline.
+    """
+    if attempt >= max_retries:
+        return None
+    # Full jitter, so clients that failed together do not retry together
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    if time.monotonic() + delay >= deadline:
+        return None
+    return delay
+
+
+def record_usage(limiter, model_id, usage, reserved_tokens):
+    """
+    Counts a completion's tokens and refunds the part of its reservation it did not use.
+    """
+    if not usage:
+        return
+    count('kundali_llm_tokens_total', (model_id, 'prompt'), usage.get('prompt_tokens', 0))
+    count('kundali_llm_tokens_total', (model_id, 'completion'), usage.get('completion_tokens', 0))
+    used = usage.get('total_tokens') or usage.get('prompt_tokens', 0) + usage.get('completion_tokens', 0)
+    limiter.refund(reserved_tokens - used)
+
+
+def stream_usage(payload, received):
+    """
+    Usage of a streamed completion, which carries no usage report: the prompt's tokens
+    plus those of the text deltas received.
+    """
+    prompt_tokens = count_message_tokens(payload['messages'], payload['model'])
+    completion_tokens = count_tokens(''.join(received), payload['model'])
+    return {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens}
+
+
+def _failed_attempt(limiter, attempt, tokens, deadline, error, status=None, retry_after=None):
+    """
+    Books a failed attempt and returns how long to wait before the next one; raises
+    `error` when there is none.
+    """
+    limiter.refund(tokens)
+    if status == 429:
+        limiter.pause(retry_after if retry_after is not None else RATE_LIMIT_PAUSE)
+    delay = retry_delay(attempt, retry_after, deadline)
+    if delay is None:
+        count('kundali_llm_requests_total', ('error',))
+        raise error
+    count('kundali_llm_requests_total', ('retried',))
+    return delay
+
+
+class LLMClient:
+    """
+    Sync chat completion client with a pooled keep-alive session, single-flight
+    coalescing, rate limiting and deadline-aware retries.
+
+    Parameters:
+        base_url (str): OpenAI-compatible API base URL (default: KUNDALI_LLM_BASE_URL,
+            then openai.api_base at call time).
+        api_key (str): API key (default: KUNDALI_LLM_API_KEY, then openai.api_key).
+        pool_size (int): Keep-alive connections kept open.
+        limiter (RateLimiter): Budget to draw from (default: the process-wide one).
+    """
+    def __init__(self, base_url=None, api_key=None, pool_size=LLM_POOL_SIZE, limiter=None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.limiter = limiter or get_rate_limiter()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._single_flight = SingleFlight()
+
+    def _send(self, payload, deadline, stream=False):
+        url = chat_completions_url(self.base_url)
+        tokens = estimate_request_tokens(payload)
+        attempt = 0
+        while True:
+            self.limiter.acquire(tokens, deadline)
+            remaining = max(0.001, deadline - time.monotonic())
+            status = retry_after = None
+            try:
+                response = self.session.post(
+                    url, headers=auth_headers(self.api_key), json=payload, stream=stream,
+                    timeout=(min(LLM_CONNECT_TIMEOUT, remaining), LLM_STREAM_READ_TIMEOUT if stream else remaining)
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    if response.status_code >= 400:
+                        response.close()
+                        self.limiter.refund(tokens)
+                        count('kundali_llm_requests_total', ('error',))
+                        response.raise_for_status()
+                    count('kundali_llm_requests_total', ('ok',))
+                    return response, tokens
+                status = response.status_code
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                error = requests.HTTPError(f"{status} Error from {url}", response=response)
+                response.close()
+            time.sleep(_failed_attempt(self.limiter, attempt, tokens, deadline, error, status, retry_after))
+            attempt += 1
+
+    def chat_completion(self, messages, model_id, key=None, deadline=None, **params):
+        """
+        Requests a chat completion and returns the decoded response. Concurrent calls
+        with the same key (by default, the same request) share one API call.
+
+        Parameters:
+            messages (list): The conversation.
+            model_id (str): The model.
+            key (str): Single-flight key, for callers that consider more requests equal.
+            deadline (float): time.monotonic() value by which the call must finish
+                (default: KUNDALI_LLM_DEADLINE seconds from now).
+            **params: Sampling parameters (temperature, max_tokens, ...).
+
+        Returns:
+            dict: The chat completion. Raises LLMBusyError or the last request error.
+        """
+        payload = {'model': model_id, 'messages': messages, **params}
+        deadline = deadline or time.monotonic() + LLM_DEADLINE
+
+        def request():
+            response, tokens = self._send(payload, deadline)
+            completion = response.json()
+            record_usage(self.limiter, model_id, completion.get('usage'), tokens)
+            return completion
+
+        return self._single_flight.do(key or request_key(payload), request)
+
+    @contextlib.contextmanager
+    def stream_chat_completion(self, messages, model_id, deadline=None, received=None, **params):
+        """
+        Context manager yielding the open `requests.Response` of a streamed completion.
+        Only the request is retried; the stream itself is not. Leaving the block closes
+        the connection, which cancels generation.
+
+        The caller appends each text delta it reads to `received`; on leaving the block
+        its tokens are counted and the unused part of the reservation (which assumed
+        max_tokens) is refunded. Without it the whole reservation is kept.
+        """
+        payload = {'model': model_id, 'messages': messages, 'stream': True, **params}
+        response, tokens = self._send(payload, deadline or time.monotonic() + LLM_DEADLINE, stream=True)
+        try:
+            response.encoding = 'utf-8'
+            yield response
+        finally:
+            response.close()
+            if received is not None:
+                record_usage(self.limiter, model_id, stream_usage(payload, received), tokens)
+
+
+_llm_client = None
+_llm_client_lock = threading.Lock()
+
+
+def get_llm_client():
+    """
+    Returns the shared sync LLM client.
+    """
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                _llm_client = LLMClient()
+    return _llm_client
+
+
+async def _send_async(client, payload, deadline, stream=False):
+    limiter = get_rate_limiter()
+    url = chat_completions_url()
+    tokens = estimate_request_tokens(payload)
+    attempt = 0
+    while True:
+        await limiter.acquire_async(tokens, deadline)
+        remaining = max(0.001, deadline - time.monotonic())
+        status = retry_after = None
+        request = client.build_request(
+            'POST', url, headers=auth_headers(), json=payload,
+            timeout=httpx.Timeout(LLM_STREAM_READ_TIMEOUT if stream else remaining,
+                                  connect=min(LLM_CONNECT_TIMEOUT, remaining))
+        )
+        try:
+            response = await client.send(request, stream=stream)
+        except httpx.TransportError as e:
+            error = e
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                if response.status_code >= 400:
+                    await response.aclose()
+                    limiter.refund(tokens)
+                    count('kundali_llm_requests_total', ('error',))
+                    response.raise_for_status()
+                count('kundali_llm_requests_total', ('ok',))
+                return response, tokens
+            status = response.status_code
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            error = httpx.HTTPStatusError(f"{status} Error from {url}", request=request, response=response)
+            await response.aclose()
+        await asyncio.sleep(_failed_attempt(limiter, attempt, tokens, deadline, error, status, retry_after))
+        attempt += 1
+
+
+# Single-flight key -> task running that API call
+_inflight = {}
+
+
+async def _complete_async(client, payload, deadline):
+    response, tokens = await _send_async(client, payload, deadline)
+    completion = response.json()
+    record_usage(get_rate_limiter(), payload['model'], completion.get('usage'), tokens)
+    return completion
+
+
+def _inflight_done(key, task):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        # Mark the exception as retrieved in case every caller has gone
+        task.exception()
+
+
+async def chat_completion_async(client, messages, model_id, key=None, deadline=None, **params):
+    """
+    Async counterpart of `LLMClient.chat_completion` over a pooled httpx.AsyncClient.
+    The API call runs in a task of its own that every caller with the same key awaits
+    through `asyncio.shield`, so a cancelled caller (say, a client that disconnected)
+    leaves the call running for the others.
+    """
+    payload = {'model': model_id, 'messages': messages, **params}
+    key = key or request_key(payload)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_complete_async(client, payload, deadline or time.monotonic() + LLM_DEADLINE))
+        _inflight[key] = task
+        task.add_done_callback(functools.partial(_inflight_done, key))
+    return await asyncio.shield(task)
+
+
+@contextlib.asynccontextmanager
+async def stream_chat_completion_async(client, messages, model_id, deadline=None, received=None, **params):
+    """
+    Async counterpart of `LLMClient.stream_chat_completion`, yielding an httpx.Response.
+    """
+    payload = {'model': model_id, 'messages': messages, 'stream': True, **params}
+    response, tokens = await _send_async(client, payload, deadline or time.monotonic() + LLM_DEADLINE, stream=True)
+    try:
+        yield response
+    finally:
+        await response.aclose()
+        if received is not None:
+            record_usage(get_rate_limiter(), model_id, stream_usage(payload, received), tokens)
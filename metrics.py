@@ -0,0 +1,412 @@
+# metrics.py
+"""
+Latency histograms and counters for the API, exposed in the Prometheus text format.
+
+Code is timed in named stages:
+
+    with stage('geocode'):
+        latitude, longitude = get_coordinates_from_place(place_name)
+
+Each stage is recorded in `kundali_stage_duration_seconds`, labelled with the route of
+the request it ran for (set by the apps' request hooks, 'none' outside a request), and
+the apps record each request in `kundali_request_duration_seconds`. Counters cover
+cache lookups, outbound geocoder requests, LLM requests and LLM tokens.
+
+Calculations that run in the worker processes of calc_executor.py collect their samples
+with `collect_samples` and return them with the result; the serving process merges them
+with `record_samples`, so its /metrics covers the whole request.
+
+Pre-forked workers (serve.py) each have their own registry. With
+KUNDALI_METRICS_MULTIPROC_DIR (or PROMETHEUS_MULTIPROC_DIR) set, every process writes a
+snapshot of its series to that directory about once a second, and /metrics renders the
+sum over all snapshots, including those of workers that have exited, so any worker
+answers a scrape with the same, monotonic totals (as prometheus_client's multiprocess
+mode does).
+
+A request that sends `X-Kundali-Trace: 1` gets its stage breakdown back in a
+`Server-Timing` header. With KUNDALI_METRICS=0 nothing is recorded: `stage` returns a
+shared no-op and the other hooks return immediately.
+"""
+
+import bisect
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.environ.get('KUNDALI_METRICS', '1') == '1'
+# Clients may ask for a per-request stage breakdown unless this is turned off
+TRACE_ENABLED = os.environ.get('KUNDALI_TRACE', '1') == '1'
+TRACE_REQUEST_HEADER = 'X-Kundali-Trace'
+TRACE_RESPONSE_HEADER = 'Server-Timing'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Directory the processes of a pre-fork server share their series through, else None
+MULTIPROC_DIR = os.environ.get('KUNDALI_METRICS_MULTIPROC_DIR') or os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+# Seconds between a process's snapshots (a scrape also writes its own process's first)
+MULTIPROC_FLUSH_INTERVAL = float(os.environ.get('KUNDALI_METRICS_FLUSH_INTERVAL', '1.0'))
+
+# Upper bounds (seconds) of the latency histogram buckets, from 50 us to 30 s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# name: (type, help, label names)
+METRICS = {
+    'kundali_request_duration_seconds': (
+        'histogram', "Request latency by route and status.", ('route', 'status')),
+    'kundali_stage_duration_seconds': (
+        'histogram', "Latency of each calculation and chatbot stage by route.", ('route', 'stage')),
+    'kundali_cache_lookups_total': (
+        'counter', "Cache lookups by cache and result.", ('cache', 'result')),
+    'kundali_geocoder_requests_total': (
+        'counter', "Outbound geocoder requests by outcome.", ('outcome',)),
+    'kundali_llm_tokens_total': (
+        'counter', "LLM tokens by model and kind (prompt or completion).", ('model', 'kind')),
+    'kundali_llm_requests_total': (
+        'counter', "LLM API attempts by outcome (ok, retried, error, rejected).", ('outcome',)),
+}
+
+_route = contextvars.ContextVar('kundali_metrics_route', default='none')
+# Stage samples of the current request when it asked for a trace, else None
+_trace = contextvars.ContextVar('kundali_metrics_trace', default=None)
+# Samples collected in a worker process for the serving process, else None
+_collector = contextvars.ContextVar('kundali_metrics_collector', default=None)
+
+
+class MetricsRegistry:
+    """
+    Thread-safe histograms and counters keyed by metric name and label values.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, name, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.get((name, labels))
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), sum and count
+                series = self._histograms[(name, labels)] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        """
+        Returns every series as JSON-serialisable lists, for `merge` in another process.
+        """
+        with self._lock:
+            return {
+                'histograms': [[name, list(labels), list(series[0]), series[1], series[2]]
+                               for (name, labels), series in self._histograms.items()],
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+            }
+
+    def merge(self, snapshot):
+        """
+        Adds the series of a `snapshot` (taken with the same buckets) to this registry.
+        """
+        with self._lock:
+            for name, labels, counts, total, calls in snapshot.get('histograms', ()):
+                key = (name, tuple(labels))
+                series = self._histograms.get(key)
+                if series is None:
+                    series = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                for index, bucket_count in enumerate(counts):
+                    series[0][index] += bucket_count
+                series[1] += total
+                series[2] += calls
+            for name, labels, value in snapshot.get('counters', ()):
+                key = (name, tuple(labels))
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def render(self):
+        """
+        Returns every series in the Prometheus text exposition format.
+        """
+        with self._lock:
+            histograms = {key: (list(series[0]), series[1], series[2]) for key, series in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        for name, (metric_type, help_text, label_names) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type == 'counter':
+                for (series_name, labels), value in sorted(counters.items()):
+                    if series_name == name:
+                        lines.append(f"{name}{_format_labels(label_names, labels)} {_format_value(value)}")
+                continue
+            for (series_name, labels), (counts, total, calls) in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    bucket_labels = _format_labels(label_names + ('le',), labels + (le,))
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(label_names, labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(label_names, labels)} {calls}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+
+
+def observe_stage(name, seconds, route=None):
+    """
+    Records the duration of a stage for the current request (or collector), or for
+    `route` when given.
+    """
+    if not METRICS_ENABLED:
+        return
+    collector = _collector.get()
+    if collector is not None:
+        collector.append(('stage', name, seconds))
+        return
+    registry.observe('kundali_stage_duration_seconds', (route or _route.get(), name), seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((name, seconds))
+
+
+def count(name, labels, amount=1):
+    """
+    Adds amount to a counter from METRICS, with label values in its label order.
+    """
+    if not METRICS_ENABLED or not amount:
+        return
+    collector = _collector.get()
+    if collector is not None:
+        collector.append(('counter', name, labels, amount))
+        return
+    registry.inc(name, labels, amount)
+
+
+class _StageTimer:
+    __slots__ = ('name', 'route', 'started')
+
+    def __init__(self, name, route=None):
+        self.name = name
+        self.route = route
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        observe_stage(self.name, time.perf_counter() - self.started, self.route)
+        return False
+
+
+class _NoOpTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_OP_TIMER = _NoOpTimer()
+
+
+def stage(name, route=None):
+    """
+    Context manager timing a stage; a shared no-op when metrics are disabled. `route`
+    labels stages that run after their request's hooks have finished, such as those in
+    the body of a streamed response.
+    """
+    return _StageTimer(name, route) if METRICS_ENABLED else _NO_OP_TIMER
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function (or coroutine function) as a stage.
+    Functions are returned undecorated when metrics are disabled.
+    """
+    def decorator(fn):
+        if not METRICS_ENABLED:
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def timed_coroutine(*args, **kwargs):
+                with _StageTimer(name):
+                    return await fn(*args, **kwargs)
+            return timed_coroutine
+
+        @functools.wraps(fn)
+        def timed_function(*args, **kwargs):
+            with _StageTimer(name):
+                return fn(*args, **kwargs)
+        return timed_function
+    return decorator
+
+
+def collect_samples(fn, *args, **kwargs):
+    """
+    Runs fn(*args, **kwargs) and returns (result, samples) with the stage timings and
+    counters it recorded, for jobs run in another process. samples is None when
+    metrics are disabled.
+    """
+    if not METRICS_ENABLED:
+        return fn(*args, **kwargs), None
+    samples = []
+    token = _collector.set(samples)
+    try:
+        return fn(*args, **kwargs), samples
+    finally:
+        _collector.reset(token)
+
+
+def record_samples(samples):
+    """
+    Records samples from `collect_samples` for the current request.
+    """
+    for sample in samples or ():
+        if sample[0] == 'stage':
+            observe_stage(sample[1], sample[2])
+        else:
+            count(sample[1], sample[2], sample[3])
+
+
+def begin_request(route, trace_header=None):
+    """
+    Starts timing a request. Called by the apps' before-request hooks with the matched
+    route and the request's trace header; returns the state for `end_request`, or None
+    when metrics are disabled.
+    """
+    if not METRICS_ENABLED:
+        return None
+    _route.set(route)
+    trace = [] if TRACE_ENABLED and trace_header and trace_header.strip().lower() in ('1', 'true', 'yes') else None
+    _trace.set(trace)
+    return route, trace, time.perf_counter()
+
+
+def end_request(state, status):
+    """
+    Records a request's latency. Returns the Server-Timing header value when the request
+    asked for a trace, else None.
+    """
+    if state is None:
+        return None
+    route, trace, started = state
+    elapsed = time.perf_counter() - started
+    registry.observe('kundali_request_duration_seconds', (route, str(status)), elapsed)
+    _route.set('none')
+    _trace.set(None)
+    if trace is None:
+        return None
+    return server_timing(trace + [('total', elapsed)])
+
+
+def server_timing(samples):
+    """
+    Formats (stage, seconds) samples as a Server-Timing header value. Repeated stages
+    (such as one per batch chunk) are summed.
+    """
+    totals = {}
+    for name, seconds in samples:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ', '.join(f"{name};dur={seconds * 1000.0:.3f}" for name, seconds in totals.items())
+
+
+def _snapshot_path(pid):
+    return os.path.join(MULTIPROC_DIR, f"metrics_{pid}.json")
+
+
+def write_snapshot():
+    """
+    Writes this process's series to MULTIPROC_DIR (a no-op without it). The file is
+    replaced atomically, so readers never see a partial snapshot.
+    """
+    if not METRICS_ENABLED or not MULTIPROC_DIR:
+        return
+    path = _snapshot_path(os.getpid())
+    temporary = f"{path}.{threading.get_ident()}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(temporary, path)
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(MULTIPROC_FLUSH_INTERVAL)
+        try:
+            write_snapshot()
+        except OSError:
+            pass
+
+
+def start_multiprocess():
+    """
+    Starts writing this process's snapshots every MULTIPROC_FLUSH_INTERVAL seconds.
+    Called in each pre-forked worker; a no-op without MULTIPROC_DIR.
+    """
+    if not METRICS_ENABLED or not MULTIPROC_DIR:
+        return
+    threading.Thread(target=_flush_periodically, name='metrics-flush', daemon=True).start()
+
+
+def clear_multiprocess_dir():
+    """
+    Removes the snapshots of a previous run. Called by the master before it forks.
+    """
+    if not MULTIPROC_DIR:
+        return
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+    for name in os.listdir(MULTIPROC_DIR):
+        if name.startswith('metrics_') and name.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(MULTIPROC_DIR, name))
+
+
+def render_metrics():
+    """
+    Returns the /metrics body: this process's series, or with MULTIPROC_DIR the sum of
+    every process's latest snapshot.
+    """
+    if not METRICS_ENABLED or not MULTIPROC_DIR:
+        return registry.render()
+    write_snapshot()
+    combined = MetricsRegistry(registry.buckets)
+    for name in os.listdir(MULTIPROC_DIR):
+        if not (name.startswith('metrics_') and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(MULTIPROC_DIR, name)) as f:
+                combined.merge(json.load(f))
+        except (OSError, ValueError):
+            # Removed between listing and reading
+            continue
+    return combined.render()
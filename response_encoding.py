@@ -0,0 +1,236 @@
+# response_encoding.py
+"""
+Encoding, compression and HTTP caching for the /kundali responses, and parsing of the
+common request parameters, shared by the Flask and ASGI apps.
+
+- Bodies are JSON, encoded with orjson when it is installed, or MessagePack when the
+  client sends `Accept: application/msgpack` and msgpack is installed.
+- Bodies of at least COMPRESS_MIN_BYTES are compressed with brotli (when installed) or
+  gzip, following Accept-Encoding.
+- The ETag is strong and derived from the birth input and options, not the body, so a
+  matching If-None-Match is answered with 304 before any calculation. The current Dasha
+  periods are reported by UTC date, so the tag also carries the UTC date and responses
+  may be cached until the next UTC midnight.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to the standard library encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Optional: MessagePack is only offered when installed
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip is used when brotli is not installed
+    brotli = None
+
+# Bumped whenever the response layout or the calculation changes, so old ETags stop matching
+RESPONSE_VERSION = 3
+
+COMPRESS_MIN_BYTES = int(os.environ.get('KUNDALI_COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('KUNDALI_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('KUNDALI_BROTLI_QUALITY', '5'))
+
+CONTENT_TYPES = {'json': 'application/json', 'msgpack': 'application/msgpack'}
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def _json_default(value):
+    # NumPy scalars and arrays from the calculation modules
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_json(payload):
+    """
+    Encodes a payload as compact UTF-8 JSON.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, default=_json_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def encode_body(payload, body_format='json'):
+    """
+    Encodes a payload in the negotiated format ('json' or 'msgpack').
+    """
+    if body_format == 'msgpack':
+        return msgpack.packb(payload, use_bin_type=True, default=_json_default)
+    return encode_json(payload)
+
+
+def _accepted(header):
+    """
+    Parses an Accept or Accept-Encoding header into {value: q}.
+    """
+    accepted = {}
+    for part in (header or '').split(','):
+        value, _, params = part.strip().partition(';')
+        if not value:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, number = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        accepted[value.strip().lower()] = quality
+    return accepted
+
+
+def negotiate_format(accept):
+    """
+    Returns 'msgpack' if the client prefers MessagePack and it is available, else 'json'.
+    """
+    accepted = _accepted(accept)
+    msgpack_quality = max((accepted.get(content_type, 0.0) for content_type in MSGPACK_TYPES), default=0.0)
+    json_quality = max(accepted.get('application/json', 0.0), accepted.get('*/*', 0.0 if accepted else 1.0))
+    if msgpack is not None and msgpack_quality > 0 and msgpack_quality >= json_quality:
+        return 'msgpack'
+    return 'json'
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Returns 'br', 'gzip' or None for an Accept-Encoding header.
+    """
+    accepted = _accepted(accept_encoding)
+    wildcard = accepted.get('*', 0.0)
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    best = max(candidates, key=lambda encoding: accepted.get(encoding, wildcard))
+    return best if accepted.get(best, wildcard) > 0 else None
+
+
+def compress_body(body, encoding):
+    """
+    Compresses a body with 'br' or 'gzip'; returns it unchanged for None.
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def kundali_etag(date_of_birth, time_of_birth, place_of_birth, options=None, today=None):
+    """
+    Returns the strong validator (without quotes) of a /kundali response: a digest of the
+    birth input, the options that change the body, the response version and the UTC date.
+    """
+    today = today or datetime.utcnow().date()
+    key = json.dumps([
+        RESPONSE_VERSION, today.isoformat(), str(date_of_birth).strip(), str(time_of_birth).strip(),
+        ' '.join(str(place_of_birth).lower().split()), options or {},
+    ], sort_keys=True)
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def representation_etag(etag, body_format, encoding):
+    """
+    Quoted ETag of one representation; each format and content coding gets its own tag.
+    """
+    return f'"{etag}-{body_format}-{encoding or "identity"}"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Weak comparison of an If-None-Match header against a quoted ETag.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return any((tag[2:] if tag.startswith('W/') else tag) == etag for tag in tags)
+
+
+def seconds_until_utc_midnight(now=None):
+    now = now or datetime.utcnow()
+    midnight = datetime(now.year, now.month, now.day) + timedelta(days=1)
+    return max(int((midnight - now).total_seconds()), 1)
+
+
+def caching_headers(etag):
+    """
+    Headers for a response (or a 304) carrying a representation ETag.
+    """
+    return {
+        'ETag': etag,
+        'Cache-Control': f"private, max-age={seconds_until_utc_midnight()}",
+        'Vary': 'Accept, Accept-Encoding',
+    }
+
+
+def encode_response(payload, accept=None, accept_encoding=None, etag=None):
+    """
+    Encodes a payload for a request's Accept and Accept-Encoding headers.
+
+    Parameters:
+        payload: JSON-compatible response data.
+        accept (str): The request's Accept header.
+        accept_encoding (str): The request's Accept-Encoding header.
+        etag (str): Validator from `kundali_etag`, or None for an uncached response.
+
+    Returns:
+        tuple: (body bytes, headers dict) ready for the framework's Response.
+    """
+    body_format = negotiate_format(accept)
+    body = encode_body(payload, body_format)
+    encoding = negotiate_encoding(accept_encoding) if len(body) >= COMPRESS_MIN_BYTES else None
+    body = compress_body(body, encoding)
+
+    headers = {'Content-Type': CONTENT_TYPES[body_format], 'Vary': 'Accept, Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    if etag:
+        headers.update(caching_headers(representation_etag(etag, body_format, encoding)))
+    return body, headers
+
+
+def parse_limit(value, default, maximum):
+    """
+    Parses a 'limit' parameter (from JSON or a query string) into an integer from 1 to
+    maximum, capping larger values. Returns default when it is missing and raises
+    ValueError when it is not a positive integer.
+    """
+    if value is None or value == '':
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"limit must be a positive integer, got {value!r}") from None
+    if limit < 1:
+        raise ValueError(f"limit must be a positive integer, got {value!r}")
+    return min(limit, maximum)
+
+
+def not_modified(etag, accept=None, accept_encoding=None, if_none_match=None, method='GET'):
+    """
+    Returns the headers of a 304 response if If-None-Match matches the representation the
+    request would get, else None. The compression decision depends on the body size, so
+    both the compressed and the identity tags are accepted. Only GET and HEAD requests
+    are answered with 304 (RFC 9110, section 13.1.2).
+    """
+    if method not in ('GET', 'HEAD'):
+        return None
+    body_format = negotiate_format(accept)
+    for encoding in (negotiate_encoding(accept_encoding), None):
+        tag = representation_etag(etag, body_format, encoding)
+        if etag_matches(if_none_match, tag):
+            return caching_headers(tag)
+    return None
@@ -0,0 +1,344 @@
+# retrieval_index.py
+"""
+TF-IDF retrieval over the interpretation corpus, used to add the most relevant
+snippets for a chart and question to the chatbot prompt.
+
+Documents are the prompt/completion pairs of preprocessed_astrology_validation_data.jsonl.
+Besides the words of both texts, each document gets structured placement terms such
+as `sun_h9` (Sun in the 9th house) and `dasha_rahu_jupiter`, and queries add the same
+terms for the user's chart, so retrieval favours interpretations of this chart's
+placements.
+
+The index is an inverted file of (document, weight) postings per term, stored as
+NumPy arrays and memory-mapped. A query gathers the postings of its terms (at most
+QUERY_POSTINGS_LIMIT per term, strongest first) and accumulates scores with one
+`np.bincount`, so it costs time proportional to the postings it touches, not to the
+corpus size.
+
+Rebuilds are incremental: per-document term counts are stored with a hash of each
+document, and only new or changed documents are tokenized again.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+from ephemeris_tables import GRAHAS
+from gazetteer import _index_lock, _pack_strings, _PackedStrings, _save_array, _save_json
+from interpretation_index import DEFAULT_SOURCE_PATH, NO_PLANET, parse_prompt, source_digest
+
+DEFAULT_INDEX_DIR = os.environ.get(
+    'KUNDALI_RETRIEVAL_INDEX', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'retrieval_index')
+)
+RETRIEVAL_TOP_K = int(os.environ.get('KUNDALI_RETRIEVAL_TOP_K', '4'))
+# Chart placement terms count for less than the words of the question itself
+CHART_TERM_WEIGHT = 0.5
+# Postings read per query term. Postings are stored highest weight first, so for very
+# common terms only the strongest matches are scored, which bounds query latency.
+QUERY_POSTINGS_LIMIT = int(os.environ.get('KUNDALI_RETRIEVAL_POSTINGS_LIMIT', '20000'))
+
+TOKEN_PATTERN = re.compile(r"[a-z]+")
+STOPWORDS = frozenset("""
+a about all also an and are as at be been being but by can could do does for from had has have how i in into
+is it its may me might my no not of on or our over so such than that the their them then there these they
+this those through to too up was we were what when where which while who will with would you your
+native influence interpretation combined effect effects type planet house
+""".split())
+LOWERCASE_GRAHAS = [planet.lower() for planet in GRAHAS]
+
+
+def tokenize(text):
+    """
+    Lowercases text and returns its word terms without stopwords.
+    """
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+def placement_terms(planets, house):
+    return [f"{planet.lower()}_h{house}" for planet in planets]
+
+
+def document_terms(prompt, completion):
+    """
+    Terms of one corpus document: the words of the prompt key and the interpretation,
+    plus structured placement and dasha terms parsed from the key.
+    """
+    terms = tokenize(prompt.replace('_', ' ')) + tokenize(completion)
+    row = parse_prompt(prompt, ['General'])
+    if row is not None:
+        kind, _, planet, planet2, planets, _, house, _, _, _ = row
+        if house and planets:
+            terms += placement_terms([p for i, p in enumerate(GRAHAS) if planets >> i & 1], house)
+        if planet != NO_PLANET and planet2 != NO_PLANET:
+            terms.append(f"dasha_{LOWERCASE_GRAHAS[planet]}_{LOWERCASE_GRAHAS[planet2]}")
+    return terms
+
+
+def chart_terms(kundali_data):
+    """
+    Structured query terms for a chart, from a `calculate_kundali` report or a /kundali
+    response: one placement term per planet and one for the current dasha pair.
+    """
+    terms = []
+    if 'planet_in_houses' in kundali_data:
+        houses = kundali_data['planet_in_houses']
+        mahadasha = (kundali_data.get('Mahadasha') or {}).get('planet')
+        antardasha = (kundali_data.get('Antardasha') or {}).get('planet')
+    else:
+        houses = {planet: info.get('House') for planet, info in (kundali_data.get('planets_info') or {}).items()}
+        current_dasha = kundali_data.get('current_dasha')
+        current_antardasha = kundali_data.get('current_antardasha')
+        mahadasha = current_dasha.get('Planet') if isinstance(current_dasha, dict) else None
+        antardasha = current_antardasha.get('Planet') if isinstance(current_antardasha, dict) else None
+    for planet, house in houses.items():
+        if house:
+            terms += placement_terms([planet], house)
+    if mahadasha and antardasha:
+        terms.append(f"dasha_{mahadasha.lower()}_{antardasha.lower()}")
+    return terms
+
+
+def load_corpus(source_path=DEFAULT_SOURCE_PATH):
+    """
+    Reads the (prompt, completion) pairs of a JSONL corpus.
+    """
+    documents = []
+    with open(source_path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                documents.append((record['prompt'], record['completion']))
+    return documents
+
+
+def _document_hash(prompt, completion):
+    return hashlib.blake2b(f"{prompt}\n{completion}".encode('utf-8'), digest_size=16).digest()
+
+
+def _load_previous(index_dir):
+    """
+    Returns (vocabulary, {document hash: (term ids, counts)}) from an existing index.
+    """
+    if not os.path.exists(os.path.join(index_dir, 'meta.json')):
+        return [], {}
+    def load(name):
+        return np.load(os.path.join(index_dir, name), mmap_mode='r')
+    vocabulary = _PackedStrings(load('vocabulary.npy'), load('vocabulary_offsets.npy'))
+    hashes = load('document_hashes.npy')
+    indptr = np.asarray(load('counts_indptr.npy'))
+    term_ids = load('counts_terms.npy')
+    counts = load('counts.npy')
+    previous = {}
+    for document in range(len(hashes)):
+        start, end = indptr[document], indptr[document + 1]
+        previous[bytes(hashes[document])] = (np.array(term_ids[start:end]), np.array(counts[start:end]))
+    return [vocabulary[i] for i in range(len(vocabulary))], previous
+
+
+def build_retrieval_index(documents, index_dir=DEFAULT_INDEX_DIR, source_sha256=None, incremental=True):
+    """
+    Builds the TF-IDF index for a list of (prompt, completion) documents.
+
+    Term ids stay stable across rebuilds (new terms are appended to the vocabulary),
+    so the stored term counts of unchanged documents are reused as they are.
+
+    Returns:
+        dict: The index metadata, including how many documents were tokenized.
+    """
+    vocabulary, previous = _load_previous(index_dir) if incremental else ([], {})
+    term_ids_by_name = {term: i for i, term in enumerate(vocabulary)}
+
+    hashes = np.empty((len(documents), 16), dtype=np.uint8)
+    row_terms = []
+    row_counts = []
+    tokenized = 0
+    for document, (prompt, completion) in enumerate(documents):
+        digest = _document_hash(prompt, completion)
+        hashes[document] = np.frombuffer(digest, dtype=np.uint8)
+        cached = previous.get(digest)
+        if cached is None:
+            tokenized += 1
+            terms, counts = np.unique(document_terms(prompt, completion), return_counts=True)
+            ids = np.empty(len(terms), dtype=np.int32)
+            for i, term in enumerate(terms):
+                term_id = term_ids_by_name.get(term)
+                if term_id is None:
+                    term_id = term_ids_by_name[term] = len(vocabulary)
+                    vocabulary.append(term)
+                ids[i] = term_id
+            cached = (ids, counts.astype(np.int32))
+        row_terms.append(cached[0])
+        row_counts.append(cached[1])
+
+    lengths = np.array([len(ids) for ids in row_terms], dtype=np.int64)
+    indptr = np.zeros(len(documents) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(lengths)
+    flat_terms = np.concatenate(row_terms) if row_terms else np.zeros(0, dtype=np.int32)
+    flat_counts = np.concatenate(row_counts) if row_counts else np.zeros(0, dtype=np.int32)
+    flat_documents = np.repeat(np.arange(len(documents), dtype=np.int32), lengths)
+
+    # Sublinear tf, smoothed idf and L2-normalized document vectors
+    document_frequency = np.bincount(flat_terms, minlength=len(vocabulary))
+    idf = (np.log((1.0 + len(documents)) / (1.0 + document_frequency)) + 1.0).astype(np.float32)
+    weights = (1.0 + np.log(flat_counts)).astype(np.float32) * idf[flat_terms]
+    norms = np.sqrt(np.bincount(flat_documents, weights=weights * weights, minlength=len(documents)))
+    weights /= np.maximum(norms[flat_documents], 1e-12).astype(np.float32)
+
+    # Invert into per-term postings, highest weight first within each term
+    order = np.lexsort((-weights, flat_terms))
+    postings_indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    postings_indptr[1:] = np.cumsum(document_frequency)
+
+    os.makedirs(index_dir, exist_ok=True)
+    vocabulary_blob, vocabulary_offsets = _pack_strings(vocabulary)
+    prompt_blob, prompt_offsets = _pack_strings([prompt for prompt, _ in documents])
+    completion_blob, completion_offsets = _pack_strings([completion for _, completion in documents])
+    arrays = {
+        'vocabulary': vocabulary_blob,
+        'vocabulary_offsets': vocabulary_offsets,
+        'idf': idf,
+        'postings_indptr': postings_indptr,
+        'postings_documents': flat_documents[order],
+        'postings_weights': weights[order],
+        'document_hashes': hashes,
+        'counts_indptr': indptr,
+        'counts_terms': flat_terms.astype(np.int32),
+        'counts': flat_counts.astype(np.int32),
+        'prompts': prompt_blob,
+        'prompt_offsets': prompt_offsets,
+        'completions': completion_blob,
+        'completion_offsets': completion_offsets,
+    }
+    for name, array in arrays.items():
+        _save_array(os.path.join(index_dir, f"{name}.npy"), array)
+
+    meta = {
+        'source_sha256': source_sha256,
+        'documents': len(documents),
+        'terms': len(vocabulary),
+        'postings': int(len(flat_terms)),
+        'tokenized': tokenized,
+        'reused': len(documents) - tokenized,
+        'bytes': int(sum(array.nbytes for array in arrays.values())),
+    }
+    # Written last: a meta.json with the current digest means the arrays are complete
+    _save_json(os.path.join(index_dir, 'meta.json'), meta)
+    return meta
+
+
+class RetrievalIndex:
+    """
+    Memory-mapped TF-IDF index built by `build_retrieval_index`.
+    """
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR):
+        def load(name):
+            return np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode='r')
+
+        with open(os.path.join(index_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        vocabulary = _PackedStrings(load('vocabulary'), load('vocabulary_offsets'))
+        self.term_ids = {vocabulary[i]: i for i in range(len(vocabulary))}
+        self.idf = np.asarray(load('idf'))
+        self.postings_indptr = np.asarray(load('postings_indptr'))
+        self.postings_documents = load('postings_documents')
+        self.postings_weights = load('postings_weights')
+        self.prompts = _PackedStrings(load('prompts'), load('prompt_offsets'))
+        self.completions = _PackedStrings(load('completions'), load('completion_offsets'))
+        self.document_count = self.meta['documents']
+
+    def __len__(self):
+        return self.document_count
+
+    def search(self, query, k=RETRIEVAL_TOP_K):
+        """
+        Ranks documents by the dot product of their TF-IDF vectors with the query.
+
+        Parameters:
+            query (dict): Term to weight multiplier (1.0 for an ordinary query term).
+            k (int): Number of results.
+
+        Returns:
+            list: (document number, score) pairs, best first.
+        """
+        known = [(self.term_ids[term], weight) for term, weight in query.items() if term in self.term_ids]
+        if not known:
+            return []
+        ids = np.array([term_id for term_id, _ in known], dtype=np.int64)
+        query_weights = np.array([weight for _, weight in known]) * self.idf[ids]
+
+        starts = self.postings_indptr[ids]
+        ends = np.minimum(self.postings_indptr[ids + 1], starts + QUERY_POSTINGS_LIMIT)
+        documents = np.concatenate([self.postings_documents[s:e] for s, e in zip(starts, ends)])
+        weights = np.concatenate([self.postings_weights[s:e] * w for s, e, w in zip(starts, ends, query_weights)])
+
+        # Compact the touched documents so scoring never allocates corpus-sized arrays
+        candidates, positions = np.unique(documents, return_inverse=True)
+        scores = np.bincount(positions, weights=weights)
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    def retrieve(self, question, chart=(), k=RETRIEVAL_TOP_K):
+        """
+        Returns the k interpretation snippets most relevant to a question about a chart.
+
+        Parameters:
+            question (str): The user's message.
+            chart (list): Terms from `chart_terms` for the user's chart (optional).
+            k (int): Number of snippets.
+
+        Returns:
+            list: Dictionaries with the prompt key, interpretation text and score.
+        """
+        query = {}
+        for term in tokenize(question):
+            query[term] = query.get(term, 0.0) + 1.0
+        for term in chart:
+            query[term] = query.get(term, 0.0) + CHART_TERM_WEIGHT
+        return [
+            {'prompt': self.prompts[document], 'interpretation': self.completions[document], 'score': score}
+            for document, score in self.search(query, k)
+        ]
+
+
+_retrieval_index = None
+
+
+def get_retrieval_index():
+    """
+    Returns the shared RetrievalIndex, incrementally rebuilding it first if it is missing
+    or the JSONL has changed since it was built. Like `get_interpretation_index`, this
+    holds the index directory's lock, so concurrent processes rebuild it only once.
+    """
+    global _retrieval_index
+    if _retrieval_index is None:
+        digest = source_digest(DEFAULT_SOURCE_PATH)
+        with _index_lock(DEFAULT_INDEX_DIR):
+            meta_path = os.path.join(DEFAULT_INDEX_DIR, 'meta.json')
+            stale = True
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    stale = json.load(f).get('source_sha256') != digest
+            if stale:
+                build_retrieval_index(load_corpus(DEFAULT_SOURCE_PATH), DEFAULT_INDEX_DIR, source_sha256=digest)
+            _retrieval_index = RetrievalIndex()
+    return _retrieval_index
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the TF-IDF retrieval index over the interpretation corpus.")
+    parser.add_argument('--source', default=DEFAULT_SOURCE_PATH, help="JSONL of prompt/completion pairs.")
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR, help="Output directory for the index.")
+    parser.add_argument('--full', action='store_true', help="Tokenize every document instead of reusing counts.")
+    args = parser.parse_args()
+
+    with _index_lock(args.index_dir):
+        meta = build_retrieval_index(load_corpus(args.source), args.index_dir,
+                                     source_sha256=source_digest(args.source), incremental=not args.full)
+    print(f"Indexed {meta['documents']} documents, {meta['terms']} terms "
+          f"({meta['tokenized']} tokenized, {meta['reused']} reused), {meta['bytes'] / 1e6:.2f} MB")
@@ -0,0 +1,314 @@
+# serve.py
+"""
+Production entry point: a pre-forking server for the Flask app (`wsgi`, the default) or
+the Quart app (`asgi`).
+
+The master process imports the app, runs `warmup.warm_up` (ephemeris files, compiled
+indexes, caches, the chatbot module and one full chart), freezes the garbage collector
+so the loaded objects stay shared, binds the listening socket and only then forks the
+workers. Every worker therefore starts warm and shares the master's memory
+copy-on-write. Workers serve with a threaded Werkzeug server (`wsgi`) or uvicorn
+(`asgi`) on the inherited socket; the master restarts workers that exit and, on SIGTERM
+or SIGINT, stops them gracefully (they fail /readyz while they drain).
+
+    python serve.py --app wsgi --workers 4 --port 5000
+
+With gunicorn installed, `--engine gunicorn` runs the Flask app under gunicorn instead,
+with the same warmed-up master.
+
+Chart calculations run in the request's worker (KUNDALI_CALC_WORKERS defaults to 0
+here), since the pre-forked workers already spread requests over the CPUs. Workers
+share their metrics through KUNDALI_METRICS_MULTIPROC_DIR (a temporary directory by
+default; see metrics.py), so /metrics reports the totals of all of them.
+"""
+
+import time
+
+SERVE_STARTED = time.perf_counter()
+
+import argparse  # noqa: E402
+import gc  # noqa: E402
+import importlib.util  # noqa: E402
+import logging  # noqa: E402
+import os  # noqa: E402
+import shutil  # noqa: E402
+import signal  # noqa: E402
+import socket  # noqa: E402
+import sys  # noqa: E402
+import tempfile  # noqa: E402
+import threading  # noqa: E402
+
+# The pre-forked workers replace the calculation process pool (see calc_executor.py)
+os.environ.setdefault('KUNDALI_CALC_WORKERS', '0')
+
+try:
+    import gunicorn.app.base
+except ImportError:  # Optional: the built-in pre-fork master is used without it
+    gunicorn = None
+
+import metrics  # noqa: E402
+import warmup  # noqa: E402
+
+logger = logging.getLogger('kundali.serve')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+WSGI_APP_PATH = os.environ.get('KUNDALI_WSGI_APP', os.path.join(BASE_DIR, 'app (1).py'))
+
+SERVER_APP = os.environ.get('KUNDALI_SERVER_APP', 'wsgi')
+SERVER_HOST = os.environ.get('KUNDALI_SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('KUNDALI_SERVER_PORT', '5000'))
+SERVER_WORKERS = int(os.environ.get('KUNDALI_SERVER_WORKERS', str(os.cpu_count() or 1)))
+SERVER_THREADS = int(os.environ.get('KUNDALI_SERVER_THREADS', '8'))
+SERVER_BACKLOG = int(os.environ.get('KUNDALI_SERVER_BACKLOG', '2048'))
+# Seconds a stopping worker gets to finish its requests before it is killed
+SERVER_GRACEFUL_TIMEOUT = float(os.environ.get('KUNDALI_SERVER_GRACEFUL_TIMEOUT', '30'))
+# Pause before replacing a worker that exited, so a crashing worker cannot spin
+RESPAWN_DELAY = 1.0
+# How often a worker checks that its master is still running
+PARENT_CHECK_INTERVAL = 1.0
+
+
+def load_application(kind):
+    """
+    Imports the Flask ('wsgi') or Quart ('asgi') application object.
+    """
+    if kind == 'asgi':
+        import asgi_app
+        return asgi_app.app
+    # The Flask module's file name is not importable as a module name
+    spec = importlib.util.spec_from_file_location('kundali_app', WSGI_APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['kundali_app'] = module
+    spec.loader.exec_module(module)
+    return module.app
+
+
+def _serve_wsgi(application, listener, threads):
+    from werkzeug.serving import ThreadedWSGIServer
+
+    class WorkerServer(ThreadedWSGIServer):
+        # Bounded by the listen backlog rather than by threads; see SERVER_THREADS
+        request_queue_size = SERVER_BACKLOG
+
+    host, port = listener.getsockname()[:2]
+    server = WorkerServer(host, port, application, fd=listener.fileno())
+    semaphore = threading.BoundedSemaphore(threads)
+    process_request = server.process_request
+
+    def limited_process_request(request, client_address):
+        # At most `threads` requests in flight; further connections wait in the backlog
+        semaphore.acquire()
+        try:
+            process_request(request, client_address)
+        except Exception:
+            semaphore.release()
+            raise
+
+    def finish_request(request, client_address):
+        try:
+            ThreadedWSGIServer.finish_request(server, request, client_address)
+        finally:
+            semaphore.release()
+
+    server.process_request = limited_process_request
+    server.finish_request = finish_request
+
+    def stop(signum, frame):
+        warmup.mark_draining()
+        # shutdown() waits for serve_forever, so it cannot run in the signal handler's thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    server.serve_forever()
+    server.server_close()
+
+
+def _serve_asgi(application, listener):
+    import uvicorn
+
+    config = uvicorn.Config(application, lifespan='on', log_level='info',
+                            timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT)
+    uvicorn.Server(config).run(sockets=[listener])
+
+
+def _watch_parent(master_pid):
+    # A worker whose master was killed stops itself instead of serving on unsupervised
+    while os.getppid() == master_pid:
+        time.sleep(PARENT_CHECK_INTERVAL)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def _run_worker(kind, application, listener, threads, master_pid):
+    """
+    Body of a forked worker; never returns.
+    """
+    status = 0
+    try:
+        # Ctrl-C reaches the whole process group; the master decides when workers stop
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        warmup.after_fork()
+        threading.Thread(target=_watch_parent, args=(master_pid,), daemon=True).start()
+        if kind == 'asgi':
+            _serve_asgi(application, listener)
+        else:
+            _serve_wsgi(application, listener, threads)
+    except Exception:
+        logger.exception("Worker %s failed", os.getpid())
+        status = 1
+    finally:
+        try:
+            metrics.write_snapshot()
+        except OSError:
+            logger.exception("Could not write the final metrics snapshot")
+        logging.shutdown()
+        os._exit(status)
+
+
+class PreforkServer:
+    """
+    Forks `workers` copies of a warmed-up application onto one listening socket and
+    keeps that many running until it is asked to stop.
+
+    Parameters:
+        kind (str): 'wsgi' or 'asgi'.
+        application: The Flask or Quart application object.
+        listener (socket.socket): The bound, listening socket shared by the workers.
+        workers (int): Number of worker processes.
+        threads (int): Concurrent requests per 'wsgi' worker.
+    """
+    def __init__(self, kind, application, listener, workers=SERVER_WORKERS, threads=SERVER_THREADS):
+        self.kind = kind
+        self.application = application
+        self.listener = listener
+        self.workers = workers
+        self.threads = threads
+        self.children = set()
+        self.stopping = False
+
+    def spawn(self):
+        master_pid = os.getpid()
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(self.kind, self.application, self.listener, self.threads, master_pid)
+        self.children.add(pid)
+        return pid
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.children.discard(pid)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn()
+        logger.info("Serving %s on %s with %d workers (pids %s)", self.kind, self.listener.getsockname(),
+                    self.workers, ', '.join(map(str, sorted(self.children))))
+
+        deadline = None
+        while self.children:
+            if self.stopping and deadline is None:
+                deadline = time.monotonic() + SERVER_GRACEFUL_TIMEOUT
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                if deadline is not None and time.monotonic() > deadline:
+                    for child in list(self.children):
+                        os.kill(child, signal.SIGKILL)
+                time.sleep(0.1)
+                continue
+            self.children.discard(pid)
+            if not self.stopping:
+                logger.warning("Worker %d exited with status %d, starting a new one", pid,
+                               os.waitstatus_to_exitcode(status))
+                time.sleep(RESPAWN_DELAY)
+                self.spawn()
+        self.listener.close()
+
+
+def _run_gunicorn(application, host, port, workers, threads):
+    class Application(gunicorn.app.base.BaseApplication):
+        def load_config(self):
+            settings = {
+                'bind': f"{host}:{port}",
+                'workers': workers,
+                'worker_class': 'gthread',
+                'threads': threads,
+                'backlog': SERVER_BACKLOG,
+                'graceful_timeout': SERVER_GRACEFUL_TIMEOUT,
+                'preload_app': True,
+                'post_fork': lambda server, worker: warmup.after_fork(),
+                'worker_int': lambda worker: warmup.mark_draining(),
+                'worker_exit': lambda server, worker: (warmup.mark_draining(), metrics.write_snapshot()),
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return application
+
+    Application().run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the Kundali API with pre-forked, warmed-up workers.")
+    parser.add_argument('--app', choices=['wsgi', 'asgi'], default=SERVER_APP,
+                        help="Flask (wsgi) or Quart (asgi) application.")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help="Worker processes.")
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help="Concurrent requests per wsgi worker.")
+    parser.add_argument('--engine', choices=['prefork', 'gunicorn'], default='prefork',
+                        help="Built-in pre-fork master, or gunicorn (wsgi only, when installed).")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(name)s %(levelname)s %(message)s')
+
+    application = load_application(args.app)
+    imported = time.perf_counter()
+    report = warmup.warm_up(started=SERVE_STARTED)
+    logger.info("Imports took %.1f ms; ready %.1f ms after start", (imported - SERVE_STARTED) * 1000.0,
+                report['startup_ms'])
+    if not report['ready']:
+        logger.error("Warm-up failed, not starting workers: %s", report['steps'])
+        sys.exit(1)
+
+    if args.engine == 'gunicorn':
+        if gunicorn is None:
+            parser.error("gunicorn is not installed")
+        if args.app != 'wsgi':
+            parser.error("--engine gunicorn serves the wsgi app only")
+
+    # Without a shared directory every worker would answer /metrics with its own counts
+    metrics_dir = None
+    master_pid = os.getpid()
+    if metrics.MULTIPROC_DIR is None:
+        metrics_dir = metrics.MULTIPROC_DIR = tempfile.mkdtemp(prefix='kundali-metrics-')
+        os.environ['KUNDALI_METRICS_MULTIPROC_DIR'] = metrics_dir
+    metrics.clear_multiprocess_dir()
+
+    # Objects created so far are never collected, so collections in the workers do not
+    # write to (and un-share) their pages
+    gc.freeze()
+
+    try:
+        if args.engine == 'gunicorn':
+            _run_gunicorn(application, args.host, args.port, args.workers, args.threads)
+            return
+        listener = socket.create_server((args.host, args.port), backlog=SERVER_BACKLOG)
+        listener.set_inheritable(True)
+        PreforkServer(args.app, application, listener, args.workers, args.threads).run()
+    finally:
+        # gunicorn's workers unwind through here too when they exit
+        if metrics_dir is not None and os.getpid() == master_pid:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
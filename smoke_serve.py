@@ -0,0 +1,114 @@
+# smoke_serve.py
+"""
+Smoke test for serve.py: boots the real pre-fork server in a subprocess, waits for
+/readyz, requests /healthz and one chart from /kundali, then stops the master with
+SIGTERM and checks that it exits cleanly.
+
+    python smoke_serve.py
+    python smoke_serve.py --app asgi --workers 2
+
+Exits with status 1 (and the server's log) when any step fails. The chart place must be
+in the offline gazetteer, so no OpenCage key is needed; a dummy LLM key satisfies the
+start-up check, since no chatbot route is called.
+"""
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SMOKE_CHART = {'date_of_birth': '1990-05-15', 'time_of_birth': '10:30', 'place_of_birth': 'Mumbai'}
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def wait_ready(base_url, process, timeout):
+    """
+    Polls /readyz until it answers 200. Returns False if the server exits or the
+    timeout passes first.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            if requests.get(f"{base_url}/readyz", timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def run_smoke(app='wsgi', workers=1, timeout=60.0):
+    """
+    Runs one boot / request / shutdown cycle of serve.py.
+
+    Parameters:
+        app (str): 'wsgi' or 'asgi'.
+        workers (int): Worker processes to start.
+        timeout (float): Seconds to wait for readiness and for shutdown.
+
+    Returns:
+        list: Failure messages; empty when the smoke test passed.
+    """
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ)
+    env.setdefault('OPENAI_API_KEY', 'smoke-test')
+    env['KUNDALI_SERVER_GRACEFUL_TIMEOUT'] = '5'
+    command = [sys.executable, os.path.join(BASE_DIR, 'serve.py'), '--app', app,
+               '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers)]
+    failures = []
+    with tempfile.TemporaryFile() as log:
+        process = subprocess.Popen(command, cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            if not wait_ready(base_url, process, timeout):
+                failures.append("server never became ready")
+            else:
+                response = requests.get(f"{base_url}/healthz", timeout=10)
+                if response.status_code != 200:
+                    failures.append(f"/healthz returned {response.status_code}")
+                response = requests.get(f"{base_url}/kundali", params=SMOKE_CHART, timeout=30)
+                if response.status_code != 200 or 'planetary_info' not in response.json():
+                    failures.append(f"/kundali returned {response.status_code}: {response.text[:200]}")
+        finally:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+            try:
+                status = process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                status = process.wait()
+                failures.append("server did not stop after SIGTERM")
+        if status != 0:
+            failures.append(f"server exited with status {status}")
+        if failures:
+            log.seek(0)
+            sys.stderr.write(log.read().decode('utf-8', 'replace'))
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Boot serve.py, request a chart and shut it down again.")
+    parser.add_argument('--app', choices=['wsgi', 'asgi'], default='wsgi')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    args = parser.parse_args()
+
+    failures = run_smoke(args.app, args.workers, args.timeout)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    print("serve.py smoke test " + ("failed" if failures else "passed"))
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,151 @@
+# stub_llm_server.py
+#
+# A local stand-in for an OpenAI-compatible chat completions API, so the chatbot
+# routes (including /chatbot/stream) can be exercised offline.
+#
+#   python stub_llm_server.py --port 8001 --first-token-delay 0.5 --token-delay 0.02
+#
+# then point the app at it with KUNDALI_LLM_BASE_URL=http://127.0.0.1:8001/v1 (see
+# llm_client.py). --rate-limit and --error-rate make it answer like a provider under
+# load, with 429s (and Retry-After) and 503s, for exercising the client's limiter and
+# retries.
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = (
+    "Personality: You are thoughtful and steady. "
+    "Career: Consistent effort brings recognition. "
+    "Relationships: Patience strengthens your bonds. "
+    "Health: Keep a regular routine. "
+    "Spirituality: Quiet reflection will guide you."
+)
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """
+    Answers POST /v1/chat/completions with a canned reply, streamed word by word
+    when the request asks for "stream": true.
+    """
+    protocol_version = 'HTTP/1.1'
+    reply = DEFAULT_REPLY
+    first_token_delay = 0.2
+    token_delay = 0.02
+    # Requests accepted per second (0 for no limit) and fraction answered with a 503
+    rate_limit = 0
+    error_rate = 0.0
+    _window_lock = threading.Lock()
+    _window = [0, 0]  # [second, requests accepted in it]
+
+    def log_message(self, format, *args):
+        pass
+
+    def _over_rate_limit(self):
+        if not self.rate_limit:
+            return False
+        second = int(time.monotonic())
+        with self._window_lock:
+            if self._window[0] != second:
+                self._window[:] = [second, 0]
+            if self._window[1] >= self.rate_limit:
+                return True
+            self._window[1] += 1
+        return False
+
+    def _send_empty(self, status, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if self._over_rate_limit():
+            self._send_empty(429, [('Retry-After', '1')])
+            return
+        if self.error_rate and random.random() < self.error_rate:
+            self._send_empty(503)
+            return
+        model = body.get('model', 'stub')
+        words = self.reply.split(' ')
+
+        if not body.get('stream'):
+            time.sleep(self.first_token_delay + self.token_delay * len(words))
+            payload = json.dumps({
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion',
+                'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': self.reply},
+                             'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': len(words), 'total_tokens': len(words)},
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        time.sleep(self.first_token_delay)
+        try:
+            for index, word in enumerate(words):
+                delta = word if index == 0 else ' ' + word
+                chunk = {'id': 'chatcmpl-stub', 'object': 'chat.completion.chunk', 'model': model,
+                         'choices': [{'index': 0, 'delta': {'content': delta}, 'finish_reason': None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(self.token_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The caller cancelled the request
+            pass
+
+
+def make_server(host='127.0.0.1', port=8001, first_token_delay=0.2, token_delay=0.02, reply=DEFAULT_REPLY,
+                rate_limit=0, error_rate=0.0):
+    """
+    Creates (but does not start) a stub server with the given timings and failure modes.
+    """
+    handler = type('ConfiguredStubLLMHandler', (StubLLMHandler,), {
+        'first_token_delay': first_token_delay,
+        'token_delay': token_delay,
+        'reply': reply,
+        'rate_limit': rate_limit,
+        'error_rate': error_rate,
+        '_window_lock': threading.Lock(),
+        '_window': [0, 0],
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible stub for offline testing.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--first-token-delay', type=float, default=0.2, help="Seconds before the first token.")
+    parser.add_argument('--token-delay', type=float, default=0.02, help="Seconds between streamed tokens.")
+    parser.add_argument('--rate-limit', type=int, default=0,
+                        help="Requests accepted per second; the rest get a 429 (0 for no limit).")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with a 503.")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.first_token_delay, args.token_delay,
+                         rate_limit=args.rate_limit, error_rate=args.error_rate)
+    print(f"Stub LLM listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
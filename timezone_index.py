@@ -0,0 +1,326 @@
+# timezone_index.py
+"""
+Offline time zone lookup for birth coordinates.
+
+The globe is divided into a grid of RESOLUTION-degree cells, each holding the id of an
+IANA time zone, stored as a uint16 array that is memory-mapped on load. A lookup is two
+multiplications and an array read, and the pytz zone objects are created once per zone
+and kept. Zones (not fixed offsets) are stored, so historical offsets and daylight
+saving time of old birth dates come from the tz database when the time is localized.
+
+The grid is compiled from:
+- time zone boundary polygons, when a GeoJSON file such as timezone-boundary-builder's
+  `combined-with-oceans.json` is given (each cell takes the zone containing its centre);
+- the cities of the bundled GeoNames dump (see gazetteer.py), whose last column is the
+  city's time zone: every cell holding a city takes the zone of the most populous one,
+  and the zones then grow outwards into empty cells for up to MAX_CITY_DISTANCE degrees;
+- nautical zones (Etc/GMT-5 and so on, by longitude) for cells still empty, that is
+  open sea and uninhabited land far from any city.
+Without boundary polygons, borders between zones are only as precise as the spacing of
+the cities on either side of them.
+
+Build the index with:
+    python timezone_index.py --boundaries combined-with-oceans.json
+It is also built automatically (from the cities only, unless KUNDALI_TIMEZONE_BOUNDARIES
+names a GeoJSON file) on first use, and rebuilt when its sources change.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pytz
+
+from gazetteer import DATA_DIR, DEFAULT_DUMP_PATH, COL_LATITUDE, COL_LONGITUDE, COL_POPULATION, _open_text
+from gazetteer import _index_lock, _pack_strings, _PackedStrings, _save_array, _save_json
+
+DEFAULT_INDEX_DIR = os.environ.get('KUNDALI_TIMEZONE_INDEX', os.path.join(DATA_DIR, 'timezone_index'))
+DEFAULT_BOUNDARIES_PATH = os.environ.get('KUNDALI_TIMEZONE_BOUNDARIES')
+RESOLUTION = float(os.environ.get('KUNDALI_TIMEZONE_RESOLUTION', '0.25'))
+
+# Column of the GeoNames "geoname" table with the IANA time zone
+COL_TIMEZONE = 17
+
+# How far (in degrees) a city's zone is extended into cells without a city
+MAX_CITY_DISTANCE = 8.0
+
+# Zone id 0 marks a cell that has not been assigned yet while building
+UNASSIGNED = 0
+
+
+def nautical_zone(longitude):
+    """
+    The Etc/GMT zone of a longitude; note the inverted sign (Etc/GMT-5 is UTC+05:00).
+    """
+    offset = int(round(longitude / 15.0))
+    return 'Etc/GMT' if offset == 0 else f"Etc/GMT{-offset:+d}"
+
+
+def sources_digest(dump_path, boundaries_path=None):
+    digest = hashlib.sha256()
+    for path in (dump_path, boundaries_path):
+        if path:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+def _cell_centres(count, start, resolution):
+    return start + (np.arange(count) + 0.5) * resolution
+
+
+def _polygon_edges(rings):
+    """
+    Returns the edges of a polygon's rings as an (edges, 4) array of x1, y1, x2, y2.
+    """
+    edges = []
+    for ring in rings:
+        points = np.asarray(ring, dtype=np.float64)[:, :2]
+        if len(points) > 1:
+            edges.append(np.hstack([points[:-1], points[1:]]))
+    return np.vstack(edges) if edges else np.empty((0, 4))
+
+
+def _rasterize_polygon(grid, rings, zone_id, resolution):
+    """
+    Assigns zone_id to the cells whose centres lie inside a polygon (exterior ring plus
+    holes, by the even-odd rule), one scanline per grid row.
+    """
+    edges = _polygon_edges(rings)
+    if not len(edges):
+        return
+    rows, cols = grid.shape
+    x1, y1, x2, y2 = edges.T
+    first_row = max(int((min(y1.min(), y2.min()) + 90.0) / resolution), 0)
+    last_row = min(int((max(y1.max(), y2.max()) + 90.0) / resolution), rows - 1)
+    lon_centres = _cell_centres(cols, -180.0, resolution)
+    for row in range(first_row, last_row + 1):
+        latitude = -90.0 + (row + 0.5) * resolution
+        crossing = (y1 <= latitude) != (y2 <= latitude)
+        if not crossing.any():
+            continue
+        xs = np.sort(x1[crossing] + (latitude - y1[crossing]) * (x2[crossing] - x1[crossing])
+                     / (y2[crossing] - y1[crossing]))
+        for west, east in zip(xs[0::2], xs[1::2]):
+            start, end = np.searchsorted(lon_centres, [west, east])
+            grid[row, start:end] = zone_id
+
+
+def _load_boundaries(boundaries_path):
+    """
+    Yields (zone name, [polygon rings, ...]) from a GeoJSON FeatureCollection with a
+    'tzid' property per feature.
+    """
+    with open(boundaries_path, encoding='utf-8') as f:
+        collection = json.load(f)
+    for feature in collection['features']:
+        geometry = feature['geometry']
+        polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+        yield feature['properties']['tzid'], polygons
+
+
+def _load_cities(dump_path):
+    """
+    Returns (latitudes, longitudes, populations, zone names) of the dump's cities with
+    a zone known to pytz.
+    """
+    known_zones = pytz.all_timezones_set
+    latitudes, longitudes, populations, zones = [], [], [], []
+    with _open_text(dump_path) as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) <= COL_TIMEZONE or fields[COL_TIMEZONE] not in known_zones:
+                continue
+            latitudes.append(float(fields[COL_LATITUDE]))
+            longitudes.append(float(fields[COL_LONGITUDE]))
+            populations.append(int(fields[COL_POPULATION] or 0))
+            zones.append(fields[COL_TIMEZONE])
+    return np.array(latitudes), np.array(longitudes), np.array(populations), zones
+
+
+def _grow(grid, steps):
+    """
+    Extends assigned cells into unassigned neighbours (8-connected, wrapping around in
+    longitude) for up to `steps` rounds.
+    """
+    rows = grid.shape[0]
+    for _ in range(steps):
+        if not (grid == UNASSIGNED).any():
+            return
+        # One empty row above and below, so the poles do not wrap
+        padded = np.zeros((rows + 2, grid.shape[1]), dtype=grid.dtype)
+        padded[1:-1] = grid
+        grown = grid.copy()
+        for row_shift in (-1, 0, 1):
+            for col_shift in (-1, 0, 1):
+                if row_shift == col_shift == 0:
+                    continue
+                neighbour = np.roll(padded[1 + row_shift:1 + row_shift + rows], col_shift, axis=1)
+                take = (grown == UNASSIGNED) & (neighbour != UNASSIGNED)
+                grown[take] = neighbour[take]
+        if np.array_equal(grown, grid):
+            return
+        grid[:] = grown
+
+
+def build_timezone_index(dump_path=DEFAULT_DUMP_PATH, index_dir=DEFAULT_INDEX_DIR, resolution=RESOLUTION,
+                         boundaries_path=DEFAULT_BOUNDARIES_PATH):
+    """
+    Compiles the time zone grid read by `TimezoneIndex`.
+
+    Parameters:
+        dump_path (str): GeoNames-style dump with a time zone column (optionally gzipped).
+        index_dir (str): Directory to write the index into.
+        resolution (float): Cell size in degrees.
+        boundaries_path (str): Optional GeoJSON of time zone boundary polygons.
+
+    Returns:
+        dict: The index metadata.
+    """
+    rows, cols = int(round(180.0 / resolution)), int(round(360.0 / resolution))
+    grid = np.zeros((rows, cols), dtype=np.uint16)
+    zone_names = [None]
+    zone_ids = {}
+
+    def zone_id(name):
+        if name not in zone_ids:
+            zone_ids[name] = len(zone_names)
+            zone_names.append(name)
+        return zone_ids[name]
+
+    if boundaries_path:
+        for name, polygons in _load_boundaries(boundaries_path):
+            if name not in pytz.all_timezones_set:
+                continue
+            for rings in polygons:
+                _rasterize_polygon(grid, rings, zone_id(name), resolution)
+
+    latitudes, longitudes, populations, zones = _load_cities(dump_path)
+    city_rows = np.clip(((latitudes + 90.0) / resolution).astype(np.int64), 0, rows - 1)
+    city_cols = np.clip(((longitudes + 180.0) / resolution).astype(np.int64), 0, cols - 1)
+    city_zones = np.array([zone_id(name) for name in zones], dtype=np.uint16)
+    # The most populous city of each cell comes first and wins
+    order = np.lexsort((-populations, city_rows * cols + city_cols))
+    cells, first = np.unique((city_rows * cols + city_cols)[order], return_index=True)
+    seeds = grid.ravel()[cells] == UNASSIGNED
+    grid.ravel()[cells[seeds]] = city_zones[order[first[seeds]]]
+    _grow(grid, int(round(MAX_CITY_DISTANCE / resolution)))
+
+    # Nautical zones by column for whatever is left
+    lon_centres = _cell_centres(cols, -180.0, resolution)
+    nautical = np.array([zone_id(nautical_zone(longitude)) for longitude in lon_centres], dtype=np.uint16)
+    empty = grid == UNASSIGNED
+    grid[empty] = np.broadcast_to(nautical, grid.shape)[empty]
+
+    os.makedirs(index_dir, exist_ok=True)
+    names_blob, names_offsets = _pack_strings([name or '' for name in zone_names])
+    _save_array(os.path.join(index_dir, 'grid.npy'), grid)
+    _save_array(os.path.join(index_dir, 'zones.npy'), names_blob)
+    _save_array(os.path.join(index_dir, 'zone_offsets.npy'), names_offsets)
+    meta = {
+        'sources_sha256': sources_digest(dump_path, boundaries_path),
+        'boundaries': bool(boundaries_path),
+        'resolution': resolution,
+        'zones': len(zone_names) - 1,
+        'cities': len(zones),
+    }
+    # Written last: a meta.json with the current digest means the arrays are complete
+    _save_json(os.path.join(index_dir, 'meta.json'), meta)
+    return meta
+
+
+class TimezoneIndex:
+    """
+    Memory-mapped time zone grid built by `build_timezone_index`.
+    """
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR):
+        with open(os.path.join(index_dir, 'meta.json')) as f:
+            self.meta = json.load(f)
+        self.resolution = self.meta['resolution']
+        self.grid = np.load(os.path.join(index_dir, 'grid.npy'), mmap_mode='r')
+        self.rows, self.cols = self.grid.shape
+        names = _PackedStrings(np.load(os.path.join(index_dir, 'zones.npy'), mmap_mode='r'),
+                               np.load(os.path.join(index_dir, 'zone_offsets.npy'), mmap_mode='r'))
+        self.zone_names = [names[i] for i in range(len(names))]
+        # pytz zones by id, created on first use
+        self._zones = [None] * len(self.zone_names)
+
+    def preload(self):
+        """
+        Creates the pytz zone of every id up front, so no lookup has to load one.
+        """
+        for zone_id in range(1, len(self.zone_names)):
+            if self._zones[zone_id] is None:
+                self._zones[zone_id] = pytz.timezone(self.zone_names[zone_id])
+
+    def zone_id(self, latitude, longitude):
+        row = min(max(int((latitude + 90.0) / self.resolution), 0), self.rows - 1)
+        col = int((longitude + 180.0) / self.resolution) % self.cols
+        return int(self.grid[row, col])
+
+    def zone_name_at(self, latitude, longitude):
+        """
+        Returns the IANA name of the time zone at a location, such as 'Asia/Kolkata'.
+        """
+        return self.zone_names[self.zone_id(latitude, longitude)]
+
+    def timezone_at(self, latitude, longitude):
+        """
+        Returns the pytz time zone at a location.
+        """
+        zone_id = self.zone_id(latitude, longitude)
+        zone = self._zones[zone_id]
+        if zone is None:
+            zone = self._zones[zone_id] = pytz.timezone(self.zone_names[zone_id])
+        return zone
+
+
+_timezone_index = None
+
+
+def get_timezone_index():
+    """
+    Returns the shared TimezoneIndex, (re)compiling it first if it is missing, was built
+    at another resolution or its sources have changed. serve.py builds it in the master
+    (see warmup.py) before forking; the index directory's lock covers processes that
+    start cold, so only one of them builds the grid and the rest load it.
+    """
+    global _timezone_index
+    if _timezone_index is None:
+        with _index_lock(DEFAULT_INDEX_DIR):
+            meta_path = os.path.join(DEFAULT_INDEX_DIR, 'meta.json')
+            stale = True
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                stale = (meta.get('resolution') != RESOLUTION
+                         or meta.get('sources_sha256') != sources_digest(DEFAULT_DUMP_PATH, DEFAULT_BOUNDARIES_PATH))
+            if stale:
+                build_timezone_index()
+            _timezone_index = TimezoneIndex()
+    return _timezone_index
+
+
+def timezone_at(latitude, longitude):
+    """
+    Returns the pytz time zone at a location, from the shared index.
+    """
+    return get_timezone_index().timezone_at(latitude, longitude)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compile the offline time zone grid.")
+    parser.add_argument('--dump', default=DEFAULT_DUMP_PATH, help="GeoNames geoname table (.txt or .txt.gz).")
+    parser.add_argument('--boundaries', default=DEFAULT_BOUNDARIES_PATH,
+                        help="GeoJSON of time zone boundary polygons with a 'tzid' property.")
+    parser.add_argument('--resolution', type=float, default=RESOLUTION, help="Cell size in degrees.")
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR, help="Output directory for the index.")
+    args = parser.parse_args()
+
+    with _index_lock(args.index_dir):
+        meta = build_timezone_index(args.dump, args.index_dir, args.resolution, args.boundaries)
+    print(f"Indexed {meta['zones']} time zones from {meta['cities']} cities"
+          f"{' and boundary polygons' if meta['boundaries'] else ''} into {args.index_dir}")
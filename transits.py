@@ -0,0 +1,310 @@
+# transits.py
+"""
+Transit events over any time range: sign ingresses, nakshatra changes, retrograde and
+direct stations, and transits of the grahas over natal positions.
+
+Each graha's sidereal longitude is sampled on a grid whose step is short compared with
+the time it needs to cross a nakshatra (half a day for the Moon, days for the outer
+planets). Steps where the unwrapped longitude changes boundary, or where the motion
+changes direction, bracket exactly one event, and all brackets are then refined
+together by vectorized bisection to TIME_TOLERANCE_SECONDS. Longitudes come from the
+Chebyshev tables in ephemeris_tables.py when they cover the range, so a whole scan is
+a few dozen NumPy evaluations rather than one ephemeris call per day.
+
+The range is scanned in chunks of CHUNK_DAYS and `scan_transits` yields the events of
+each chunk in time order, so callers that only need the next few events stop early.
+
+A retrograde loop that crosses a boundary and back within one grid step is missed;
+with the steps in STEP_DAYS that only happens when a station falls within minutes of
+the boundary.
+"""
+
+import argparse
+import itertools
+import os
+import time
+
+import numpy as np
+import swisseph as swe
+
+from dasha_timeline import jd_to_datetime
+from ephemeris_tables import GRAHAS, get_ephemeris_tables
+from kundali_calculations import AYANAMSA, sign_name
+
+NAKSHATRAS = [
+    'Ashwini', 'Bharani', 'Krittika', 'Rohini', 'Mrigashira', 'Ardra', 'Punarvasu', 'Pushya', 'Ashlesha',
+    'Magha', 'Purva Phalguni', 'Uttara Phalguni', 'Hasta', 'Chitra', 'Swati', 'Vishakha', 'Anuradha',
+    'Jyeshtha', 'Mula', 'Purva Ashadha', 'Uttara Ashadha', 'Shravana', 'Dhanishta', 'Shatabhisha',
+    'Purva Bhadrapada', 'Uttara Bhadrapada', 'Revati',
+]
+NAKSHATRA_SPAN = 360.0 / 27.0
+EVENT_TYPES = ['sign_ingress', 'nakshatra_change', 'station_retrograde', 'station_direct', 'natal_transit']
+
+# Sampling step per graha, in days
+STEP_DAYS = {
+    'Sun': 4.0, 'Moon': 0.5, 'Mars': 2.0, 'Mercury': 1.0, 'Jupiter': 4.0,
+    'Venus': 1.0, 'Saturn': 4.0, 'Rahu': 2.0, 'Ketu': 2.0,
+}
+# The Sun and Moon never station, and the nodes' wobble is not reported as stations
+STATION_PLANETS = ['Mars', 'Mercury', 'Jupiter', 'Venus', 'Saturn']
+SWISSEPH_CODES = {
+    'Sun': swe.SUN, 'Moon': swe.MOON, 'Mars': swe.MARS, 'Mercury': swe.MERCURY,
+    'Jupiter': swe.JUPITER, 'Venus': swe.VENUS, 'Saturn': swe.SATURN, 'Rahu': swe.TRUE_NODE,
+}
+TIME_TOLERANCE_SECONDS = 1.0
+# 'tables' uses the ephemeris tables where they cover the range; 'swisseph' never does
+TRANSIT_BACKEND = os.environ.get('KUNDALI_TRANSIT_BACKEND', 'tables')
+SPEED_DELTA_DAYS = 0.01
+CHUNK_DAYS = 3652.5
+# Most events returned by one /transits request
+MAX_EVENTS = int(os.environ.get('KUNDALI_TRANSIT_MAX_EVENTS', '10000'))
+
+
+def swisseph_longitudes(planet, jds):
+    """
+    Sidereal longitudes of one graha from Swiss Ephemeris, one call per Julian Day.
+    """
+    if planet == 'Ketu':
+        return (swisseph_longitudes('Rahu', jds) + 180.0) % 360.0
+    swe.set_sid_mode(AYANAMSA)
+    body = SWISSEPH_CODES[planet]
+    return np.fromiter((swe.calc_ut(float(jd), body, swe.FLG_SIDEREAL)[0][0] for jd in np.ravel(jds)),
+                       dtype=np.float64, count=np.size(jds)).reshape(np.shape(jds))
+
+
+def get_longitude_source(start_jd, end_jd):
+    """
+    Returns a function (planet, jds) -> sidereal longitudes for the range: the ephemeris
+    tables when they are built for this ayanamsa and cover it, otherwise Swiss Ephemeris.
+    """
+    if TRANSIT_BACKEND == 'tables':
+        try:
+            tables = get_ephemeris_tables()
+        except ValueError:
+            tables = None
+        margin = max(STEP_DAYS.values()) * 2
+        if tables is not None and tables.ayanamsa == AYANAMSA and tables.covers([start_jd - margin, end_jd + margin]):
+            return tables.longitudes
+    return swisseph_longitudes
+
+
+def _wrap(degrees):
+    """
+    Wraps angle differences into [-180, 180).
+    """
+    return (degrees + 180.0) % 360.0 - 180.0
+
+
+def _bisect(function, low, high, iterations):
+    """
+    Refines all brackets [low, high] at once to a root of the vectorized function.
+    """
+    value_low = function(low)
+    for _ in range(iterations):
+        middle = (low + high) / 2.0
+        value_middle = function(middle)
+        same_side = np.signbit(value_middle) == np.signbit(value_low)
+        low = np.where(same_side, middle, low)
+        value_low = np.where(same_side, value_middle, value_low)
+        high = np.where(same_side, high, middle)
+    return (low + high) / 2.0
+
+
+def _iterations(step_days):
+    return int(np.ceil(np.log2(step_days * 86400.0 / TIME_TOLERANCE_SECONDS)))
+
+
+def _crossings(longitudes, times, unwrapped, width, offsets, step_days):
+    """
+    Finds when the longitude crosses offset + k * width for each offset.
+
+    Returns:
+        tuple: (times, boundary index, offset index, retrograde flags) of the crossings.
+    """
+    found_times, found_boundaries, found_offsets, found_retrograde = [], [], [], []
+    for offset_index, offset in enumerate(offsets):
+        sector = np.floor((unwrapped - offset) / width)
+        steps = np.flatnonzero(sector[1:] != sector[:-1])
+        if not len(steps):
+            continue
+        boundary_sector = np.maximum(sector[steps], sector[steps + 1])
+        boundary = offset + boundary_sector * width
+        retrograde = sector[steps + 1] < sector[steps]
+        roots = _bisect(lambda t: _wrap(longitudes(t) - boundary), times[steps], times[steps + 1],
+                        _iterations(step_days))
+        found_times.append(roots)
+        found_boundaries.append(np.mod(boundary_sector, round(360.0 / width)).astype(np.int64))
+        found_offsets.append(np.full(len(roots), offset_index))
+        found_retrograde.append(retrograde)
+    if not found_times:
+        empty = np.zeros(0)
+        return empty, empty.astype(np.int64), empty.astype(np.int64), empty.astype(bool)
+    return (np.concatenate(found_times), np.concatenate(found_boundaries), np.concatenate(found_offsets),
+            np.concatenate(found_retrograde))
+
+
+def _stations(longitudes, times, unwrapped, step_days):
+    """
+    Finds where the motion changes direction.
+
+    Returns:
+        tuple: (times, retrograde flags) of the stations; True for a retrograde station.
+    """
+    motion = np.diff(unwrapped)
+    turns = np.flatnonzero(np.signbit(motion[1:]) != np.signbit(motion[:-1])) + 1
+    if not len(turns):
+        return np.zeros(0), np.zeros(0, dtype=bool)
+
+    def speed(t):
+        return _wrap(longitudes(t + SPEED_DELTA_DAYS) - longitudes(t - SPEED_DELTA_DAYS))
+
+    low, high = times[turns - 1], times[turns + 1]
+    bracketed = np.signbit(speed(low)) != np.signbit(speed(high))
+    roots = np.where(bracketed, _bisect(speed, low, high, _iterations(2 * step_days)), times[turns])
+    return roots, motion[turns] < 0
+
+
+def _scan_chunk(longitude_source, start_jd, end_jd, planets, event_types, natal_positions):
+    """
+    Returns the events in [start_jd, end_jd) for the given grahas, in time order.
+    """
+    natal_names = list(natal_positions)
+    natal_offsets = [natal_positions[name] % 360.0 for name in natal_names]
+    columns = []  # (times, type index, planet, detail, retrograde)
+
+    for planet in planets:
+        step_days = STEP_DAYS[planet]
+        # One step of padding on each side so events at the chunk edges are bracketed
+        times = np.arange(start_jd - step_days, end_jd + 2 * step_days, step_days)
+        def longitudes(t, planet=planet):
+            return longitude_source(planet, t)
+        unwrapped = np.unwrap(longitudes(times), period=360.0)
+
+        families = [
+            ('sign_ingress', 30.0, [0.0]),
+            ('nakshatra_change', NAKSHATRA_SPAN, [0.0]),
+            ('natal_transit', 360.0, natal_offsets),
+        ]
+        for event_type, width, offsets in families:
+            if event_type not in event_types or not offsets:
+                continue
+            found, boundaries, offset_indices, retrograde = _crossings(
+                longitudes, times, unwrapped, width, offsets, step_days
+            )
+            detail = offset_indices if event_type == 'natal_transit' else boundaries
+            columns.append((found, EVENT_TYPES.index(event_type), planet, detail, retrograde))
+
+        if planet in STATION_PLANETS and {'station_retrograde', 'station_direct'} & set(event_types):
+            found, retrograde = _stations(longitudes, times, unwrapped, step_days)
+            for event_type, flags in [('station_retrograde', retrograde), ('station_direct', ~retrograde)]:
+                if event_type in event_types:
+                    columns.append((found[flags], EVENT_TYPES.index(event_type), planet,
+                                    np.zeros(int(flags.sum()), dtype=np.int64), flags[flags]))
+
+    events = []
+    for found, type_index, planet, detail, retrograde in columns:
+        keep = (found >= start_jd) & (found < end_jd)
+        for jd, value, is_retrograde in zip(found[keep].tolist(), detail[keep].tolist(), retrograde[keep].tolist()):
+            events.append((jd, type_index, planet, value, is_retrograde))
+    events.sort()
+
+    for jd, type_index, planet, value, is_retrograde in events:
+        event_type = EVENT_TYPES[type_index]
+        event = {
+            'type': event_type,
+            'planet': planet,
+            'jd': jd,
+            'time': jd_to_datetime(jd).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        }
+        if event_type == 'sign_ingress':
+            # Moving backwards, the planet enters the sign below the boundary
+            entered = (value - 1) % 12 if is_retrograde else value
+            event['sign'] = sign_name(entered + 1)
+            event['retrograde'] = is_retrograde
+        elif event_type == 'nakshatra_change':
+            entered = (value - 1) % 27 if is_retrograde else value
+            event['nakshatra'] = NAKSHATRAS[entered]
+            event['retrograde'] = is_retrograde
+        elif event_type == 'natal_transit':
+            event['natal_planet'] = natal_names[value]
+            event['retrograde'] = is_retrograde
+        else:
+            longitude = float(longitude_source(planet, np.array([jd]))[0])
+            event['sign'] = sign_name(int(longitude // 30) + 1)
+            event['longitude'] = longitude
+        yield event
+
+
+def scan_transits(start_jd, end_jd, planets=None, event_types=None, natal_positions=None):
+    """
+    Yields transit events between two Julian Days (UT) in time order.
+
+    Parameters:
+        start_jd (float): Start of the range.
+        end_jd (float): End of the range (exclusive).
+        planets (list): Grahas to scan (all nine by default).
+        event_types (list): Subset of EVENT_TYPES (all by default).
+        natal_positions (dict): Natal planet name to sidereal longitude, for
+            'natal_transit' events (for example a report's 'planetary_positions').
+
+    Yields:
+        dict: 'type', 'planet', 'jd' and 'time' (UTC), plus 'sign', 'nakshatra',
+            'natal_planet', 'retrograde' or 'longitude' depending on the type.
+    """
+    planets = list(planets or GRAHAS)
+    event_types = list(event_types or EVENT_TYPES)
+    for name in planets:
+        if name not in STEP_DAYS:
+            raise ValueError(f"Unknown planet: {name}")
+    for name in event_types:
+        if name not in EVENT_TYPES:
+            raise ValueError(f"Unknown transit event type: {name}")
+
+    chunk_start = start_jd
+    while chunk_start < end_jd:
+        chunk_end = min(chunk_start + CHUNK_DAYS, end_jd)
+        # Chosen per chunk, so only the parts of a range outside the tables use Swiss Ephemeris
+        longitude_source = get_longitude_source(chunk_start, chunk_end)
+        yield from _scan_chunk(longitude_source, chunk_start, chunk_end, planets, event_types, natal_positions or {})
+        chunk_start = chunk_end
+
+
+def date_to_jd(date):
+    """
+    Converts a 'YYYY-MM-DD' date (midnight UTC) to a Julian Day.
+    """
+    try:
+        year, month, day = (int(part) for part in date.split('-'))
+    except ValueError:
+        raise ValueError("Incorrect date format. Expected YYYY-MM-DD.")
+    return swe.julday(year, month, day, 0.0)
+
+
+def find_transits(start_date, end_date, planets=None, event_types=None, natal_positions=None, limit=MAX_EVENTS):
+    """
+    Collects the first limit transit events between two 'YYYY-MM-DD' dates (UTC).
+    Scanning stops as soon as limit is exceeded.
+
+    Returns:
+        dict: 'events' and 'truncated' (True if the range has more than limit events).
+    """
+    events = list(itertools.islice(
+        scan_transits(date_to_jd(start_date), date_to_jd(end_date), planets, event_types, natal_positions), limit + 1
+    ))
+    return {'events': events[:limit], 'truncated': len(events) > limit}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scan transit events and report how long the scan takes.")
+    parser.add_argument('--start', default='2000-01-01', help="Start date (YYYY-MM-DD, UTC).")
+    parser.add_argument('--end', default='2100-01-01', help="End date (YYYY-MM-DD, UTC).")
+    parser.add_argument('--show', type=int, default=10, help="Number of events to print.")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    events = list(scan_transits(date_to_jd(args.start), date_to_jd(args.end)))
+    elapsed = time.perf_counter() - started
+    for event in events[:args.show]:
+        print(event)
+    counts = {event_type: sum(1 for event in events if event['type'] == event_type) for event_type in EVENT_TYPES}
+    print(f"{len(events)} events in {elapsed:.3f}s: {counts}")
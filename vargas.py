@@ -0,0 +1,153 @@
+# vargas.py
+"""
+Divisional charts (vargas) for any number of charts in one vectorized pass.
+
+Each varga Dn splits every sign into n parts and maps (sign, part) to a sign by the
+Parashari rules; D30 (Trimsamsa) has unequal parts, all on whole degrees, so it is
+stored as 30 one-degree parts. The (12 x parts) tables of all vargas are flattened
+into one lookup array, so the signs of every planet in every requested varga come
+from a single gather over an index array of shape (charts, bodies, vargas).
+
+Signs are numbered 1 (Aries) to 12 (Pisces), as in `kundali_calculations.sign_name`,
+and houses are whole sign houses counted from the ascendant's sign in the same varga.
+"""
+
+import numpy as np
+
+SIGN_NAMES = ['Aries', 'Taurus', 'Gemini', 'Cancer', 'Leo', 'Virgo',
+              'Libra', 'Scorpio', 'Sagittarius', 'Capricorn', 'Aquarius', 'Pisces']
+
+# Vargas by name: number of divisions per sign
+VARGA_DIVISIONS = {
+    'D1': 1, 'D2': 2, 'D3': 3, 'D4': 4, 'D7': 7, 'D9': 9, 'D10': 10, 'D12': 12,
+    'D16': 16, 'D20': 20, 'D24': 24, 'D27': 27, 'D30': 30, 'D40': 40, 'D45': 45, 'D60': 60,
+}
+DEFAULT_VARGAS = ['D1', 'D2', 'D3', 'D4', 'D7', 'D9', 'D10', 'D12']
+
+# Trimsamsa lords' signs (0-based) for each degree of odd and even signs
+_TRIMSAMSA_ODD = [0] * 5 + [10] * 5 + [8] * 8 + [2] * 7 + [6] * 5
+_TRIMSAMSA_EVEN = [1] * 5 + [5] * 7 + [11] * 8 + [9] * 5 + [7] * 5
+
+
+def _first_sign(name, sign):
+    """
+    The (0-based) sign the first part of a 0-based sign maps to.
+    """
+    odd = sign % 2 == 0  # Aries, index 0, is an odd sign
+    modality = sign % 3  # 0 movable, 1 fixed, 2 dual
+    if name in ('D1', 'D3', 'D4', 'D12', 'D60'):
+        return sign
+    if name in ('D9', 'D27'):
+        # Continuous from Aries: the parts of consecutive signs follow on
+        return sign * VARGA_DIVISIONS[name] % 12
+    if name == 'D7':
+        return sign if odd else (sign + 6) % 12
+    if name == 'D10':
+        return sign if odd else (sign + 8) % 12
+    if name in ('D16', 'D45'):
+        return [0, 4, 8][modality]
+    if name == 'D20':
+        return [0, 8, 4][modality]
+    if name == 'D24':
+        return 4 if odd else 3
+    if name == 'D40':
+        return 0 if odd else 6
+    raise ValueError(f"Unknown varga: {name}")
+
+
+def _varga_table(name):
+    """
+    Returns the (12, divisions) table of 0-based varga signs.
+    """
+    divisions = VARGA_DIVISIONS[name]
+    table = np.empty((12, divisions), dtype=np.int8)
+    for sign in range(12):
+        odd = sign % 2 == 0
+        if name == 'D2':
+            # Hora: odd signs Leo then Cancer, even signs Cancer then Leo
+            table[sign] = [4, 3] if odd else [3, 4]
+        elif name == 'D30':
+            table[sign] = _TRIMSAMSA_ODD if odd else _TRIMSAMSA_EVEN
+        else:
+            # Drekkana and Chaturthamsa step through the trines and kendras
+            step = {'D3': 4, 'D4': 3}.get(name, 1)
+            table[sign] = (_first_sign(name, sign) + step * np.arange(divisions)) % 12
+    return table
+
+
+_TABLES = {name: _varga_table(name) for name in VARGA_DIVISIONS}
+_FLAT_TABLE = np.concatenate([_TABLES[name].ravel() for name in VARGA_DIVISIONS])
+_TABLE_OFFSETS = dict(zip(VARGA_DIVISIONS, np.cumsum([0] + [12 * n for n in VARGA_DIVISIONS.values()])[:-1]))
+
+
+def normalize_vargas(vargas):
+    """
+    Returns a list of varga names, in VARGA_DIVISIONS order, from True (DEFAULT_VARGAS),
+    a list of names such as 'D9' or 'd9', or the same as a comma-separated string (as in
+    query parameters). Raises ValueError for unknown vargas.
+    """
+    if vargas is True:
+        return list(DEFAULT_VARGAS)
+    if isinstance(vargas, str):
+        vargas = [name for name in vargas.split(',') if name.strip()]
+    names = {str(name).strip().upper() for name in vargas}
+    for name in names:
+        if name not in VARGA_DIVISIONS:
+            raise ValueError(f"Unknown varga: {name}. Supported: {', '.join(VARGA_DIVISIONS)}")
+    return [name for name in VARGA_DIVISIONS if name in names]
+
+
+def varga_signs(longitudes, vargas=DEFAULT_VARGAS):
+    """
+    Varga signs for an array of sidereal longitudes.
+
+    Parameters:
+        longitudes (array-like): Longitudes in degrees, any shape.
+        vargas (list): Varga names.
+
+    Returns:
+        numpy.ndarray: int8 signs (1 to 12), of shape longitudes.shape + (len(vargas),).
+    """
+    longitudes = np.asarray(longitudes, dtype=np.float64) % 360.0
+    divisions = np.array([VARGA_DIVISIONS[name] for name in vargas], dtype=np.int64)
+    offsets = np.array([_TABLE_OFFSETS[name] for name in vargas], dtype=np.int64)
+
+    sign = (longitudes // 30.0).astype(np.int64)[..., None]
+    part = ((longitudes % 30.0)[..., None] * divisions / 30.0).astype(np.int64)
+    part = np.minimum(part, divisions - 1)  # Guard against rounding up at 30 degrees
+    return _FLAT_TABLE[offsets + sign * divisions + part] + 1
+
+
+def calculate_vargas(positions, ascendants, vargas=DEFAULT_VARGAS):
+    """
+    Varga signs and houses for many charts at once.
+
+    Parameters:
+        positions (array-like): Planet longitudes, shape (charts, planets).
+        ascendants (array-like): Ascendant longitudes, shape (charts,).
+        vargas (list): Varga names.
+
+    Returns:
+        tuple: (planet signs, planet houses, ascendant signs), int8 arrays of shapes
+            (charts, planets, vargas), (charts, planets, vargas) and (charts, vargas).
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    ascendants = np.asarray(ascendants, dtype=np.float64)
+    signs = varga_signs(np.concatenate([positions, ascendants[:, None]], axis=1), vargas)
+    planet_signs, ascendant_signs = signs[:, :-1], signs[:, -1]
+    houses = ((planet_signs - ascendant_signs[:, None, :]) % 12 + 1).astype(np.int8)
+    return planet_signs.astype(np.int8), houses, ascendant_signs.astype(np.int8)
+
+
+def varga_report(planets, planet_signs, houses, ascendant_signs, vargas):
+    """
+    Formats one chart's rows from `calculate_vargas` as
+    {varga: {'Ascendant': {'sign': ...}, planet: {'sign': ..., 'house': ...}}}.
+    """
+    report = {}
+    for column, name in enumerate(vargas):
+        chart = {'Ascendant': {'sign': SIGN_NAMES[ascendant_signs[column] - 1], 'house': 1}}
+        for row, planet in enumerate(planets):
+            chart[planet] = {'sign': SIGN_NAMES[planet_signs[row, column] - 1], 'house': int(houses[row, column])}
+        report[name] = chart
+    return report
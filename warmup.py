@@ -0,0 +1,184 @@
+# warmup.py
+"""
+Start-up warm-up and the process state behind the /healthz and /readyz endpoints.
+
+`warm_up` loads everything a first request would otherwise pay for: the Swiss Ephemeris
+files, the compiled indexes (gazetteer, time zones, interpretations, retrieval), the
+geocode and chart caches, the chatbot module and its tokenizer, and one full chart.
+serve.py runs it in the master process before forking, so the workers start warm and
+share the loaded pages copy-on-write; the apps also run it at start-up when they are
+served on their own.
+
+Readiness (/readyz) is reported once the warm-up has finished in this process (or in
+the master it was forked from) and until the process starts draining; liveness
+(/healthz) only says that the process answers.
+"""
+
+import logging
+import os
+import time
+
+import swisseph as swe
+
+logger = logging.getLogger(__name__)
+
+# Monotonic and wall-clock start of this process (roughly: when this module is imported)
+PROCESS_STARTED = time.perf_counter()
+PROCESS_STARTED_AT = time.time()
+
+# Birth used to exercise the whole calculation path once
+WARMUP_BIRTH = ('1990-05-15', '10:30', 19.0760, 72.8777)
+
+_report = None
+_draining = False
+
+
+def _warm_ephemeris():
+    from calc_executor import EPHEMERIS_PATH, _initialize_worker
+    from kundali_calculations import AYANAMSA, EPHEMERIS_BACKEND, HOUSE_SYSTEM
+
+    # Opens the ephemeris files and reads the pages the first calc_ut needs
+    _initialize_worker(EPHEMERIS_PATH, AYANAMSA)
+    swe.houses_ex(swe.julday(2000, 1, 1, 12.0), WARMUP_BIRTH[2], WARMUP_BIRTH[3], HOUSE_SYSTEM.encode(),
+                  swe.FLG_SIDEREAL)
+    if EPHEMERIS_BACKEND == 'tables':
+        from ephemeris_tables import get_ephemeris_tables
+        get_ephemeris_tables()
+
+
+def _warm_indexes():
+    from gazetteer import get_gazetteer
+    from interpretation_index import get_interpretation_index
+    from timezone_index import get_timezone_index
+
+    get_gazetteer().lookup('Mumbai')
+    get_timezone_index().preload()
+    get_interpretation_index()
+
+
+def _warm_caches():
+    from kundali_calculations import get_chart_cache, get_geocode_cache
+
+    get_geocode_cache()
+    return {'charts_loaded': get_chart_cache().warm()}
+
+
+def _warm_chatbot():
+    from chat_sessions import get_session_store, token_counter_name
+    from kundali_chatbot import get_response_cache
+    from retrieval_index import get_retrieval_index
+
+    get_retrieval_index()
+    get_response_cache()
+    get_session_store()
+    return {'token_counter': token_counter_name()}
+
+
+def _warm_calculation():
+    from interpretation_index import get_interpretation_index
+    from kundali_calculations import calculate_kundali_at
+    from kundali_presentation import build_kundali_response
+    from response_encoding import encode_response
+
+    report = calculate_kundali_at(*WARMUP_BIRTH, vargas=True)
+    response = build_kundali_response(report)
+    response['interpretations'] = get_interpretation_index().match(report)
+    encode_response(response, 'application/json', 'gzip')
+
+
+WARMUP_STEPS = [
+    ('ephemeris', _warm_ephemeris),
+    ('indexes', _warm_indexes),
+    ('caches', _warm_caches),
+    ('chatbot', _warm_chatbot),
+    ('calculation', _warm_calculation),
+]
+
+
+def warm_up(started=None):
+    """
+    Runs every warm-up step once per process (later calls return the first report).
+    A failing step is logged and makes the process report not ready.
+
+    Parameters:
+        started (float): time.perf_counter() value startup is measured from (the import
+            of this module by default).
+
+    Returns:
+        dict: 'ready', 'steps' ({name: {'ms': ..., ...}}), 'warmup_ms' and 'startup_ms'.
+    """
+    global _report
+    if _report is not None:
+        return _report
+    import metrics
+
+    warmup_started = time.perf_counter()
+    steps = {}
+    ready = True
+    for name, step in WARMUP_STEPS:
+        step_started = time.perf_counter()
+        try:
+            details = step() or {}
+        except Exception as e:
+            logger.exception("Warm-up step %s failed", name)
+            details = {'error': str(e)}
+            ready = False
+        steps[name] = dict(details, ms=round((time.perf_counter() - step_started) * 1000.0, 3))
+    finished = time.perf_counter()
+
+    # The warm-up chart is not traffic
+    metrics.registry.reset()
+    _report = {
+        'ready': ready,
+        'steps': steps,
+        'warmup_ms': round((finished - warmup_started) * 1000.0, 3),
+        'startup_ms': round((finished - (PROCESS_STARTED if started is None else started)) * 1000.0, 3),
+    }
+    logger.info("Warm-up finished in %.1f ms (startup %.1f ms): %s", _report['warmup_ms'], _report['startup_ms'],
+                ', '.join(f"{name} {step['ms']:.1f} ms" for name, step in steps.items()))
+    return _report
+
+
+def after_fork():
+    """
+    Called in each worker right after it is forked from a warmed-up master. Swiss
+    Ephemeris file handles share their offsets with the master's, so the files are
+    reopened (from the page cache, so this is cheap), and the worker starts sharing its
+    metrics through the multiprocess directory, if there is one.
+    """
+    import metrics
+    from calc_executor import EPHEMERIS_PATH, _initialize_worker
+    from kundali_calculations import AYANAMSA
+
+    swe.close()
+    _initialize_worker(EPHEMERIS_PATH, AYANAMSA)
+    metrics.start_multiprocess()
+
+
+def mark_draining():
+    """
+    Makes /readyz fail from now on, so load balancers stop routing to this process
+    while it finishes its requests.
+    """
+    global _draining
+    _draining = True
+
+
+def liveness():
+    """
+    Returns the /healthz body.
+    """
+    return {'status': 'ok', 'pid': os.getpid(), 'uptime_s': round(time.time() - PROCESS_STARTED_AT, 3)}
+
+
+def readiness():
+    """
+    Returns (ready, /readyz body).
+    """
+    if _draining:
+        return False, {'status': 'draining', 'pid': os.getpid()}
+    if _report is None:
+        return False, {'status': 'starting', 'pid': os.getpid()}
+    if not _report['ready']:
+        return False, dict(_report, status='failed', pid=os.getpid())
+    return True, dict(_report, status='ready', pid=os.getpid())